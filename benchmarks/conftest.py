@@ -0,0 +1,58 @@
+# Manual labour - a library for step-by-step instructions
+# Copyright (C) 2014 Johannes Reinhardt <jreinhardt@ist-dein-freund.de>
+#
+#  This library is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public
+#  License as published by the Free Software Foundation; either
+#  version 2.1 of the License, or any later version.
+#
+#  This library is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#  Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public
+#  License along with this library; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#  USA
+
+"""
+Configuration for the benchmarks. Baselines are kept in the .benchmarks
+directory next to this file. Once a baseline was saved, every run is
+compared against the latest one and fails for benchmarks that got slower.
+"""
+
+from os import listdir
+from os.path import join, dirname, exists, isdir
+
+import pytest
+from pytest_benchmark.utils import parse_compare_fail
+
+STORAGE = join(dirname(__file__),'.benchmarks')
+
+#Allowed slowdown relative to the baseline before a benchmark fails
+COMPARE_FAIL = 'mean:25%'
+
+def has_baseline(path):
+    """
+    Return whether there is a saved benchmark run below path
+    """
+    if not exists(path):
+        return False
+    for name in listdir(path):
+        if isdir(join(path,name)):
+            if has_baseline(join(path,name)):
+                return True
+        elif name.endswith('.json'):
+            return True
+    return False
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_configure(config):
+    option = config.option
+    if option.benchmark_storage == 'file://./.benchmarks':
+        option.benchmark_storage = 'file://' + STORAGE
+    if not option.benchmark_compare and has_baseline(STORAGE):
+        option.benchmark_compare = True
+    if option.benchmark_compare and not option.benchmark_compare_fail:
+        option.benchmark_compare_fail = [parse_compare_fail(COMPARE_FAIL)]
@@ -0,0 +1,194 @@
+# Manual labour - a library for step-by-step instructions
+# Copyright (C) 2014 Johannes Reinhardt <jreinhardt@ist-dein-freund.de>
+#
+#  This library is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public
+#  License as published by the Free Software Foundation; either
+#  version 2.1 of the License, or any later version.
+#
+#  This library is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#  Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public
+#  License along with this library; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#  USA
+
+"""
+Generators for synthetic stores, graphs and schedules of arbitrary size.
+
+All generators are deterministic, so that timings are comparable between
+runs.
+"""
+
+import os
+import random
+import hashlib
+import base64
+
+import manuallabour.core.common as common
+from manuallabour.core.graph import Graph
+from manuallabour.core.schedule import Schedule
+from manuallabour.core.stores import LocalMemoryStore
+
+#Sizes for benchmarks of operations that scale linearly (or close to it)
+SIZES = [int(s) for s in
+    os.environ.get('ML_BENCH_SIZES','1000,10000,100000').split(',')]
+
+#Sizes for benchmarks of operations that currently scale quadratically or
+#worse and would take too long at the full sizes
+SMALL_SIZES = [int(s) for s in
+    os.environ.get('ML_BENCH_SMALL_SIZES','50,200').split(',')]
+
+def make_id(kind,idx):
+    """
+    Return an id of realistic length, as if it was calculated as checksum
+    """
+    check = hashlib.sha512('%s%d' % (kind,idx))
+    return base64.urlsafe_b64encode(check.digest())[:-2]
+
+def chain_requires(n_steps,_rng):
+    """
+    Each step requires its predecessor.
+    """
+    return [[i-1] if i > 0 else [] for i in range(n_steps)]
+
+def fan_in_requires(n_steps,_rng,width=8):
+    """
+    Assembly tree, where each step combines the results of width other
+    steps. The first step is the final assembly.
+    """
+    return [range(width*i + 1,min(width*(i+1) + 1,n_steps))
+        for i in range(n_steps)]
+
+def random_requires(n_steps,rng,degree=3,window=50):
+    """
+    Random DAG, where each step requires up to degree steps out of the
+    window steps before it.
+    """
+    res = []
+    for i in range(n_steps):
+        cands = range(max(0,i - window),i)
+        res.append(rng.sample(cands,min(degree,len(cands))))
+    return res
+
+SHAPES = {
+    'chain' : chain_requires,
+    'fan_in' : fan_in_requires,
+    'random' : random_requires
+}
+
+def step_data(idx,rng,n_parts,n_tools,n_blobs):
+    """
+    Return the constructor arguments for a step with shared parts, tools and
+    images
+    """
+    parts = {}
+    for j in range(rng.randint(1,3)):
+        parts['p%d' % j] = dict(
+            obj_id=make_id('part',rng.randrange(n_parts)),
+            quantity=rng.randint(1,4),
+            optional=rng.random() < 0.1
+        )
+    return dict(
+        step_id=make_id('step',idx),
+        title='Step %d' % idx,
+        description='Attach {{part(p0)}} using {{tool(t)}}',
+        duration=dict(minutes=rng.randint(1,30)),
+        waiting=dict(minutes=rng.randint(0,10)),
+        parts=parts,
+        tools={'t' : dict(obj_id=make_id('tool',rng.randrange(n_tools)))},
+        results={'r' : dict(obj_id=make_id('result',idx),created=True)},
+        images={'i' : dict(
+            blob_id=make_id('blob',rng.randrange(n_blobs)),
+            extension='.png',
+            alt='Step %d' % idx,
+            sourcefiles=[dict(
+                blob_id=make_id('source',idx % 10),
+                filename='source%d.fcstd' % (idx % 10)
+            )]
+        )}
+    )
+
+_STORES = {}
+
+def get_store(n_steps):
+    """
+    Return a store and step ids as from make_store, but only generate them
+    once per size.
+    """
+    if not n_steps in _STORES:
+        _STORES[n_steps] = make_store(n_steps)
+    return _STORES[n_steps]
+
+def make_store(n_steps,seed=0):
+    """
+    Create a LocalMemoryStore with n_steps steps, that share a pool of parts,
+    tools and images.
+
+    :return: the store and the list of step ids
+    """
+    rng = random.Random(seed)
+    n_parts = max(10,n_steps/10)
+    n_tools = max(5,n_steps/100)
+    n_blobs = max(10,n_steps/20)
+
+    store = LocalMemoryStore()
+    for i in range(n_blobs):
+        store.add_blob(make_id('blob',i),'image%d.png' % i)
+    for i in range(10):
+        store.add_blob(make_id('source',i),'source%d.fcstd' % i)
+    for i in range(n_parts):
+        store.add_obj(common.Object(
+            obj_id=make_id('part',i),
+            name='Part %d' % i,
+            images=[dict(
+                blob_id=make_id('blob',i % n_blobs),
+                extension='.png',
+                alt='Part %d' % i
+            )]
+        ))
+    for i in range(n_tools):
+        store.add_obj(common.Object(obj_id=make_id('tool',i),name='Tool %d' % i))
+
+    step_ids = []
+    for i in range(n_steps):
+        store.add_obj(common.Object(
+            obj_id=make_id('result',i),
+            name='Result %d' % i
+        ))
+        step = common.Step(**step_data(i,rng,n_parts,n_tools,n_blobs))
+        store.add_step(step)
+        step_ids.append(step.step_id)
+    return store, step_ids
+
+def make_graph(shape,step_ids,seed=0):
+    """
+    Create a Graph of the given shape over the steps with step_ids
+    """
+    rng = random.Random(seed)
+    requires = SHAPES[shape](len(step_ids),rng)
+    steps = []
+    for step_id,reqs in zip(step_ids,requires):
+        steps.append(dict(
+            step_id=step_id,
+            requires=[step_ids[j] for j in reqs]
+        ))
+    return Graph(graph_id=make_id('graph',len(steps)),steps=steps)
+
+def make_schedule(step_ids):
+    """
+    Create a timed Schedule with the steps in the given order
+    """
+    steps = []
+    for idx,step_id in enumerate(step_ids):
+        steps.append(dict(
+            step_id=step_id,
+            step_idx=idx,
+            start=dict(minutes=20*idx),
+            stop=dict(minutes=20*idx + 15),
+            waiting=dict(minutes=20*idx + 18)
+        ))
+    return Schedule(sched_id=make_id('schedule',len(steps)),steps=steps)
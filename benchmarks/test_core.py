@@ -0,0 +1,371 @@
+# Manual labour - a library for step-by-step instructions
+# Copyright (C) 2014 Johannes Reinhardt <jreinhardt@ist-dein-freund.de>
+#
+#  This library is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public
+#  License as published by the Free Software Foundation; either
+#  version 2.1 of the License, or any later version.
+#
+#  This library is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#  Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public
+#  License along with this library; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#  USA
+
+"""
+Benchmarks for the construction of components and the algorithms in
+manuallabour.core
+"""
+
+import json
+import os
+import random
+import sys
+from StringIO import StringIO
+
+import pytest
+
+import manuallabour.core.common as common
+from manuallabour.core.blobs import BlobHasher
+from manuallabour.core.diff import diff_schedules
+from manuallabour.core.graph import Graph
+from manuallabour.core.serialize import dump_store, load_store
+from manuallabour.core.search import SearchIndex, tokenize
+from manuallabour.core.stores import LocalMemoryStore
+from manuallabour.core.timing import ScheduleTimes
+from manuallabour.core.schedule import schedule_topological, schedule_greedy,\
+    schedule_parallel, schedule_tools, schedule_min_wip, schedule_optimal
+
+from generators import SIZES, SMALL_SIZES, SHAPES, get_store, make_graph,\
+    make_schedule, make_store, make_id, step_data
+
+@pytest.mark.parametrize("n_steps",SIZES)
+def test_step_init(benchmark,n_steps):
+    rng = random.Random(0)
+    data = [step_data(i,rng,100,10,50) for i in range(n_steps)]
+    benchmark(lambda: [common.Step(**kwargs) for kwargs in data])
+
+@pytest.mark.parametrize("version,validate",[(1,True),(2,True),(2,False)])
+@pytest.mark.parametrize("n_steps",SIZES)
+def test_step_checksums(benchmark,version,validate,n_steps):
+    rng = random.Random(0)
+    data = [step_data(i,rng,100,10,50) for i in range(n_steps)]
+    for kwargs in data:
+        kwargs.pop("step_id")
+    benchmark(lambda: common.Step.calculate_checksums(data,version,validate))
+
+@pytest.mark.parametrize("n_objs",SIZES)
+def test_object_init(benchmark,n_objs):
+    data = [dict(
+        obj_id='o%d' % i,
+        name='Object %d' % i,
+        images=[dict(blob_id='b%d' % i,extension='.png',alt='Object')]
+    ) for i in range(n_objs)]
+    benchmark(lambda: [common.Object(**kwargs) for kwargs in data])
+
+@pytest.mark.parametrize("shape",sorted(SHAPES))
+@pytest.mark.parametrize("n_steps",SIZES)
+def test_graph_init(benchmark,shape,n_steps):
+    _,step_ids = get_store(n_steps)
+    graph = make_graph(shape,step_ids)
+    data = graph.as_dict()
+    benchmark(lambda: Graph(**data))
+
+@pytest.mark.parametrize("shape",sorted(SHAPES))
+@pytest.mark.parametrize("n_steps",SIZES)
+def test_graph_check(benchmark,shape,n_steps):
+    store,step_ids = get_store(n_steps)
+    graph = make_graph(shape,step_ids)
+    benchmark(lambda: graph.check(store))
+
+@pytest.mark.parametrize("shape",sorted(SHAPES))
+@pytest.mark.parametrize("n_steps",SIZES)
+def test_transitive_reduction(benchmark,shape,n_steps):
+    _,step_ids = get_store(n_steps)
+    graph = make_graph(shape,step_ids)
+    benchmark(lambda: graph.transitive_reduction(graph.graph_id))
+
+@pytest.mark.parametrize("shape",sorted(SHAPES))
+@pytest.mark.parametrize("n_steps",SIZES)
+def test_all_ancestors(benchmark,shape,n_steps):
+    _,step_ids = get_store(n_steps)
+    graph = make_graph(shape,step_ids)
+    #the step with the most ancestors
+    target = step_ids[0] if shape == 'fan_in' else step_ids[-1]
+    def run():
+        #measure the traversal, not the cache
+        graph._cache.clear()
+        return graph.all_ancestors(target)
+    benchmark(run)
+
+@pytest.mark.parametrize("cached",[False,True])
+@pytest.mark.parametrize("n_steps",SIZES)
+def test_subgraph(benchmark,cached,n_steps):
+    _,step_ids = get_store(n_steps)
+    graph = make_graph('random',step_ids)
+    targets = step_ids[len(step_ids)/2:len(step_ids)/2 + 10]
+    def run():
+        if not cached:
+            graph._cache.clear()
+        return graph.subgraph(targets)
+    benchmark(run)
+
+@pytest.mark.parametrize("shape",sorted(SHAPES))
+@pytest.mark.parametrize("n_steps",SIZES)
+def test_critical_path(benchmark,shape,n_steps):
+    store,step_ids = get_store(n_steps)
+    graph = make_graph(shape,step_ids)
+    benchmark(lambda: graph.critical_path(store))
+
+@pytest.mark.parametrize("shape",sorted(SHAPES))
+@pytest.mark.parametrize("n_steps",SMALL_SIZES)
+def test_schedule_topological(benchmark,shape,n_steps):
+    store,step_ids = get_store(n_steps)
+    graph = make_graph(shape,step_ids)
+    benchmark(lambda: schedule_topological(graph,store))
+
+@pytest.mark.parametrize("shape",sorted(SHAPES))
+@pytest.mark.parametrize("n_steps",SMALL_SIZES)
+def test_schedule_greedy(benchmark,shape,n_steps):
+    store,step_ids = get_store(n_steps)
+    graph = make_graph(shape,step_ids)
+    benchmark(lambda: schedule_greedy(graph,store))
+
+@pytest.mark.parametrize("shape",sorted(SHAPES))
+@pytest.mark.parametrize("n_steps",SIZES)
+def test_schedule_parallel(benchmark,shape,n_steps):
+    store,step_ids = get_store(n_steps)
+    graph = make_graph(shape,step_ids)
+    benchmark(lambda: schedule_parallel(graph,store,workers=4))
+
+@pytest.mark.parametrize("shape",sorted(SHAPES))
+@pytest.mark.parametrize("n_steps",SIZES)
+def test_schedule_tools(benchmark,shape,n_steps):
+    store,step_ids = get_store(n_steps)
+    graph = make_graph(shape,step_ids)
+    benchmark(lambda: schedule_tools(graph,store,workers=4))
+
+@pytest.mark.parametrize("shape",sorted(SHAPES))
+@pytest.mark.parametrize("n_steps",SIZES)
+def test_schedule_min_wip(benchmark,shape,n_steps):
+    store,step_ids = get_store(n_steps)
+    graph = make_graph(shape,step_ids)
+    benchmark(lambda: schedule_min_wip(graph,store))
+
+@pytest.mark.parametrize("shape",sorted(SHAPES))
+@pytest.mark.parametrize("n_steps",SMALL_SIZES)
+def test_schedule_optimal(benchmark,shape,n_steps):
+    store,step_ids = get_store(n_steps)
+    graph = make_graph(shape,step_ids)
+    benchmark(lambda: schedule_optimal(graph,store,max_nodes=10000))
+
+@pytest.mark.parametrize("method",["timedelta","columns"])
+@pytest.mark.parametrize("n_steps",SIZES)
+def test_idle_time(benchmark,method,n_steps):
+    """
+    Idle time of a schedule from the ScheduleSteps and from cached columns
+    """
+    _,step_ids = get_store(n_steps)
+    schedule = make_schedule(step_ids)
+    if method == "timedelta":
+        def run():
+            end = 0.
+            idle = 0.
+            for ref in sorted(schedule.steps,key=lambda ref: ref.start):
+                idle += max(0.,ref.start.total_seconds() - end)
+                end = max(end,ref.stop.total_seconds())
+            return idle
+    else:
+        schedule.timing()
+        run = lambda: schedule.timing().idle()
+    benchmark(run)
+
+@pytest.mark.parametrize("n_steps",SIZES)
+def test_schedule_timing(benchmark,n_steps):
+    _,step_ids = get_store(n_steps)
+    schedule = make_schedule(step_ids)
+    def run():
+        times = ScheduleTimes(schedule.as_dict()["steps"])
+        return times.makespan(), times.idle(), times.binned(3600)
+    benchmark(run)
+
+def _derived_schedule(step_ids,seed=0,add=True):
+    """
+    Schedule of step_ids with 1% of the steps removed, added (unless add is
+    False) or moved
+    """
+    rng = random.Random(seed)
+    step_ids = list(step_ids)
+    for i in range(len(step_ids)/100):
+        idx = rng.randrange(len(step_ids))
+        action = i % 3
+        if action == 0 or (action == 1 and not add):
+            step_ids.pop(idx)
+        elif action == 1:
+            step_ids.insert(idx,make_id('new',i))
+        else:
+            step_ids.insert(rng.randrange(len(step_ids)),step_ids.pop(idx))
+    return make_schedule(step_ids)
+
+@pytest.mark.parametrize("n_steps",[50000])
+def test_diff_sequence(benchmark,n_steps):
+    step_ids = [make_id('step',i) for i in range(n_steps)]
+    old = make_schedule(step_ids)
+    new = _derived_schedule(step_ids)
+    #the timing columns are cached by the schedules
+    old.timing()
+    new.timing()
+    benchmark(lambda: diff_schedules(old,new))
+
+@pytest.mark.parametrize("n_steps",SIZES)
+def test_diff_bom(benchmark,n_steps):
+    store,step_ids = get_store(n_steps)
+    old = make_schedule(step_ids)
+    new = _derived_schedule(step_ids,add=False)
+    benchmark(lambda: diff_schedules(old,new,store))
+
+@pytest.mark.parametrize("n_steps",SIZES)
+def test_collect_bom(benchmark,n_steps):
+    store,step_ids = get_store(n_steps)
+    schedule = make_schedule(step_ids)
+    benchmark(lambda: schedule.collect_bom(store))
+
+@pytest.mark.parametrize("n_steps",SMALL_SIZES)
+def test_collect_sourcefiles(benchmark,n_steps):
+    store,step_ids = get_store(n_steps)
+    schedule = make_schedule(step_ids)
+    benchmark(lambda: schedule.collect_sourcefiles(store))
+
+@pytest.mark.parametrize("n_steps",SIZES)
+def test_steps_using_obj(benchmark,n_steps):
+    store,_ = get_store(n_steps)
+    obj_ids = [obj_id for obj_id,_ in store.iter_obj()]
+    benchmark(lambda: [store.steps_using_obj(obj_id) for obj_id in obj_ids])
+
+def _search_index(store):
+    index = SearchIndex()
+    for _,obj in store.iter_obj():
+        index.add_obj(obj)
+    for _,step in store.iter_step():
+        index.add_step(step)
+    return index
+
+@pytest.mark.parametrize("n_steps",SIZES)
+def test_search_index(benchmark,n_steps):
+    store,_ = get_store(n_steps)
+    benchmark(lambda: _search_index(store))
+
+@pytest.mark.parametrize("method",["scan","index","prefix"])
+@pytest.mark.parametrize("n_steps",SIZES)
+def test_search(benchmark,method,n_steps):
+    store,_ = get_store(n_steps)
+    if method == "scan":
+        def run():
+            return [step_id for step_id,step in store.iter_step()
+                if "17" in tokenize(step.title)]
+    else:
+        index = _search_index(store)
+        prefix = method == "prefix"
+        run = lambda: index.search("step 17",prefix=prefix)
+    benchmark(run)
+
+def _collect_ids(data,found):
+    """
+    Append all id strings in the JSON like data to found
+    """
+    if isinstance(data,dict):
+        for key,value in data.iteritems():
+            if key.endswith('_id') and isinstance(value,basestring):
+                found.append(value)
+            elif key == 'requires':
+                found.extend(value)
+            else:
+                _collect_ids(value,found)
+    elif isinstance(data,list):
+        for item in data:
+            _collect_ids(item,found)
+
+@pytest.mark.parametrize("n_steps",SIZES)
+def test_id_memory(benchmark,n_steps):
+    """
+    Construction time of a store with interned ids. The memory used by the
+    id strings with and without interning is stored in the extra info.
+    """
+    store,step_ids = benchmark(lambda: make_store(n_steps))
+    graph = make_graph('random',step_ids)
+    found = list(store.paths)
+    for _,obj in store.iter_obj():
+        _collect_ids(obj._kwargs,found)
+    for _,step in store.iter_step():
+        _collect_ids(step._kwargs,found)
+    _collect_ids(graph._kwargs,found)
+    unique = dict((id(value),value) for value in found)
+    benchmark.extra_info["ids"] = len(found)
+    benchmark.extra_info["id_objects"] = len(unique)
+    benchmark.extra_info["bytes_interned"] = \
+        sum(sys.getsizeof(value) for value in unique.values())
+    benchmark.extra_info["bytes_not_interned"] = \
+        sum(sys.getsizeof(value) for value in found)
+
+def _load_json(data):
+    store = LocalMemoryStore()
+    data = json.loads(data)
+    for obj in data["objects"]:
+        store.add_obj(common.Object(**obj))
+    for step in data["steps"]:
+        store.add_step(common.Step(**step))
+    return store
+
+@pytest.mark.parametrize("method",["json","binary","trusted","search"])
+@pytest.mark.parametrize("n_steps",SIZES)
+def test_load_store(benchmark,method,n_steps):
+    store,_ = get_store(n_steps)
+    if method == "search":
+        #trusted load including a stored search index
+        fid = StringIO()
+        store.search_index = _search_index(store)
+        try:
+            dump_store(store,fid)
+        finally:
+            store.search_index = None
+        data = fid.getvalue()
+        benchmark(lambda: load_store(StringIO(data),trusted=True))
+    elif method == "json":
+        data = json.dumps(dict(
+            objects=[obj.as_dict() for _,obj in store.iter_obj()],
+            steps=[step.as_dict() for _,step in store.iter_step()]
+        ))
+        benchmark(lambda: _load_json(data))
+    else:
+        fid = StringIO()
+        dump_store(store,fid)
+        data = fid.getvalue()
+        trusted = method == "trusted"
+        benchmark(lambda: load_store(StringIO(data),trusted=trusted))
+
+@pytest.fixture(scope="module")
+def blob_files(tmpdir_factory):
+    """
+    Eight files of 16 MiB each
+    """
+    path = tmpdir_factory.mktemp("blobs")
+    files = []
+    for i in range(8):
+        blob = path.join('blob%d' % i)
+        blob.write(os.urandom(1 << 24),mode='wb')
+        files.append(str(blob))
+    return files
+
+def test_blob_checksum(benchmark,blob_files):
+    def run():
+        for filename in blob_files:
+            with open(filename,'rb') as fid:
+                common.calculate_blob_checksum(fid)
+    benchmark(run)
+
+def test_blob_hasher(benchmark,blob_files):
+    benchmark(lambda: BlobHasher(threads=4).blob_ids(blob_files))
@@ -0,0 +1,74 @@
+# Manual labour - a library for step-by-step instructions
+# Copyright (C) 2014 Johannes Reinhardt <jreinhardt@ist-dein-freund.de>
+#
+#  This library is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public
+#  License as published by the Free Software Foundation; either
+#  version 2.1 of the License, or any later version.
+#
+#  This library is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#  Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public
+#  License along with this library; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#  USA
+
+"""
+Benchmarks for the exporters
+"""
+
+import pkg_resources
+
+import pytest
+
+from manuallabour.exporters.html import SinglePageHTMLExporter,\
+    MultiPageHTMLExporter
+from manuallabour.exporters.gantt import GanttExporter
+from manuallabour.exporters.svg import GraphSVGExporter, ScheduleSVGExporter
+
+from generators import SIZES, SMALL_SIZES, get_store, make_graph,\
+    make_schedule
+
+DATA = dict(title="Benchmark",author="John Doe")
+
+@pytest.mark.parametrize("n_steps",SMALL_SIZES)
+def test_html_single(benchmark,n_steps):
+    store,step_ids = get_store(n_steps)
+    schedule = make_schedule(step_ids)
+    exporter = SinglePageHTMLExporter(pkg_resources.resource_filename(
+        'manuallabour.layouts.html_single.basic',
+        'template'))
+    benchmark(lambda: exporter.render(schedule,store,**DATA))
+
+@pytest.mark.parametrize("n_steps",SMALL_SIZES)
+def test_html_multi(benchmark,n_steps):
+    store,step_ids = get_store(n_steps)
+    schedule = make_schedule(step_ids)
+    exporter = MultiPageHTMLExporter(pkg_resources.resource_filename(
+        'manuallabour.layouts.html_multi.basic',
+        'template'))
+    benchmark(lambda: exporter.render(schedule,store,**DATA))
+
+@pytest.mark.parametrize("n_steps",SIZES)
+def test_gantt(benchmark,n_steps):
+    store,step_ids = get_store(n_steps)
+    schedule = make_schedule(step_ids)
+    exporter = GanttExporter()
+    benchmark(lambda: exporter.render(schedule,store,**DATA))
+
+@pytest.mark.parametrize("n_steps",SIZES)
+def test_graph_dot(benchmark,n_steps):
+    store,step_ids = get_store(n_steps)
+    graph = make_graph('random',step_ids)
+    exporter = GraphSVGExporter(with_objects=True,with_resources=True)
+    benchmark(lambda: exporter.render_dot(graph,store))
+
+@pytest.mark.parametrize("n_steps",SIZES)
+def test_schedule_dot(benchmark,n_steps):
+    store,step_ids = get_store(n_steps)
+    schedule = make_schedule(step_ids)
+    exporter = ScheduleSVGExporter(with_objects=True,with_resources=True)
+    benchmark(lambda: exporter.render_dot(schedule,store))
@@ -22,18 +22,21 @@ setup(
         'manuallabour',
         'manuallabour.exporters',
         'manuallabour.layouts',
-        'manuallabour.layouts.html_single'],
+        'manuallabour.layouts.html_single',
+        'manuallabour.layouts.html_multi'],
     description='Library for processing step by step instructions',
     long_description=long_description,
     install_requires = ['jsonschema','jinja2'],
     package_data = {
         'manuallabour.core' : ['schema/*.json'],
         'manuallabour.exporters' : ['schema/*.json'],
-        'manuallabour.layouts.html_single.basic' : ['template']
+        'manuallabour.layouts.html_single.basic' : ['template'],
+        'manuallabour.layouts.html_multi.basic' : ['template']
     },
     extras_require = {
-        'graph': ['pygraphviz'],
-        'pylint': ['pylint']
+        'pylint': ['pylint'],
+        'benchmark': ['pytest-benchmark'],
+        'timing': ['numpy']
     },
     author="Johannes Reinhardt",
     author_email="jreinhardt@ist-dein-freund.de",
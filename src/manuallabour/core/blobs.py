@@ -0,0 +1,104 @@
+# Manual labour - a library for step-by-step instructions
+# Copyright (C) 2014 Johannes Reinhardt <jreinhardt@ist-dein-freund.de>
+#
+#  This library is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public
+#  License as published by the Free Software Foundation; either
+#  version 2.1 of the License, or any later version.
+#
+#  This library is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#  Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public
+#  License along with this library; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#  USA
+
+"""
+This module provides fast calculation of blob ids for files on disk. The
+results are the same as from
+:func:`~manuallabour.core.common.calculate_blob_checksum`.
+"""
+
+import base64
+import hashlib
+import mmap
+import os
+from os.path import abspath
+from multiprocessing.pool import ThreadPool
+
+import manuallabour.core.instrumentation as instrumentation
+
+CHUNK_SIZE = 1 << 22
+"""Number of bytes hashed at once"""
+
+def hash_file(path,chunk_size=CHUNK_SIZE):
+    """
+    Calculate the blob id of the file at path. The file is memory mapped and
+    hashed in large chunks. The hash function releases the GIL for large
+    chunks, so several files can be hashed in parallel by threads.
+
+    :return: the blob id
+    :rtype: str
+    """
+    instrumentation.count("blob.hash")
+    check = hashlib.sha512()
+    with open(path,'rb') as fid:
+        size = os.fstat(fid.fileno()).st_size
+        #empty files can not be mapped
+        if size > 0:
+            mapped = mmap.mmap(fid.fileno(),0,access=mmap.ACCESS_READ)
+            try:
+                for offset in xrange(0,size,chunk_size):
+                    check.update(buffer(mapped,offset,chunk_size))
+            finally:
+                mapped.close()
+    return base64.urlsafe_b64encode(check.digest())[:-2]
+
+class BlobHasher(object):
+    """
+    Calculates blob ids for files, and remembers them as long as the size,
+    the modification time and the inode of a file do not change.
+
+    The cache is a dict that maps absolute paths to lists of size,
+    modification time, inode and blob id. It can be stored as JSON and
+    passed to a new BlobHasher to avoid hashing unchanged files again.
+    """
+    def __init__(self,cache=None,threads=4):
+        if cache is None:
+            cache = {}
+        self.cache = cache
+        self.threads = threads
+
+    def blob_id(self,path):
+        """
+        Return the blob id of the file at path, from the cache if possible
+        """
+        path = abspath(path)
+        stat = os.stat(path)
+        key = [stat.st_size,stat.st_mtime,stat.st_ino]
+        cached = self.cache.get(path)
+        if not cached is None and cached[:3] == key:
+            return cached[3]
+        blob_id = hash_file(path)
+        self.cache[path] = key + [blob_id]
+        return blob_id
+
+    def blob_ids(self,paths):
+        """
+        Return the blob ids of the files in paths. Files are hashed
+        concurrently in a pool of threads.
+
+        :rtype: :class:`list` of :class:`str`
+        """
+        paths = list(paths)
+        if self.threads == 1 or len(paths) < 2:
+            return [self.blob_id(path) for path in paths]
+        pool = ThreadPool(min(self.threads,len(paths)))
+        try:
+            return pool.map(self.blob_id,paths)
+        finally:
+            pool.close()
+            pool.join()
@@ -21,22 +21,28 @@ This module defines common classes and interfaces for manual labour
 """
 
 import json
+import threading
 import pkg_resources
 import hashlib
 import base64
 from os.path import join
 from datetime import timedelta
 from copy import deepcopy
+from functools import partial
+from contextlib import contextmanager
 
 import jsonschema
 
+import manuallabour.core.instrumentation as instrumentation
+
 SCHEMA_DIR =  pkg_resources.resource_filename('manuallabour.core','schema')
 
 def calculate_blob_checksum(fid):
     """
     Calculate a checksum over a file like object. Seeks back to the start
     after finished. Useful to use as (a part of) a blob_id. Uses sha512
-    checksum encoded to base64.
+    checksum encoded to base64. For files on disk, the functions in
+    :mod:`manuallabour.core.blobs` are faster.
 
     :param File fid: open file descriptor of the blob
     :return: the blob id
@@ -46,7 +52,7 @@ def calculate_blob_checksum(fid):
 
     check = hashlib.sha512()
     #use chunking to avoid excessive memory use on large files
-    for chunk in iter(lambda: fid.read(8192), b''):
+    for chunk in iter(partial(fid.read,1 << 20), b''):
         check.update(chunk)
     fid.seek(0)
     return base64.urlsafe_b64encode(check.digest())[:-2]
@@ -71,6 +77,22 @@ def calculate_kwargs_checksum(check,kwargs):
         raise ValueError("Unknown type in checksum calculation: %s" % \
             type(kwargs))
 
+def canonical_encoding(kwargs):
+    """
+    Return an unambiguous encoding of the JSON like data kwargs as byte
+    string: JSON with sorted keys, no whitespace and escaped non-ASCII
+    characters.
+
+    :rtype: :class:`str`
+    """
+    return json.dumps(kwargs,sort_keys=True,separators=(',',':'))
+
+CHECKSUM_VERSION = 1
+"""Version of the checksum calculation used by default"""
+
+#Prefix of the encoding hashed for version 2 checksums
+_CHECKSUM_PREFIX_V2 = hashlib.sha512('manuallabour-checksum-2\n')
+
 def dereference_schema(schema_dir,schema):
     """
     Dereference JSON references.
@@ -106,6 +128,69 @@ def load_schema(schema_dir,schema_name):
     dereference_schema(schema_dir,schema)
     return schema
 
+#Thread local state of the validation
+_VALIDATION = threading.local()
+
+@contextmanager
+def trusted_data():
+    """
+    Context manager in which DataStructs are not validated, because the data
+    is known to be valid, e.g. because it was written from validated
+    DataStructs and its integrity was checked.
+    """
+    previous = getattr(_VALIDATION,'trusted',False)
+    _VALIDATION.trusted = True
+    try:
+        yield
+    finally:
+        _VALIDATION.trusted = previous
+
+#Table of interned ids, maps every id to its canonical copy
+_IDS = {}
+
+def intern_id(value):
+    """
+    Return the interned copy of the id value. Equal ids that are interned
+    are the same object, so each id is kept in memory only once and
+    comparisons of ids are identity checks.
+
+    Interned ids are kept until :func:`clear_interned_ids` is called.
+    """
+    return _IDS.setdefault(value,value)
+
+def clear_interned_ids():
+    """
+    Forget all interned ids, so that the memory of ids that are no longer
+    used can be released. This is useful for long running processes, after
+    the components and stores they are done with are dropped. Existing ids
+    stay valid, but equal ids that are interned afterwards are no longer the
+    same objects.
+    """
+    _IDS.clear()
+
+def intern_ids(data):
+    """
+    Return a copy of the JSON like data, in which the ids are replaced by
+    their interned copies. Ids are the string values of fields ending in _id
+    and the items of requires lists. Dicts and lists are copied, other values
+    are shared with data.
+    """
+    if isinstance(data,dict):
+        res = {}
+        for key,value in data.iteritems():
+            if isinstance(value,basestring):
+                if key.endswith('_id'):
+                    value = intern_id(value)
+                res[key] = value
+            elif key == 'requires':
+                res[key] = [intern_id(req) for req in value]
+            else:
+                res[key] = intern_ids(value)
+        return res
+    elif isinstance(data,list):
+        return [intern_ids(item) for item in data]
+    return data
+
 def add_ids(ids1,ids2):
     """
     add ids2 to ids1, where they are both dicts of sets used to collect ids
@@ -130,6 +215,8 @@ class DataStruct(object):
     """JSON schema for the input of this class"""
     _validator = None
     """Validator for the schema of this class"""
+    _lazy = {}
+    """Functions calculating fields from the validated data on first access"""
     def __init__(self,**kwargs):
         self.validate(**kwargs)
         #used to store the values as passed to the constructor
@@ -142,12 +229,21 @@ class DataStruct(object):
             if (not field in self._schema.get("required",[])) and \
                 not "default" in schema:
                 raise ValueError("No default given for %s" % field)
-            #apply defaults
-            if (not field in kwargs) and "default" in schema:
+            #apply defaults, lazy fields take care of their defaults
+            if (not field in kwargs) and "default" in schema and \
+                    not field in self._lazy:
+                instrumentation.count("deepcopy")
                 self._calculated[field] = deepcopy(schema["default"])
     def __getattr__(self,name):
         if name in self._calculated:
             return self._calculated.get(name)
+        elif name in self._lazy:
+            instrumentation.count("materialize")
+            #the data was validated when this DataStruct was created
+            with trusted_data():
+                value = self._lazy[name](self)
+            self._calculated[name] = value
+            return value
         elif name in self._kwargs:
             return self._kwargs.get(name)
         else:
@@ -160,7 +256,11 @@ class DataStruct(object):
 
         :raises: :class:`jsonschema.ValidationError`
         """
-        cls._validator.validate(kwargs)
+        if getattr(_VALIDATION,'trusted',False):
+            return
+        instrumentation.count("validate")
+        with instrumentation.span("validate"):
+            cls._validator.validate(kwargs)
 
     def as_dict(self):
         """
@@ -169,6 +269,7 @@ class DataStruct(object):
 
         :rtype: :class:`dict`
         """
+        instrumentation.count("deepcopy")
         res = deepcopy(self._kwargs)
         for field, schema in self._schema["properties"].iteritems():
             if (not field in res) and "default" in schema:
@@ -181,10 +282,18 @@ class DataStruct(object):
 
         :rtype: :class:`dict`
         """
+        self.materialize()
+        instrumentation.count("deepcopy",2)
         res = {}
         res.update(deepcopy(self._kwargs))
         res.update(deepcopy(self._calculated))
         return res
+    def materialize(self):
+        """
+        Calculate all fields that are calculated lazily on first access
+        """
+        for name in self._lazy:
+            getattr(self,name)
     def collect_ids(self,_store):
         """
         Recursively collect the ids of all elements required for this one
@@ -279,9 +388,14 @@ class ObjectReference(ReferenceBase):
 class ComponentBase(DataStruct):
     """
     Base class for compontents that are stored in a Store and have an id to
-    identify themselves.
+    identify themselves. All ids in the data of a component are interned
+    with :func:`intern_id`.
     """
     _id = None
+    def __init__(self,**kwargs):
+        DataStruct.__init__(self,**kwargs)
+        self._kwargs = intern_ids(self._kwargs)
+
     @classmethod
     def calculate_checksum(cls,**kwargs):
         """
@@ -289,22 +403,79 @@ class ComponentBase(DataStruct):
         arguments (excluding the id). This can be useful to use as an obj_id
         or a part of if. Uses base64 encoding.
 
+        This is version 1 of the calculation, which feeds keys and values to
+        the hash one by one without separators, so different data can have
+        the same checksum. It is kept, so that existing ids can be
+        reproduced. New data should use :meth:`calculate_checksum_v2`.
+
         Returns a string
         """
         #Add the defaults, to make the result for kwargs be the same as for
         #the dict returned by calculate_checksum(ComponentBase.as_dict())
+        instrumentation.count("deepcopy")
         res = deepcopy(kwargs)
         for field, schema in cls._schema["properties"].iteritems():
             if (not field in res) and "default" in schema:
                 res[field] = deepcopy(schema["default"])
         if not cls._id in res:
             res[cls._id] = "dummy"
-        cls._validator.validate(res)
+        cls.validate(**res)
         res.pop(cls._id)
 
         check = hashlib.sha512()
         calculate_kwargs_checksum(check,res)
         return base64.urlsafe_b64encode(check.digest())[:-2]
+
+    @classmethod
+    def calculate_checksum_v2(cls,**kwargs):
+        """
+        Version 2 of :meth:`calculate_checksum`, which hashes the
+        :func:`canonical_encoding` of the data at once. It is faster and
+        different data always has different checksums, so it is recommended
+        for new data.
+
+        Returns a string
+        """
+        return cls._checksum_v2(kwargs)
+
+    @classmethod
+    def calculate_checksums(cls,items,version=CHECKSUM_VERSION,
+                            validate=True):
+        """
+        Calculate the checksums of many components at once, where items is
+        an iterable of dicts with the keyword arguments for each component,
+        with version 1 (:meth:`calculate_checksum`) or version 2
+        (:meth:`calculate_checksum_v2`) of the calculation.
+
+        With version 2, validation can be skipped for data that was already
+        validated, which is most of the cost of the calculation.
+
+        :rtype: :class:`list` of :class:`str`
+        :raises: :class:`ValueError` for unknown versions
+        """
+        if version == 2:
+            return [cls._checksum_v2(kwargs,validate) for kwargs in items]
+        elif version != 1:
+            raise ValueError("Unknown checksum version %s" % version)
+        return [cls.calculate_checksum(**kwargs) for kwargs in items]
+
+    @classmethod
+    def _checksum_v2(cls,kwargs,validate=True):
+        #nothing is modified, so no deep copies are required
+        res = dict(kwargs)
+        for field, schema in cls._schema["properties"].iteritems():
+            if (not field in res) and "default" in schema:
+                res[field] = schema["default"]
+        if validate:
+            if not cls._id in res:
+                res[cls._id] = "dummy"
+            cls.validate(**res)
+        res.pop(cls._id,None)
+
+        check = _CHECKSUM_PREFIX_V2.copy()
+        check.update(canonical_encoding(res))
+        return base64.urlsafe_b64encode(check.digest())[:-2]
+
     def collect_ids(self,_store):
         raise NotImplementedError
 
@@ -321,19 +492,20 @@ class Object(ComponentBase):
           :class:`~manuallabour.core.common.ImageReference`),
           A list of images that illustrate this object
 
+    Calculated fields are constructed on first access.
     """
     _schema = load_schema(SCHEMA_DIR,'object.json')
     _validator = jsonschema.Draft4Validator(_schema)
     _id = "obj_id"
+    _lazy = dict(
+        images=lambda self: [
+            ImageReference(**img) for img in self._kwargs.get("images",[])
+        ]
+    )
 
     def __init__(self,**kwargs):
         ComponentBase.__init__(self,**kwargs)
 
-        if "images" in self._kwargs:
-            self._calculated["images"] = []
-            for img in self._kwargs["images"]:
-                self._calculated["images"].append(ImageReference(**img))
-
     def dereference(self,store):
         res = DataStruct.dereference(self,store)
         for i,img in enumerate(res["images"]):
@@ -373,6 +545,9 @@ class Step(ComponentBase):
         * images (:class:`dict` of
           :class:`~manuallabour.core.common.ImageReference`),
           Local aliases of images used in this step
+
+    Calculated fields are constructed on first access, so workloads that
+    only need some of them do not pay for the others.
     """
     _schema = load_schema(SCHEMA_DIR,'step.json')
     _validator = jsonschema.Draft4Validator(_schema)
@@ -381,30 +556,34 @@ class Step(ComponentBase):
     def __init__(self,**kwargs):
         ComponentBase.__init__(self,**kwargs)
 
-        for time in ["duration","waiting"]:
-            if time in kwargs and kwargs[time]:
-                self._calculated[time] = timedelta(**kwargs[time])
-            else:
-                self._calculated[time] = None
-
+        #check the constraints of the references without constructing them
         for nsp in ["parts","tools","results"]:
-            if nsp in self._kwargs:
-                self._calculated[nsp] = {}
-                for alias, objref in self._kwargs[nsp].iteritems():
-                    self._calculated[nsp][alias] = ObjectReference(**objref)
-
-        for res in self.results.values():
-            assert res.created
-
-        if "files" in self._kwargs:
-            self._calculated["files"] = {}
-            for alias, resref in self._kwargs["files"].iteritems():
-                self._calculated["files"][alias] = FileReference(**resref)
-
-        if "images" in self._kwargs:
-            self._calculated["images"] = {}
-            for alias, resref in self._kwargs["images"].iteritems():
-                self._calculated["images"][alias] = ImageReference(**resref)
+            for objref in self._kwargs.get(nsp,{}).itervalues():
+                assert not (objref.get("created") and objref.get("optional"))
+        for objref in self._kwargs.get("results",{}).itervalues():
+            assert objref.get("created")
+
+    def _time(self,name):
+        value = self._kwargs.get(name)
+        if value:
+            return timedelta(**value)
+        return None
+
+    def _namespace(self,name,cls):
+        return dict(
+            (alias,cls(**ref))
+            for alias,ref in self._kwargs.get(name,{}).iteritems()
+        )
+
+    _lazy = dict(
+        duration=lambda self: self._time("duration"),
+        waiting=lambda self: self._time("waiting"),
+        parts=lambda self: self._namespace("parts",ObjectReference),
+        tools=lambda self: self._namespace("tools",ObjectReference),
+        results=lambda self: self._namespace("results",ObjectReference),
+        files=lambda self: self._namespace("files",FileReference),
+        images=lambda self: self._namespace("images",ImageReference)
+    )
 
     def dereference(self,store):
         res = DataStruct.dereference(self,store)
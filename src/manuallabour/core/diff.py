@@ -0,0 +1,167 @@
+# Manual labour - a library for step-by-step instructions
+# Copyright (C) 2014 Johannes Reinhardt <jreinhardt@ist-dein-freund.de>
+#
+#  This library is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public
+#  License as published by the Free Software Foundation; either
+#  version 2.1 of the License, or any later version.
+#
+#  This library is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#  Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public
+#  License along with this library; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#  USA
+
+"""
+This module provides the comparison of schedules, e.g. of a schedule and the
+schedule regenerated for a derived project.
+"""
+
+from bisect import bisect_left
+from difflib import SequenceMatcher
+
+def _common_subsequence(old_ids,new_ids):
+    """
+    Return a longest common subsequence of the lists of step ids old_ids
+    and new_ids, as list of pairs of indices into old_ids and new_ids.
+    """
+    if len(set(old_ids)) < len(old_ids) or len(set(new_ids)) < len(new_ids):
+        #repeated steps, fall back to a general sequence matcher
+        matcher = SequenceMatcher(None,old_ids,new_ids,autojunk=False)
+        return [
+            (old + offset,new + offset)
+            for old,new,size in matcher.get_matching_blocks()
+            for offset in xrange(size)
+        ]
+
+    #for unique ids this is a longest increasing subsequence of the positions
+    #of the common ids in old_ids
+    positions = dict((step_id,idx) for idx,step_id in enumerate(old_ids))
+    tails = []
+    tail_idx = []
+    parents = {}
+    for idx,step_id in enumerate(new_ids):
+        if not step_id in positions:
+            continue
+        pos = positions[step_id]
+        length = bisect_left(tails,pos)
+        parents[idx] = tail_idx[length - 1] if length > 0 else None
+        if length == len(tails):
+            tails.append(pos)
+            tail_idx.append(idx)
+        else:
+            tails[length] = pos
+            tail_idx[length] = idx
+    res = []
+    idx = tail_idx[-1] if tail_idx else None
+    while idx is not None:
+        res.append((positions[new_ids[idx]],idx))
+        idx = parents[idx]
+    res.reverse()
+    return res
+
+def _step_times(schedule):
+    """
+    Return a list with a tuple of start, stop and end of waiting time for
+    each step of schedule
+    """
+    try:
+        times = schedule.timing()
+    except ValueError:
+        return [(ref.start,ref.stop,ref.waiting) for ref in schedule.steps]
+    return zip(
+        times.start.tolist(),
+        times.stop.tolist(),
+        times.waiting.tolist()
+    )
+
+def _step_numbers(schedule):
+    """
+    Return a list with the step number of each step of schedule
+    """
+    try:
+        times = schedule.timing()
+    except ValueError:
+        return [ref.step_nr for ref in schedule.steps]
+    return [idx + 1 for idx in times.step_idx.tolist()]
+
+def _bom_delta(old_bom,new_bom):
+    """
+    Return the changed quantities between two BOMs
+    """
+    res = {}
+    for kind in ["parts","tools"]:
+        res[kind] = {}
+        old = old_bom[kind]
+        new = new_bom[kind]
+        for obj_id in set(old) | set(new):
+            before = (old[obj_id].quantity,old[obj_id].optional) \
+                if obj_id in old else (0,0)
+            after = (new[obj_id].quantity,new[obj_id].optional) \
+                if obj_id in new else (0,0)
+            if before != after:
+                res[kind][obj_id] = dict(
+                    quantity=after[0] - before[0],
+                    optional=after[1] - before[1]
+                )
+    return res
+
+def diff_schedules(old, new, store=None):
+    """
+    Compare the schedules old and new. The step ids of new are matched to
+    a longest common subsequence of the step ids of old. Steps outside of it
+    were added, removed or moved. Matched steps are retimed if their start,
+    stop or waiting time differ, and renumbered if their step number
+    differs.
+
+    Exporters only need to render the steps that were added, moved, retimed
+    or renumbered again. If a store is given, the changes of the quantities
+    of the parts and tools in the BOM are calculated as well.
+
+    :return: dict with lists of the ids of the kept, added, moved, retimed
+             and renumbered steps in the order of new, and the ids of the
+             removed steps in the order of old. If a store is given, the BOM
+             delta maps obj_ids to the changes of quantity and optional
+             quantity for parts and tools.
+    :rtype: :class:`dict`
+    """
+    old_ids = [ref.step_id for ref in old.steps]
+    new_ids = [ref.step_id for ref in new.steps]
+    pairs = _common_subsequence(old_ids,new_ids)
+
+    old_set = set(old_ids)
+    new_set = set(new_ids)
+    kept = set(idx for _,idx in pairs)
+    old_times = _step_times(old)
+    new_times = _step_times(new)
+    old_nrs = _step_numbers(old)
+    new_nrs = _step_numbers(new)
+    res = dict(
+        kept=[new_ids[idx] for _,idx in pairs],
+        added=[],
+        moved=[],
+        retimed=[
+            new_ids[new_idx] for old_idx,new_idx in pairs
+            if old_times[old_idx] != new_times[new_idx]
+        ],
+        renumbered=[
+            new_ids[new_idx] for old_idx,new_idx in pairs
+            if old_nrs[old_idx] != new_nrs[new_idx]
+        ],
+        removed=[step_id for step_id in old_ids if not step_id in new_set]
+    )
+    for idx,step_id in enumerate(new_ids):
+        if idx in kept:
+            continue
+        elif step_id in old_set:
+            res["moved"].append(step_id)
+        else:
+            res["added"].append(step_id)
+
+    if store is not None:
+        res["bom"] = _bom_delta(old.collect_bom(store),new.collect_bom(store))
+    return res
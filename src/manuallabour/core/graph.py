@@ -20,10 +20,12 @@
 This module defines the Graph class and related classes
 """
 
+from collections import deque
+
 import jsonschema
 
 from manuallabour.core.common import ReferenceBase, load_schema, SCHEMA_DIR,\
-    ComponentBase, add_ids
+    ComponentBase, add_ids, trusted_data
 
 class GraphStep(ReferenceBase):
     """
@@ -64,13 +66,42 @@ class Graph(ComponentBase):
     _schema = load_schema(SCHEMA_DIR,'graph.json')
     _validator = jsonschema.Draft4Validator(_schema)
     _id = "graph_id"
+    _lazy = dict(graph_id=lambda self: self._graph_id())
 
     def __init__(self,**kwargs):
         ComponentBase.__init__(self,**kwargs)
+        self._init_steps(
+            [GraphStep(**ref) for ref in self._kwargs["steps"]]
+        )
+
+    @classmethod
+    def _from_steps(cls,steps,graph_id=None):
+        """
+        Create a graph from GraphSteps that were already validated. The
+        GraphSteps are shared, not copied. If graph_id is None, the checksum
+        of the steps is used, which is calculated on first access.
+        """
+        # pylint: disable=W0212
+        kwargs = dict(steps=[ref._kwargs for ref in steps])
+        if not graph_id is None:
+            kwargs["graph_id"] = graph_id
+        graph = cls.__new__(cls)
+        with trusted_data():
+            ComponentBase.__init__(graph,**kwargs)
+        graph._init_steps(steps)
+        return graph
 
-        self._calculated["steps"] = []
-        for ref in kwargs["steps"]:
-            self._calculated["steps"].append(GraphStep(**ref))
+    def _graph_id(self):
+        if not "graph_id" in self._kwargs:
+            self._kwargs["graph_id"] = \
+                Graph.calculate_checksum(steps=self._kwargs["steps"])
+        return self._kwargs["graph_id"]
+
+    def _init_steps(self,steps):
+        #results of analyses, graphs are not modified after construction
+        self._cache = {}
+
+        self._calculated["steps"] = steps
 
         #Dependency information
         self._calculated["children"] = {}
@@ -88,6 +119,10 @@ class Graph(ComponentBase):
                 else:
                     self._calculated["children"][req].append(ref.step_id)
 
+    def as_dict(self):
+        self.materialize()
+        return ComponentBase.as_dict(self)
+
     def dereference(self,store):
         res = ComponentBase.dereference(self,store)
         for i, step in enumerate(res["steps"]):
@@ -100,14 +135,343 @@ class Graph(ComponentBase):
             add_ids(res,ref.collect_ids(store))
         return res
 
+    def check(self,store=None,targets=None):
+        """
+        Check the graph for problems in a single depth first traversal
+        along the prerequisites, starting from the targets or from all steps.
+
+        The result is a dict with lists of
+
+        * cycles: the ids of the steps in a cycle, where the first step is
+          repeated at the end
+        * dangling: tuples of the ids of a step and of a prerequisite that
+          is not in the graph
+        * duplicates: ids of steps that occur more than once
+        * unreachable: ids of steps that are not required for the targets,
+          only if targets are given
+        * orphans: ids of steps that neither have prerequisites nor are
+          required by other steps, if the graph has several steps
+        * missing_steps, missing_objects, missing_blobs: ids of steps,
+          objects and blobs that are referenced, but not in the store, only
+          if a store is given
+
+        :rtype: :class:`dict` of :class:`list`
+        """
+        # pylint: disable=R0912
+        res = dict(
+            cycles=[],
+            dangling=[],
+            duplicates=[],
+            unreachable=[],
+            orphans=[],
+            missing_steps=set([]),
+            missing_objects=set([]),
+            missing_blobs=set([])
+        )
+
+        seen = set([])
+        for ref in self.steps:
+            if ref.step_id in seen:
+                res["duplicates"].append(ref.step_id)
+            seen.add(ref.step_id)
+            if len(self.steps) > 1 and not ref.requires and \
+                    not self.children[ref.step_id]:
+                res["orphans"].append(ref.step_id)
+
+        #white steps are not in colour, grey ones are on the stack
+        grey, black = 1, 2
+        colour = {}
+        if targets is None:
+            roots = [ref.step_id for ref in self.steps]
+        else:
+            roots = list(targets)
+        for root in roots:
+            if root in colour:
+                continue
+            if not root in self.parents:
+                res["dangling"].append((None,root))
+                continue
+            colour[root] = grey
+            stack = [(root,iter(self.parents[root]))]
+            if not store is None:
+                self._check_store(store,root,res)
+            while stack:
+                step_id, parents = stack[-1]
+                for parent in parents:
+                    if not parent in self.parents:
+                        res["dangling"].append((step_id,parent))
+                    elif colour.get(parent) == grey:
+                        path = [s for s,_ in stack]
+                        path = path[path.index(parent):] + [parent]
+                        res["cycles"].append(path)
+                    elif not parent in colour:
+                        colour[parent] = grey
+                        stack.append((parent,iter(self.parents[parent])))
+                        if not store is None:
+                            self._check_store(store,parent,res)
+                        break
+                else:
+                    colour[step_id] = black
+                    stack.pop()
+
+        if not targets is None:
+            res["unreachable"] = [
+                ref.step_id for ref in self.steps if not ref.step_id in colour
+            ]
+        for key in ["missing_steps","missing_objects","missing_blobs"]:
+            res[key] = sorted(res[key])
+        return res
+
+    @staticmethod
+    def _check_store(store,step_id,res):
+        """
+        Collect the ids of references of the step that are missing in store
+        """
+        if not store.has_step(step_id):
+            res["missing_steps"].add(step_id)
+            return
+        step = store.get_step(step_id)
+        for nspace in [step.images,step.files]:
+            for ref in nspace.values():
+                for blob_id in ref.collect_ids(store)["blob_ids"]:
+                    if not store.has_blob(blob_id):
+                        res["missing_blobs"].add(blob_id)
+        for nspace in [step.parts,step.tools,step.results]:
+            for ref in nspace.values():
+                if not store.has_obj(ref.obj_id):
+                    res["missing_objects"].add(ref.obj_id)
+                    continue
+                for img in store.get_obj(ref.obj_id).images:
+                    for blob_id in img.collect_ids(store)["blob_ids"]:
+                        if not store.has_blob(blob_id):
+                            res["missing_blobs"].add(blob_id)
+
+    def topological_sort(self):
+        """
+        Return the ids of all steps in an order in which every step comes
+        after its prerequisites. Among the steps whose prerequisites are
+        fulfilled, the order of the steps in the graph is kept.
+
+        :raises: :class:`ValueError` if the graph contains cycles or
+                 prerequisites that are not in the graph
+        :rtype: :class:`list` of :ref:`jsonschema-members-common-json-step_id`
+        """
+        if "topological" in self._cache:
+            return list(self._cache["topological"])
+
+        missing = dict((ref.step_id,len(ref.requires)) for ref in self.steps)
+        ready = deque(ref.step_id for ref in self.steps if not ref.requires)
+        res = []
+        while ready:
+            step_id = ready.popleft()
+            res.append(step_id)
+            for child in self.children[step_id]:
+                missing[child] -= 1
+                if missing[child] == 0:
+                    ready.append(child)
+
+        if len(res) < len(self.steps):
+            raise ValueError(
+                "Graph contains cycles or unknown prerequisites"
+            )
+        self._cache["topological"] = res
+        return list(res)
+
+    def transitive_reduction(self,graph_id=None):
+        """
+        Return an equivalent graph with the minimal set of prerequisites,
+        i.e. without prerequisites that are already implied by other
+        prerequisites. If no graph_id is given, the checksum of the new
+        graph is used.
+
+        The ancestors of each step are kept as bitsets while the steps are
+        visited in topological order, and dropped as soon as all children of
+        a step are visited.
+
+        :rtype: :class:`~manuallabour.core.graph.Graph`
+        """
+        order = self.topological_sort()
+        pos = dict((step_id,i) for i,step_id in enumerate(order))
+        pending = dict((s,len(self.children[s])) for s in order)
+
+        ancestors = {}
+        kept = {}
+        for step_id in order:
+            reach = 0
+            kept[step_id] = set([])
+            #parents that are ancestors of other parents come later
+            for parent in sorted(self.parents[step_id],key=pos.get,
+                                 reverse=True):
+                if not reach >> pos[parent] & 1:
+                    kept[step_id].add(parent)
+                    reach |= ancestors[parent] | 1 << pos[parent]
+                pending[parent] -= 1
+                if pending[parent] == 0:
+                    del ancestors[parent]
+            if pending[step_id] > 0:
+                ancestors[step_id] = reach
+
+        steps = []
+        for ref in self.steps:
+            requires = []
+            for req in ref.requires:
+                if req in kept[ref.step_id] and not req in requires:
+                    requires.append(req)
+            steps.append(dict(step_id=ref.step_id,requires=requires))
+        if graph_id is None:
+            graph_id = Graph.calculate_checksum(steps=steps)
+        return Graph(graph_id=graph_id,steps=steps)
+
+    def step_times(self,store):
+        """
+        Return the duration and the waiting time in seconds of all steps in
+        this graph. A missing waiting time is counted as zero.
+
+        :raises: :class:`ValueError` if a step has no duration
+        :rtype: :class:`dict` of :ref:`jsonschema-members-common-json-step_id`
+                and :class:`tuple`
+        """
+        res = {}
+        for ref in self.steps:
+            step = store.get_step(ref.step_id)
+            if step.duration is None:
+                raise ValueError(
+                    "Step %s has no timing information" % ref.step_id
+                )
+            waiting = step.waiting.total_seconds() if step.waiting else 0
+            res[ref.step_id] = (step.duration.total_seconds(),waiting)
+        return res
+
+    def critical_path(self,store):
+        """
+        Calculate earliest and latest start times of all steps using the
+        critical path method, assuming that every step can be worked on as
+        soon as all its prerequisites are finished, including their waiting
+        time. The makespan is therefore the minimal time in which the graph
+        can be completed, no matter how many people work on it.
+
+        The result is a dict with the entries
+
+        * earliest: dict mapping step ids to the earliest start in seconds
+        * latest: dict mapping step ids to the latest start in seconds that
+          does not delay the completion
+        * slack: dict mapping step ids to the difference of the two
+        * tail: dict mapping step ids to the length of the longest chain of
+          steps starting with this step, useful as priority for scheduling
+        * path: list of the ids of the steps on a critical path, in order
+        * makespan: minimal total time in seconds
+
+        :raises: :class:`ValueError` if the graph contains cycles or steps
+                 without timing information
+        :rtype: :class:`dict`
+        """
+        order = self.topological_sort()
+        times = self.step_times(store)
+
+        #forward pass
+        earliest = {}
+        finish = {}
+        makespan = 0
+        for step_id in order:
+            start = 0
+            for parent in self.parents[step_id]:
+                start = max(start,finish[parent])
+            earliest[step_id] = start
+            finish[step_id] = start + sum(times[step_id])
+            makespan = max(makespan,finish[step_id])
+
+        #backward pass
+        latest = {}
+        tail = {}
+        for step_id in reversed(order):
+            length = 0
+            for child in self.children[step_id]:
+                length = max(length,tail[child])
+            tail[step_id] = length + sum(times[step_id])
+            latest[step_id] = makespan - tail[step_id]
+
+        slack = dict((k,latest[k] - earliest[k]) for k in order)
+
+        #follow the critical steps backwards from the last one to finish
+        path = []
+        current = None
+        for step_id in order:
+            if finish[step_id] == makespan and slack[step_id] == 0:
+                current = step_id
+                break
+        while not current is None:
+            path.append(current)
+            parents = self.parents[current]
+            current = None
+            for parent in parents:
+                if finish[parent] == earliest[path[-1]] and \
+                        slack[parent] == 0:
+                    current = parent
+                    break
+        path.reverse()
+
+        return dict(
+            earliest=earliest,
+            latest=latest,
+            slack=slack,
+            tail=tail,
+            path=path,
+            makespan=makespan
+        )
+
     def all_ancestors(self,step_id):
         """ Return set with ids of all ancestor steps of step_id, i.e. all
         steps that are a direct or indirect prerequisite.
 
         :rtype: :class:`set` of :ref:`jsonschema-members-common-json-step_id`
         """
-        res = set([])
-        for parent in self.parents[step_id]:
-            res.add(parent)
-            res.update(self.all_ancestors(parent))
-        return res
+        return set(self.closure(self.parents[step_id]))
+
+    def closure(self,targets):
+        """
+        Return the ids of the steps with ids in targets and of all their
+        ancestors. The result is computed in a single traversal and cached
+        per set of targets.
+
+        :rtype: :class:`frozenset` of
+                :ref:`jsonschema-members-common-json-step_id`
+        :raises: :class:`KeyError` if a step or prerequisite is not in the
+                 graph
+        """
+        key = frozenset(targets)
+        closures = self._cache.setdefault("closures",{})
+        if not key in closures:
+            res = set(key)
+            stack = list(key)
+            while stack:
+                for parent in self.parents[stack.pop()]:
+                    if not parent in res:
+                        res.add(parent)
+                        stack.append(parent)
+            closures[key] = frozenset(res)
+        return closures[key]
+
+    def subgraph(self,targets,graph_id=None):
+        """
+        Return the graph with only the steps required for the steps with ids
+        in targets, i.e. the targets and all their ancestors, or this graph
+        if targets is None. If no graph_id is given, the checksum of the
+        subgraph is used. The steps of the subgraph are shared with this
+        graph, and the subgraph is cached per set of targets and graph_id,
+        so repeated calls are cheap.
+
+        :rtype: :class:`~manuallabour.core.graph.Graph`
+        :raises: :class:`KeyError` if a step or prerequisite is not in the
+                 graph
+        """
+        if targets is None:
+            return self
+        key = (frozenset(targets),graph_id)
+        subgraphs = self._cache.setdefault("subgraphs",{})
+        if not key in subgraphs:
+            required = self.closure(key[0])
+            subgraphs[key] = Graph._from_steps(
+                [ref for ref in self.steps if ref.step_id in required],
+                graph_id
+            )
+        return subgraphs[key]
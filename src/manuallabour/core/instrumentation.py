@@ -0,0 +1,193 @@
+# Manual labour - a library for step-by-step instructions
+# Copyright (C) 2014 Johannes Reinhardt <jreinhardt@ist-dein-freund.de>
+#
+#  This library is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public
+#  License as published by the Free Software Foundation; either
+#  version 2.1 of the License, or any later version.
+#
+#  This library is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#  Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public
+#  License along with this library; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#  USA
+
+"""
+This module provides opt-in instrumentation for manual labour. Named spans
+measure the time spent in the phases of an export, counters record how often
+frequent operations like validations, deepcopies and store lookups happen.
+
+The measurements are passed to a sink, that is installed with :func:`enable`.
+As long as no sink is installed, :func:`span` returns a shared context manager
+that does nothing and :func:`count` returns immediately, so the hooks can stay
+in place in production.
+
+The sink is process wide. Worker processes of the exporters inherit the sink
+that was installed when they were started, but their measurements are not
+passed back to the parent process.
+"""
+
+import json
+from threading import Lock
+from time import time
+
+#The installed sink, None if instrumentation is disabled
+_SINK = None
+
+def enable(sink):
+    """
+    Install sink to receive all measurements from now on.
+
+    :return: the previously installed sink or None
+    """
+    #pylint: disable=W0603
+    global _SINK
+    previous = _SINK
+    _SINK = sink
+    return previous
+
+def disable():
+    """
+    Stop instrumentation.
+
+    :return: the previously installed sink or None
+    """
+    return enable(None)
+
+def get_sink():
+    """
+    Return the installed sink or None if instrumentation is disabled
+    """
+    return _SINK
+
+class _NullSpan(object):
+    """
+    Span that does nothing, used when instrumentation is disabled
+    """
+    def __enter__(self):
+        return self
+    def __exit__(self,*args):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class _Span(object):
+    """
+    Span that reports its duration to a sink
+    """
+    __slots__ = ['sink','name','start']
+    def __init__(self,sink,name):
+        self.sink = sink
+        self.name = name
+        self.start = None
+    def __enter__(self):
+        self.start = time()
+        return self
+    def __exit__(self,*args):
+        self.sink.span(self.name,time() - self.start)
+        return False
+
+def span(name):
+    """
+    Return a context manager that measures the time spent in its block and
+    reports it as span name.
+    """
+    if _SINK is None:
+        return _NULL_SPAN
+    return _Span(_SINK,name)
+
+def count(name,amount=1):
+    """
+    Increase the counter name by amount.
+    """
+    if _SINK is not None:
+        _SINK.count(name,amount)
+
+# pylint: disable=R0921
+class SinkBase(object):
+    """
+    Interface for sinks that receive measurements.
+    """
+    def span(self,name,seconds):
+        """
+        Receive the duration in seconds of a completed span name
+        """
+        raise NotImplementedError
+    def count(self,name,amount):
+        """
+        Receive an increase of the counter name by amount
+        """
+        raise NotImplementedError
+
+class SummarySink(SinkBase):
+    """
+    Sink that accumulates the measurements in memory.
+    """
+    def __init__(self):
+        SinkBase.__init__(self)
+        self.spans = {}
+        self.counts = {}
+        self.lock = Lock()
+    def span(self,name,seconds):
+        with self.lock:
+            stats = self.spans.setdefault(name,dict(
+                calls=0,
+                seconds=0.,
+                max=0.
+            ))
+            stats["calls"] += 1
+            stats["seconds"] += seconds
+            stats["max"] = max(stats["max"],seconds)
+    def count(self,name,amount):
+        with self.lock:
+            self.counts[name] = self.counts.get(name,0) + amount
+    def summary(self):
+        """
+        Return the accumulated measurements.
+
+        :return: dict with a dict of spans, mapping span names to the number
+                 of calls, the total and the maximum duration, and a dict of
+                 counts mapping counter names to their values
+        :rtype: :class:`dict`
+        """
+        with self.lock:
+            return dict(
+                spans=dict((k,dict(v)) for k,v in self.spans.iteritems()),
+                counts=dict(self.counts)
+            )
+
+class JSONSink(SinkBase):
+    """
+    Sink that writes every measurement as a line of JSON to the file like
+    object fid.
+    """
+    def __init__(self,fid):
+        SinkBase.__init__(self)
+        self.fid = fid
+        self.lock = Lock()
+    def _write(self,record):
+        line = json.dumps(record,sort_keys=True) + '\n'
+        with self.lock:
+            self.fid.write(line)
+    def span(self,name,seconds):
+        self._write(dict(type="span",name=name,seconds=seconds))
+    def count(self,name,amount):
+        self._write(dict(type="count",name=name,amount=amount))
+
+class CallbackSink(SinkBase):
+    """
+    Sink that passes every measurement to callback, which is called with the
+    kind of measurement ("span" or "count"), the name and the duration or the
+    amount.
+    """
+    def __init__(self,callback):
+        SinkBase.__init__(self)
+        self.callback = callback
+    def span(self,name,seconds):
+        self.callback("span",name,seconds)
+    def count(self,name,amount):
+        self.callback("count",name,amount)
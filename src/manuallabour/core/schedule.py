@@ -19,11 +19,16 @@
 """
 This module defines the Schedule class and related classes
 """
-import jsonschema
 from datetime import timedelta
+from heapq import heappush, heappop, heapreplace
+from time import time as clock
+
+import jsonschema
 
 from manuallabour.core.common import ReferenceBase, load_schema, SCHEMA_DIR,\
     ComponentBase,add_ids
+from manuallabour.core.graph import Graph
+from manuallabour.core.timing import ScheduleTimes
 
 class BOMReference(ReferenceBase):
     """
@@ -93,9 +98,7 @@ class ScheduleStep(ReferenceBase):
         """
 
         res = self.dereference(store)
-        step = store.get_step(self.step_id)
-        res["description"] = markup.markup(step,store,res["description"])
-        res["attention"] = markup.markup(step,store,res["attention"])
+        res.update(store.markup_step(self.step_id,markup))
         return res
 
 class Schedule(ComponentBase):
@@ -116,10 +119,25 @@ class Schedule(ComponentBase):
     def __init__(self,**kwargs):
         ComponentBase.__init__(self,**kwargs)
 
+        #results of analyses, schedules are not modified after construction
+        self._cache = {}
+
         self._calculated["steps"] = []
         for step in kwargs["steps"]:
             self._calculated["steps"].append(ScheduleStep(**step))
 
+    def timing(self):
+        """
+        Return the timing of the steps of this timed schedule as columns,
+        which are calculated only once.
+
+        :rtype: :class:`~manuallabour.core.timing.ScheduleTimes`
+        :raises: :class:`ValueError` if the schedule is not timed
+        """
+        if not "timing" in self._cache:
+            self._cache["timing"] = ScheduleTimes(self._kwargs["steps"])
+        return self._cache["timing"]
+
     def collect_bom(self,store):
         """
         Collect the list of required materials and tools for this schedule.
@@ -217,20 +235,35 @@ class Schedule(ComponentBase):
             add_ids(res,ref.collect_ids(store))
         return res
 
+def _check_structure(graph,targets=None):
+    """
+    Raise a ValueError if the steps of graph required for targets, or all
+    steps, can not be scheduled because of cycles or prerequisites that are
+    not in the graph. Raise a KeyError if a target is not in the graph.
+    """
+    problems = graph.check(targets=targets)
+    for step_id,parent in problems["dangling"]:
+        if step_id is None:
+            raise KeyError("Unknown target step %s" % parent)
+    if problems["cycles"]:
+        raise ValueError(
+            "Graph contains a cycle: %s" % " -> ".join(problems["cycles"][0])
+        )
+    if problems["dangling"]:
+        raise ValueError(
+            "Step %s requires unknown step %s" % problems["dangling"][0]
+        )
+
 def schedule_topological(graph, store, targets = None):
     """
     Scheduler that arbitrarily chooses a step order that satisfies the
     dependencies.
+
+    if targets is not given, schedules full graph
     """
-    #find set of steps required for target
-    if targets is None:
-        steps = graph.steps
-    else:
-        steps = set([])
-        for target in targets:
-            steps.add(target)
-            steps.update(graph.all_ancestors(target))
-        steps = dict((key,graph.steps[key]) for key in steps)
+    _check_structure(graph,targets)
+    graph = graph.subgraph(targets)
+    steps = graph.steps
 
     timed = True
     for step in steps:
@@ -284,6 +317,521 @@ def schedule_topological(graph, store, targets = None):
 
     return sorted(scheduled.values(),key=lambda x: x["step_idx"])
 
+def schedule_parallel(graph, store, workers=2, targets = None):
+    """
+    Scheduler that distributes the steps over several workers by list
+    scheduling. Whenever a worker is free, it starts the step with the
+    longest chain of dependent steps (see
+    :meth:`~manuallabour.core.graph.Graph.critical_path`) among the steps
+    whose prerequisites are finished, including their waiting time. Waiting
+    times do not occupy a worker.
+
+    The index of the worker is given as worker in the scheduled steps, which
+    are ordered by their start time.
+
+    if targets is not given, schedules full graph
+    """
+    if workers < 1:
+        raise ValueError("At least one worker is required")
+    graph = graph.subgraph(targets)
+    times = graph.step_times(store)
+    tail = graph.critical_path(store)["tail"]
+
+    #position in the graph breaks ties between equal priorities
+    order = dict((ref.step_id,i) for i,ref in enumerate(graph.steps))
+    missing = dict((ref.step_id,len(ref.requires)) for ref in graph.steps)
+
+    ready = []
+    for ref in graph.steps:
+        if not ref.requires:
+            heappush(ready,(-tail[ref.step_id],order[ref.step_id]))
+
+    #heaps of (time,worker) when workers are free and of (time,order) when
+    #steps are finished including waiting
+    free = [(0,i) for i in range(workers)]
+    finished = []
+    scheduled = []
+
+    while len(scheduled) < len(graph.steps):
+        time, worker = free[0]
+        while finished and finished[0][0] <= time:
+            step_id = graph.steps[heappop(finished)[1]].step_id
+            for child in graph.children[step_id]:
+                missing[child] -= 1
+                if missing[child] == 0:
+                    heappush(ready,(-tail[child],order[child]))
+
+        if not ready:
+            #nothing to do for this worker until the next step is finished
+            heapreplace(free,(finished[0][0],worker))
+            continue
+
+        step_id = graph.steps[heappop(ready)[1]].step_id
+        stop = time + times[step_id][0]
+        scheduled.append(dict(
+            step_id=step_id,
+            start = dict(seconds=int(time)),
+            stop = dict(seconds=int(stop)),
+            waiting = dict(seconds=int(stop + times[step_id][1])),
+            worker = worker,
+            step_idx = len(scheduled)
+        ))
+        heapreplace(free,(stop,worker))
+        heappush(finished,(stop + times[step_id][1],order[step_id]))
+
+    return scheduled
+
+def tool_demand(graph, store):
+    """
+    Return the number of each tool that is required by the steps of the
+    graph. Optional tools and tools that are created in a step are not
+    required.
+
+    :rtype: :class:`dict` mapping step ids to :class:`dict` of
+            :ref:`jsonschema-members-common-json-obj_id` and quantities
+    """
+    res = {}
+    for ref in graph.steps:
+        demand = res[ref.step_id] = {}
+        for tool in store.get_step(ref.step_id).tools.values():
+            if tool.optional or tool.created:
+                continue
+            demand[tool.obj_id] = demand.get(tool.obj_id,0) + tool.quantity
+    return res
+
+def schedule_tools(graph, store, available=None, workers=2, targets = None):
+    """
+    Scheduler that distributes the steps over several workers like
+    :func:`schedule_parallel`, but only starts a step when enough of each
+    of its tools is free. Tools are occupied for the duration of a step, but
+    not during its waiting time.
+
+    A step that has to wait for a tool is parked until that tool is
+    returned, so steps are not checked again at every event. In the
+    meantime, steps with lower priority are started if their tools are
+    available.
+
+    available is a dict mapping obj_ids of tools to the available quantity.
+    By default, as many of each tool are available as a single step
+    requires.
+
+    if targets is not given, schedules full graph
+
+    :return: the scheduled steps and a dict mapping the obj_id of each tool to
+             a dict with the available and the maximal used quantity, the
+             number of times a step had to wait for the tool and the total
+             delay caused in seconds.
+    :raises: :class:`ValueError` if a step requires more of a tool than
+             available
+    """
+    # pylint: disable=R0912,R0914,R0915
+    graph = graph.subgraph(targets)
+    times = graph.step_times(store)
+    tail = graph.critical_path(store)["tail"]
+    demand = tool_demand(graph,store)
+
+    free_tools = {}
+    for tools in demand.values():
+        for obj_id,quantity in tools.iteritems():
+            free_tools[obj_id] = max(free_tools.get(obj_id,0),quantity)
+    if not available is None:
+        for obj_id in free_tools:
+            if free_tools[obj_id] > available.get(obj_id,0):
+                raise ValueError("Not enough of tool %s available" % obj_id)
+            free_tools[obj_id] = available[obj_id]
+    report = dict((obj_id,dict(
+        available=quantity,
+        used=0,
+        delays=0,
+        seconds=0
+    )) for obj_id,quantity in free_tools.iteritems())
+
+    order = dict((ref.step_id,i) for i,ref in enumerate(graph.steps))
+    missing = dict((ref.step_id,len(ref.requires)) for ref in graph.steps)
+    ready = []
+    for ref in graph.steps:
+        if not ref.requires:
+            heappush(ready,(-tail[ref.step_id],order[ref.step_id]))
+    #steps waiting for a tool, and since when and for which tool they wait
+    parked = dict((obj_id,[]) for obj_id in free_tools)
+    blocked = {}
+
+    #events are (time,order,worker), where worker is None for the end of
+    #the waiting time of the step, otherwise for the end of its activity
+    events = []
+    free_workers = range(workers)
+    scheduled = []
+    time = 0
+    while len(scheduled) < len(graph.steps):
+        while events and events[0][0] <= time:
+            _,idx,worker = heappop(events)
+            step_id = graph.steps[idx].step_id
+            if worker is None:
+                for child in graph.children[step_id]:
+                    missing[child] -= 1
+                    if missing[child] == 0:
+                        heappush(ready,(-tail[child],order[child]))
+                continue
+            heappush(free_workers,worker)
+            for obj_id,quantity in demand[step_id].iteritems():
+                free_tools[obj_id] += quantity
+                for item in parked[obj_id]:
+                    heappush(ready,item)
+                parked[obj_id] = []
+
+        while ready and free_workers:
+            item = heappop(ready)
+            step_id = graph.steps[item[1]].step_id
+            for obj_id,quantity in demand[step_id].iteritems():
+                if free_tools[obj_id] < quantity:
+                    parked[obj_id].append(item)
+                    if not step_id in blocked:
+                        blocked[step_id] = (time,obj_id)
+                        report[obj_id]["delays"] += 1
+                    break
+            else:
+                for obj_id,quantity in demand[step_id].iteritems():
+                    free_tools[obj_id] -= quantity
+                    report[obj_id]["used"] = max(
+                        report[obj_id]["used"],
+                        report[obj_id]["available"] - free_tools[obj_id]
+                    )
+                if step_id in blocked:
+                    since, obj_id = blocked[step_id]
+                    report[obj_id]["seconds"] += time - since
+                worker = heappop(free_workers)
+                stop = time + times[step_id][0]
+                scheduled.append(dict(
+                    step_id=step_id,
+                    start = dict(seconds=int(time)),
+                    stop = dict(seconds=int(stop)),
+                    waiting = dict(seconds=int(stop + times[step_id][1])),
+                    worker = worker,
+                    step_idx = len(scheduled)
+                ))
+                heappush(events,(stop,item[1],worker))
+                heappush(events,(stop + times[step_id][1],item[1],None))
+
+        if events:
+            time = events[0][0]
+
+    return scheduled, report
+
+def wip_delta(graph, store):
+    """
+    Return by how much each step of the graph changes the number of
+    intermediate objects, i.e. objects that are created as results in one
+    step of the graph and consumed as parts in another.
+
+    :rtype: :class:`dict` mapping step ids to :class:`int`
+    """
+    created = set([])
+    consumed = set([])
+    steps = {}
+    for ref in graph.steps:
+        step = steps[ref.step_id] = store.get_step(ref.step_id)
+        for obj in step.results.values():
+            created.add(obj.obj_id)
+        for obj in step.parts.values():
+            consumed.add(obj.obj_id)
+    intermediate = created & consumed
+
+    res = {}
+    for step_id,step in steps.iteritems():
+        delta = 0
+        for obj in step.results.values() + step.parts.values():
+            if not obj.obj_id in intermediate:
+                continue
+            if obj.created:
+                delta += obj.quantity
+            elif not obj.optional:
+                delta -= obj.quantity
+        res[step_id] = delta
+    return res
+
+def schedule_min_wip(graph, store, targets = None):
+    """
+    Scheduler that tries to keep the number of intermediate objects, that
+    were created but not yet consumed, low at every time. This determines
+    how much storage and bench space is needed during assembly.
+
+    From the steps whose prerequisites are fulfilled, it greedily chooses
+    the step that decreases the number of intermediate objects the most.
+    As a lookahead, a step also gets the benefit of the best step that it
+    is the last missing prerequisite of. On tree shaped assemblies, this
+    completes subassemblies before new ones are started.
+
+    Steps are carried out one after another. If all steps have timing
+    information, a step starts as soon as the previous one is finished and
+    its prerequisites are finished with their waiting time.
+
+    if targets is not given, schedules full graph
+
+    :return: the scheduled steps and a list with the number of intermediate
+             objects after each step
+    """
+    graph = graph.subgraph(targets)
+    delta = wip_delta(graph,store)
+    order = dict((ref.step_id,i) for i,ref in enumerate(graph.steps))
+    missing = dict((ref.step_id,len(ref.requires)) for ref in graph.steps)
+    done = set([])
+
+    def score(step_id):
+        " priority of a step whose prerequisites are fulfilled "
+        bonus = 0
+        for child in graph.children[step_id]:
+            if missing[child] == 1:
+                bonus = min(bonus,delta[child])
+        return (delta[step_id] + bonus,order[step_id])
+
+    #lazy heap of (score,order), outdated entries are skipped
+    current = {}
+    ready = []
+    for ref in graph.steps:
+        if not ref.requires:
+            current[ref.step_id] = score(ref.step_id)
+            heappush(ready,current[ref.step_id])
+
+    sequence = []
+    profile = []
+    while ready:
+        item = heappop(ready)
+        step_id = graph.steps[item[1]].step_id
+        if step_id in done or current[step_id] != item:
+            continue
+        done.add(step_id)
+        sequence.append(step_id)
+        profile.append((profile[-1] if profile else 0) + delta[step_id])
+
+        for child in graph.children[step_id]:
+            missing[child] -= 1
+            if missing[child] == 0:
+                current[child] = score(child)
+                heappush(ready,current[child])
+            elif missing[child] == 1:
+                #the last missing prerequisite gets the lookahead bonus
+                for parent in graph.parents[child]:
+                    if parent in done or missing[parent] > 0:
+                        continue
+                    current[parent] = score(parent)
+                    heappush(ready,current[parent])
+
+    if len(sequence) < len(graph.steps):
+        raise ValueError("Graph contains cycles or unknown prerequisites")
+
+    return _sequential_times(graph,store,sequence), profile
+
+def _sequential_times(graph, store, sequence):
+    """
+    Return scheduled steps for the steps with ids in sequence, carried out
+    one after another. If all steps are timed, waiting times are overlapped
+    with the following steps where the dependencies allow.
+    """
+    try:
+        times = graph.step_times(store)
+    except ValueError:
+        return [
+            dict(step_id=step_id,step_idx=idx)
+            for idx,step_id in enumerate(sequence)
+        ]
+
+    res = []
+    time = 0
+    waiting = {}
+    for idx,step_id in enumerate(sequence):
+        for parent in graph.parents[step_id]:
+            time = max(time,waiting[parent])
+        stop = time + times[step_id][0]
+        waiting[step_id] = stop + times[step_id][1]
+        res.append(dict(
+            step_id=step_id,
+            start = dict(seconds=int(time)),
+            stop = dict(seconds=int(stop)),
+            waiting = dict(seconds=int(waiting[step_id])),
+            step_idx = idx
+        ))
+        time = stop
+    return res
+
+class _BudgetExceeded(Exception):
+    """
+    Raised when the branch and bound search runs out of nodes or time
+    """
+    pass
+
+class _BranchAndBound(object):
+    """
+    State of the search of schedule_optimal. Steps are identified by their
+    position in a topological order.
+    """
+    # pylint: disable=R0902
+    def __init__(self,graph,store,max_nodes,max_seconds):
+        self.ids = graph.topological_sort()
+        pos = dict((step_id,i) for i,step_id in enumerate(self.ids))
+        self.parents = [[pos[p] for p in graph.parents[s]] for s in self.ids]
+        self.children = [[pos[c] for c in graph.children[s]] for s in self.ids]
+        times = graph.step_times(store)
+        self.duration = [times[s][0] for s in self.ids]
+        self.waiting = [times[s][1] for s in self.ids]
+        tail = graph.critical_path(store)["tail"]
+        self.tail = [tail[s] for s in self.ids]
+
+        self.max_nodes = max_nodes
+        self.deadline = None
+        if not max_seconds is None:
+            self.deadline = clock() + max_seconds
+        self.nodes = 0
+        self.memo = {}
+
+        #the current partial schedule
+        self.mask = 0
+        self.missing = [len(p) for p in self.parents]
+        self.ends = [None]*len(self.ids)
+        self.sequence = []
+
+        #the best complete schedule
+        self.best = None
+        self.best_sequence = None
+
+    def start(self,idx,now):
+        """
+        Earliest start of the step idx if the worker is free at now
+        """
+        for parent in self.parents[idx]:
+            now = max(now,self.ends[parent])
+        return now
+
+    def frontier(self,now,end):
+        """
+        Everything about the scheduled steps that matters for the remaining
+        steps, relative to now
+        """
+        res = [max(0,end - now)]
+        for idx in self.sequence:
+            if self.ends[idx] > now and \
+                    any(self.ends[c] is None for c in self.children[idx]):
+                res.append((idx,self.ends[idx] - now))
+        return tuple(res)
+
+    def search(self,now,end,remaining,ready):
+        """
+        Recursively try all orders of the steps in ready and their
+        successors, where the worker is free at now, the latest step ends at
+        end and remaining is the total duration of all unscheduled steps.
+        """
+        self.nodes += 1
+        if self.nodes > self.max_nodes:
+            raise _BudgetExceeded()
+        if not self.deadline is None and self.nodes % 1000 == 0 and \
+                clock() > self.deadline:
+            raise _BudgetExceeded()
+
+        if not ready:
+            if self.best is None or end < self.best:
+                self.best = end
+                self.best_sequence = [
+                    (i,self.ends[i] - self.waiting[i] - self.duration[i])
+                    for i in self.sequence
+                ]
+            return
+
+        cands = [(self.start(i,now),i) for i in ready]
+        bound = max(end,now + remaining)
+        for start,idx in cands:
+            bound = max(bound,start + self.tail[idx])
+        if not self.best is None and bound >= self.best:
+            return
+
+        key = (self.mask,self.frontier(now,end))
+        if self.memo.get(key,bound + 1) <= now:
+            return
+        self.memo[key] = now
+
+        #promising steps first, to find good schedules early
+        cands.sort(key=lambda x: (x[0] - self.tail[x[1]],x[1]))
+        for start,idx in cands:
+            stop = start + self.duration[idx]
+            self.ends[idx] = stop + self.waiting[idx]
+            self.mask |= 1 << idx
+            self.sequence.append(idx)
+            new_ready = [i for i in ready if i != idx]
+            for child in self.children[idx]:
+                self.missing[child] -= 1
+                if self.missing[child] == 0:
+                    new_ready.append(child)
+
+            self.search(
+                stop,
+                max(end,self.ends[idx]),
+                remaining - self.duration[idx],
+                new_ready
+            )
+
+            for child in self.children[idx]:
+                self.missing[child] += 1
+            self.sequence.pop()
+            self.mask &= ~(1 << idx)
+            self.ends[idx] = None
+
+def schedule_optimal(graph, store, targets = None,
+                     max_nodes=100000, max_seconds=None):
+    """
+    Scheduler that finds a schedule with minimal total time for a single
+    worker, where waiting times can overlap with other steps, by branch and
+    bound.
+
+    Partial schedules are pruned when a lower bound from the critical path
+    of the remaining steps or their total duration exceeds the best known
+    schedule, which is initially the one of :func:`schedule_parallel` for a
+    single worker. Partial schedules with the same set of scheduled steps
+    and the same waiting times still in effect are only explored further
+    if they are earlier than before.
+
+    The search stops after max_nodes partial schedules or max_seconds
+    seconds, and returns the best schedule found so far.
+
+    if targets is not given, schedules full graph
+
+    :return: the scheduled steps and a dict with the makespan in seconds,
+             whether it is known to be optimal and the number of nodes
+             searched
+    """
+    graph = graph.subgraph(targets)
+    search = _BranchAndBound(graph,store,max_nodes,max_seconds)
+
+    initial = schedule_parallel(graph,store,workers=1)
+    pos = dict((step_id,i) for i,step_id in enumerate(search.ids))
+    search.best = max([0] + [step["waiting"]["seconds"] for step in initial])
+    search.best_sequence = [
+        (pos[step["step_id"]],step["start"]["seconds"]) for step in initial
+    ]
+
+    optimal = True
+    try:
+        search.search(
+            0,
+            0,
+            sum(search.duration),
+            [i for i,p in enumerate(search.parents) if not p]
+        )
+    except _BudgetExceeded:
+        optimal = False
+
+    scheduled = []
+    for idx,start in search.best_sequence:
+        stop = start + search.duration[idx]
+        scheduled.append(dict(
+            step_id=search.ids[idx],
+            start = dict(seconds=int(start)),
+            stop = dict(seconds=int(stop)),
+            waiting = dict(seconds=int(stop + search.waiting[idx])),
+            step_idx = len(scheduled)
+        ))
+    return scheduled, dict(
+        makespan=search.best,
+        optimal=optimal,
+        nodes=search.nodes
+    )
 
 def schedule_greedy(graph, store, targets = None):
     """
@@ -292,16 +840,10 @@ def schedule_greedy(graph, store, targets = None):
 
     if targets is not given, schedules full graph
     """
+    _check_structure(graph,targets)
 
-    #find set of steps required for target
-    if targets is None:
-        steps = graph.steps
-    else:
-        steps = set([])
-        for target in targets:
-            steps.add(target)
-            steps.update(graph.all_ancestors(target))
-        steps = dict((key,graph.steps[key]) for key in steps)
+    graph = graph.subgraph(targets)
+    steps = graph.steps
 
     for step in steps:
         step_dict = step.dereference(store)
@@ -359,3 +901,79 @@ def schedule_greedy(graph, store, targets = None):
         possible.pop(cand.step_id)
 
     return sorted(scheduled.values(),key=lambda x: x["step_idx"])
+
+def _scheduled_dict(ref):
+    """
+    Return the data of the ScheduleStep ref in the format returned by
+    schedulers
+    """
+    # pylint: disable=W0212
+    res = dict(step_id=ref.step_id,step_idx=ref.step_idx)
+    if "worker" in ref._kwargs:
+        res["worker"] = ref.worker
+    if not ref.stop is None:
+        res["start"] = dict(seconds=int(
+            ref.start.total_seconds() if ref.start else 0
+        ))
+        res["stop"] = dict(seconds=int(ref.stop.total_seconds()))
+    if not ref.waiting is None:
+        res["waiting"] = dict(seconds=int(ref.waiting.total_seconds()))
+    return res
+
+def reschedule(schedule, old_graph, new_graph, store,
+               scheduler=schedule_greedy):
+    """
+    Update a schedule for old_graph after new_graph was derived from it.
+    As ids are content hashes, a step is affected by the changes if it was
+    removed, or if its prerequisites changed. The steps of the schedule
+    before the first affected step are kept, only the remaining steps of
+    new_graph are scheduled again with scheduler, which can be any scheduler
+    that returns just a list of steps. These are started after the kept
+    steps and their waiting times are finished.
+
+    :return: the scheduled steps and a dict with the number of kept steps
+             and the lists of ids of added, removed and rescheduled steps
+    """
+    old_requires = dict((ref.step_id,ref.requires) for ref in old_graph.steps)
+    new_requires = dict((ref.step_id,ref.requires) for ref in new_graph.steps)
+
+    kept = []
+    for ref in schedule.steps:
+        if new_requires.get(ref.step_id) != old_requires.get(ref.step_id):
+            break
+        kept.append(_scheduled_dict(ref))
+    kept_ids = set(step["step_id"] for step in kept)
+
+    remaining = [ref for ref in new_graph.steps if not ref.step_id in kept_ids]
+    result = list(kept)
+    if remaining:
+        offset = 0
+        for step in kept:
+            for key in ["stop","waiting"]:
+                if key in step:
+                    offset = max(offset,step[key]["seconds"])
+        steps = [dict(
+            step_id=ref.step_id,
+            requires=[req for req in ref.requires if not req in kept_ids]
+        ) for ref in remaining]
+        graph = Graph(
+            graph_id=Graph.calculate_checksum(steps=steps),
+            steps=steps
+        )
+        for step in scheduler(graph,store):
+            step["step_idx"] += len(kept)
+            for key in ["start","stop","waiting"]:
+                if key in step:
+                    step[key] = dict(seconds=int(
+                        timedelta(**step[key]).total_seconds() + offset
+                    ))
+            result.append(step)
+
+    return result, dict(
+        kept=len(kept),
+        added=[s for s in new_requires if not s in old_requires],
+        removed=[s for s in old_requires if not s in new_requires],
+        rescheduled=[
+            ref.step_id for ref in remaining if ref.step_id in old_requires
+        ]
+    )
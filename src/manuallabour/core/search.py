@@ -0,0 +1,194 @@
+# Manual labour - a library for step-by-step instructions
+# Copyright (C) 2014 Johannes Reinhardt <jreinhardt@ist-dein-freund.de>
+#
+#  This library is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public
+#  License as published by the Free Software Foundation; either
+#  version 2.1 of the License, or any later version.
+#
+#  This library is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#  Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public
+#  License along with this library; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#  USA
+
+"""
+This module provides full text search over the steps and objects in a store.
+"""
+
+import re
+from bisect import bisect_left
+from math import log
+
+from manuallabour.core.common import intern_id
+
+FIELDS = dict(
+    step=["title","description","attention","assertions"],
+    obj=["name","description"]
+)
+"""Fields of steps and objects that are indexed"""
+
+_MARKUP = re.compile(r'\{\{.*?\}\}')
+_WORD = re.compile(r'\w+',re.UNICODE)
+
+def tokenize(text):
+    """
+    Split text into lower case terms. Markup is ignored.
+
+    :rtype: :class:`list` of :class:`unicode`
+    """
+    return _WORD.findall(_MARKUP.sub(' ',text).lower())
+
+class SearchIndex(object):
+    """
+    Inverted index over the text fields of steps and objects. Components are
+    added one by one, e.g. by a
+    :class:`~manuallabour.core.stores.LocalMemoryStore` that was created with
+    a SearchIndex.
+
+    Documents are identified by their kind, "step" or "obj", and their id.
+    """
+    def __init__(self):
+        #map terms to dicts mapping documents to term frequencies
+        self.postings = {}
+        #map documents to their number of terms
+        self.lengths = {}
+        #sorted list of all terms, rebuilt lazily for prefix queries
+        self._terms = None
+
+    def _add(self,kind,doc_id,component):
+        doc = (kind,doc_id)
+        if doc in self.lengths:
+            raise KeyError('Document already in index: %s %s' % doc)
+        texts = []
+        for field in FIELDS[kind]:
+            value = getattr(component,field)
+            if isinstance(value,list):
+                texts.extend(value)
+            else:
+                texts.append(value)
+        length = 0
+        for text in texts:
+            for term in tokenize(text):
+                length += 1
+                if not term in self.postings:
+                    self.postings[term] = {}
+                    self._terms = None
+                docs = self.postings[term]
+                docs[doc] = docs.get(doc,0) + 1
+        self.lengths[doc] = length
+
+    def add_step(self,step):
+        """
+        Add the step to the index
+        """
+        self._add("step",step.step_id,step)
+
+    def add_obj(self,obj):
+        """
+        Add the object to the index
+        """
+        self._add("obj",obj.obj_id,obj)
+
+    def terms(self,prefix):
+        """
+        Return all terms in the index that start with prefix in
+        alphabetical order.
+
+        :rtype: :class:`list` of :class:`unicode`
+        """
+        if self._terms is None:
+            self._terms = sorted(self.postings)
+        prefix = prefix.lower()
+        res = []
+        for idx in xrange(bisect_left(self._terms,prefix),len(self._terms)):
+            if not self._terms[idx].startswith(prefix):
+                break
+            res.append(self._terms[idx])
+        return res
+
+    def search(self,query,prefix=False,kind=None,limit=None):
+        """
+        Search for documents that contain all terms of query. If prefix is
+        True, each term of the query matches all terms starting with it.
+        The results can be restricted to a kind of document.
+
+        Results are ranked by the sum of the tf-idf weights of the matched
+        terms, best matches first.
+
+        :return: list of tuples of kind, id and score
+        :rtype: :class:`list` of :class:`tuple`
+        """
+        n_docs = len(self.lengths)
+        scores = None
+        for word in tokenize(query):
+            if prefix:
+                terms = self.terms(word)
+            else:
+                terms = [word] if word in self.postings else []
+            word_scores = {}
+            for term in terms:
+                docs = self.postings[term]
+                idf = log(float(n_docs)/len(docs)) + 1.
+                for doc,freq in docs.iteritems():
+                    if kind is not None and doc[0] != kind:
+                        continue
+                    weight = idf*freq/self.lengths[doc]
+                    word_scores[doc] = word_scores.get(doc,0.) + weight
+            if scores is None:
+                scores = word_scores
+            else:
+                scores = dict(
+                    (doc,score + word_scores[doc])
+                    for doc,score in scores.iteritems() if doc in word_scores
+                )
+            if not scores:
+                return []
+        if scores is None:
+            return []
+        res = sorted(((-score,doc) for doc,score in scores.iteritems()))
+        if limit is not None:
+            res = res[:limit]
+        return [(doc[0],doc[1],-score) for score,doc in res]
+
+    def as_dict(self):
+        """
+        Return the content of the index as JSON like data, from which it can
+        be recreated with :meth:`from_dict`. The postings of each term are
+        stored as a string of numbers, which is much faster to load than
+        nested lists.
+
+        :rtype: :class:`dict`
+        """
+        docs = sorted(self.lengths)
+        numbers = dict((doc,idx) for idx,doc in enumerate(docs))
+        postings = {}
+        for term,freqs in self.postings.iteritems():
+            postings[term] = ' '.join(
+                '%d %d' % (numbers[doc],freq) for doc,freq in freqs.iteritems()
+            )
+        return dict(
+            kinds=' '.join(k for k,_ in docs),
+            ids=[d for _,d in docs],
+            lengths=' '.join('%d' % self.lengths[doc] for doc in docs),
+            postings=postings
+        )
+
+    @classmethod
+    def from_dict(cls,data):
+        """
+        Recreate an index from the data returned by :meth:`as_dict`.
+        """
+        index = cls()
+        docs = zip(data["kinds"].split(),[intern_id(d) for d in data["ids"]])
+        index.lengths = \
+            dict(zip(docs,[int(num) for num in data["lengths"].split()]))
+        for term,numbers in data["postings"].iteritems():
+            numbers = [int(num) for num in numbers.split()]
+            index.postings[term] = \
+                dict(zip([docs[i] for i in numbers[::2]],numbers[1::2]))
+        return index
@@ -0,0 +1,286 @@
+# Manual labour - a library for step-by-step instructions
+# Copyright (C) 2014 Johannes Reinhardt <jreinhardt@ist-dein-freund.de>
+#
+#  This library is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public
+#  License as published by the Free Software Foundation; either
+#  version 2.1 of the License, or any later version.
+#
+#  This library is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#  Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public
+#  License along with this library; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#  USA
+
+"""
+This module defines a compact binary format to store components and whole
+stores.
+
+The format encodes JSON like data similar to msgpack. Every string is only
+stored once, later occurrences refer to the first one, which makes ids and
+field names cheap. The data is followed by its sha512 checksum, which is
+verified when loading.
+
+Documents written from components, which were validated when they were
+created, start with a different marker than documents with arbitrary data.
+Only for such documents the components can be loaded without validating
+them again, if the data is trusted.
+"""
+
+import hashlib
+from struct import Struct
+
+from manuallabour.core.common import Object, Step, trusted_data
+from manuallabour.core.graph import Graph
+from manuallabour.core.schedule import Schedule
+from manuallabour.core.search import SearchIndex
+from manuallabour.core.stores import LocalMemoryStore
+
+MAGIC = 'MLB1'
+"""Marker at the start of the binary format"""
+
+VALIDATED_MAGIC = 'MLV1'
+"""Marker at the start of documents written from validated components"""
+
+COMPONENTS = dict(
+    Object=Object,
+    Step=Step,
+    Graph=Graph,
+    Schedule=Schedule
+)
+"""Component classes that can be serialized, by name"""
+
+_UINT = Struct('<I')
+_INT = Struct('<q')
+_FLOAT = Struct('<d')
+_DIGEST_SIZE = hashlib.sha512().digest_size
+
+class _Encoder(object):
+    """
+    Encoder for a single document
+    """
+    def __init__(self,magic=MAGIC):
+        self.parts = [magic]
+        self.strings = {}
+
+    def encode(self,value):
+        """
+        Append the encoding of value
+        """
+        # pylint: disable=R0912
+        parts = self.parts
+        if isinstance(value,basestring):
+            if value in self.strings:
+                parts.append('r' + _UINT.pack(self.strings[value]))
+            else:
+                self.strings[value] = len(self.strings)
+                if isinstance(value,unicode):
+                    value = value.encode('utf8')
+                parts.append('s' + _UINT.pack(len(value)))
+                parts.append(value)
+        elif value is None:
+            parts.append('N')
+        elif value is True:
+            parts.append('T')
+        elif value is False:
+            parts.append('F')
+        elif isinstance(value,(int,long)):
+            parts.append('i' + _INT.pack(value))
+        elif isinstance(value,float):
+            parts.append('f' + _FLOAT.pack(value))
+        elif isinstance(value,(list,tuple)):
+            parts.append('l' + _UINT.pack(len(value)))
+            for item in value:
+                self.encode(item)
+        elif isinstance(value,dict):
+            parts.append('d' + _UINT.pack(len(value)))
+            for key,item in value.iteritems():
+                self.encode(key)
+                self.encode(item)
+        else:
+            raise ValueError("Can not serialize type %s" % type(value))
+
+    def result(self):
+        """
+        Return the encoded document with its checksum
+        """
+        data = ''.join(self.parts)
+        return data + hashlib.sha512(data).digest()
+
+class _Decoder(object):
+    """
+    Decoder for a single document
+    """
+    def __init__(self,data):
+        magic = data[:len(MAGIC)]
+        if not magic in (MAGIC,VALIDATED_MAGIC) or \
+                len(data) < len(MAGIC) + _DIGEST_SIZE:
+            raise ValueError("Not a manual labour binary document")
+        #whether the document was written from validated components
+        self.validated = magic == VALIDATED_MAGIC
+        self.data = data[:-_DIGEST_SIZE]
+        if hashlib.sha512(self.data).digest() != data[-_DIGEST_SIZE:]:
+            raise ValueError("Checksum mismatch, the data is corrupted")
+        self.pos = len(MAGIC)
+        self.strings = []
+
+    def _uint(self):
+        value, = _UINT.unpack_from(self.data,self.pos)
+        self.pos += _UINT.size
+        return value
+
+    def decode(self):
+        """
+        Decode the next value
+        """
+        # pylint: disable=R0911
+        tag = self.data[self.pos]
+        self.pos += 1
+        if tag == 'r':
+            return self.strings[self._uint()]
+        elif tag == 's':
+            length = self._uint()
+            value = self.data[self.pos:self.pos+length].decode('utf8')
+            self.pos += length
+            self.strings.append(value)
+            return value
+        elif tag == 'd':
+            res = {}
+            for _ in xrange(self._uint()):
+                key = self.decode()
+                res[key] = self.decode()
+            return res
+        elif tag == 'l':
+            return [self.decode() for _ in xrange(self._uint())]
+        elif tag == 'i':
+            value, = _INT.unpack_from(self.data,self.pos)
+            self.pos += _INT.size
+            return value
+        elif tag == 'f':
+            value, = _FLOAT.unpack_from(self.data,self.pos)
+            self.pos += _FLOAT.size
+            return value
+        elif tag == 'N':
+            return None
+        elif tag == 'T':
+            return True
+        elif tag == 'F':
+            return False
+        raise ValueError("Unknown tag %r at position %d" % (tag,self.pos - 1))
+
+def dumps(value):
+    """
+    Serialize the JSON like data value.
+
+    :rtype: :class:`str`
+    """
+    encoder = _Encoder()
+    encoder.encode(value)
+    return encoder.result()
+
+def loads(data):
+    """
+    Deserialize data that was serialized by :func:`dumps`.
+
+    :raises: :class:`ValueError` if the data is corrupted
+    """
+    return _Decoder(data).decode()
+
+def _dumps_validated(value):
+    encoder = _Encoder(VALIDATED_MAGIC)
+    encoder.encode(value)
+    return encoder.result()
+
+def _loads_validated(data):
+    """
+    Return the deserialized data and whether it was written from validated
+    components.
+    """
+    decoder = _Decoder(data)
+    return decoder.decode(), decoder.validated
+
+def _component_data(component):
+    return [type(component).__name__,component.as_dict()]
+
+def _component(data):
+    name, kwargs = data
+    return COMPONENTS[name](**kwargs)
+
+def dump_component(component):
+    """
+    Serialize a component.
+
+    :rtype: :class:`str`
+    """
+    return _dumps_validated(_component_data(component))
+
+def load_component(data,trusted=False):
+    """
+    Deserialize a component serialized with :func:`dump_component`. If
+    trusted is True, the component is not validated again. Data that was
+    not written by :func:`dump_component`, e.g. by :func:`dumps`, is always
+    validated.
+    """
+    data, validated = _loads_validated(data)
+    if trusted and validated:
+        with trusted_data():
+            return _component(data)
+    return _component(data)
+
+def dump_store(store,fid):
+    """
+    Serialize the blobs, objects, steps and graphs of a
+    :class:`~manuallabour.core.stores.LocalMemoryStore` to the file like
+    object fid. The index of references in the store is not stored, it is
+    rebuilt while loading. The search index of the store is stored, so it
+    does not need to be rebuilt.
+    """
+    data = dict(
+        blobs=store.paths,
+        objects=[_component_data(obj) for _,obj in store.iter_obj()],
+        steps=[_component_data(step) for _,step in store.iter_step()],
+        graphs=[_component_data(graph) for _,graph in store.iter_graph()]
+    )
+    if store.search_index is not None:
+        data["search_index"] = store.search_index.as_dict()
+    fid.write(_dumps_validated(data))
+
+def load_store(fid,store=None,trusted=False):
+    """
+    Load the content serialized by :func:`dump_store` from the file like
+    object fid into store, or a new
+    :class:`~manuallabour.core.stores.LocalMemoryStore`. If trusted is True,
+    the components are not validated again. Data that was not written by
+    :func:`dump_store`, e.g. by :func:`dumps`, is always validated.
+
+    A new store gets the stored search index, if there is one. A given store
+    keeps its own search index, which is updated as usual.
+
+    :return: the store
+    """
+    data, validated = _loads_validated(fid.read())
+    restore_index = store is None and "search_index" in data
+    if store is None:
+        store = LocalMemoryStore()
+    if trusted and validated:
+        with trusted_data():
+            _fill_store(store,data)
+    else:
+        _fill_store(store,data)
+    if restore_index:
+        store.search_index = SearchIndex.from_dict(data["search_index"])
+    return store
+
+def _fill_store(store,data):
+    for blob_id,path in data["blobs"].iteritems():
+        store.add_blob(blob_id,path)
+    for obj in data["objects"]:
+        store.add_obj(_component(obj))
+    for step in data["steps"]:
+        store.add_step(_component(step))
+    for graph in data.get("graphs",[]):
+        store.add_graph(_component(graph))
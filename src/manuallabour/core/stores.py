@@ -22,6 +22,9 @@ This module defines the Store interface and provides various implementations
 
 from os.path import abspath
 
+import manuallabour.core.instrumentation as instrumentation
+from manuallabour.core.common import intern_id
+
 
 class Store(object):
     """
@@ -73,23 +76,86 @@ class Store(object):
         Iterate over all (step_id,step) tuples
         """
         raise NotImplementedError
+    def has_graph(self,graph_id):
+        """
+        Return whether a graph with the given graph_id is stored in this
+        Store.
+        """
+        raise NotImplementedError
+    def get_graph(self,graph_id):
+        """
+        Return the Graph for this key. Raise KeyError if key is not known.
+        """
+        raise NotImplementedError
+    def iter_graph(self):
+        """
+        Iterate over all (graph_id,graph) tuples
+        """
+        raise NotImplementedError
+    def steps_using_obj(self,obj_id):
+        """
+        Return a list of the ids of all steps that refer to the object with
+        the given obj_id as part, tool or result.
+        """
+        raise NotImplementedError
+    def objs_using_blob(self,blob_id):
+        """
+        Return a list of the ids of all objects that refer to the blob with
+        the given blob_id in an image or a sourcefile.
+        """
+        raise NotImplementedError
+    def steps_using_blob(self,blob_id):
+        """
+        Return a list of the ids of all steps that directly refer to the blob
+        with the given blob_id in an image, a file or a sourcefile.
+        """
+        raise NotImplementedError
+    def graphs_using_step(self,step_id):
+        """
+        Return a list of the ids of all graphs that contain the step with the
+        given step_id.
+        """
+        raise NotImplementedError
+    def markup_step(self,step_id,markup):
+        """
+        Return a dict with the description and the attention of the step
+        with the given step_id, marked up with the Markup object markup.
+        """
+        step = self.get_step(step_id)
+        return dict(
+            description=markup.markup(step,self,step.description),
+            attention=markup.markup(step,self,step.attention)
+        )
 
 
 class LocalMemoryStore(Store):
     """
     Store that stores resource and object data in memory and the local file
     system for files.
+
+    An index of the references between the stored items is maintained while
+    they are added, so that the users of an object, blob or step can be
+    looked up quickly. If a :class:`~manuallabour.core.search.SearchIndex`
+    is passed as search_index, the added steps and objects are added to it.
     """
-    def __init__(self):
+    def __init__(self,search_index=None):
+        self.search_index = search_index
         self.objects = {}
         self.paths = {}
         self.steps = {}
+        self.graphs = {}
+        #reverse references, map ids to sets of ids of their users
+        self.obj_steps = {}
+        self.blob_objs = {}
+        self.blob_steps = {}
+        self.step_graphs = {}
     def has_blob(self,blob_id):
         return blob_id in self.paths
     def iter_blob(self):
         for blob_id in self.paths:
             yield blob_id
     def get_blob_url(self,blob_id):
+        instrumentation.count("store.get_blob_url")
         return "file://%s" % self.paths[blob_id]
     def add_blob(self,blob_id,path):
         """
@@ -97,10 +163,11 @@ class LocalMemoryStore(Store):
         """
         if blob_id in self.paths:
             raise KeyError('BlobID already found in Store: %s' % blob_id)
-        self.paths[blob_id] = abspath(path)
+        self.paths[intern_id(blob_id)] = abspath(path)
     def has_obj(self,key):
         return key in self.objects
     def get_obj(self,key):
+        instrumentation.count("store.get_obj")
         return self.objects[key]
     def iter_obj(self):
         return self.objects.iteritems()
@@ -111,10 +178,15 @@ class LocalMemoryStore(Store):
         if obj.obj_id in self.objects:
             raise KeyError('ObjectID already found in store: %s' % obj.obj_id)
         self.objects[obj.obj_id] = obj
+        if self.search_index is not None:
+            self.search_index.add_obj(obj)
+        for img in obj.images:
+            _add_users(self.blob_objs,_resource_blobs(img),obj.obj_id)
 
     def has_step(self,key):
         return key in self.steps
     def get_step(self,key):
+        instrumentation.count("store.get_step")
         return self.steps[key]
     def iter_step(self):
         return self.steps.iteritems()
@@ -125,3 +197,137 @@ class LocalMemoryStore(Store):
         if step.step_id in self.steps:
             raise KeyError('StepID already found in store: %s' % step.step_id)
         self.steps[step.step_id] = step
+        if self.search_index is not None:
+            self.search_index.add_step(step)
+        for nspace in [step.parts,step.tools,step.results]:
+            _add_users(
+                self.obj_steps,
+                [ref.obj_id for ref in nspace.values()],
+                step.step_id
+            )
+        for nspace in [step.images,step.files]:
+            for res in nspace.values():
+                _add_users(self.blob_steps,_resource_blobs(res),step.step_id)
+
+    def has_graph(self,graph_id):
+        return graph_id in self.graphs
+    def get_graph(self,graph_id):
+        return self.graphs[graph_id]
+    def iter_graph(self):
+        return self.graphs.iteritems()
+    def add_graph(self,graph):
+        """
+        Add a new graph to the store. Checks for collisions
+        """
+        graph_id = graph.graph_id
+        if graph_id in self.graphs:
+            raise KeyError('GraphID already found in store: %s' % graph_id)
+        self.graphs[graph_id] = graph
+        _add_users(
+            self.step_graphs,
+            [step.step_id for step in graph.steps],
+            graph_id
+        )
+
+    def steps_using_obj(self,obj_id):
+        return list(self.obj_steps.get(obj_id,()))
+    def objs_using_blob(self,blob_id):
+        return list(self.blob_objs.get(blob_id,()))
+    def steps_using_blob(self,blob_id):
+        return list(self.blob_steps.get(blob_id,()))
+    def graphs_using_step(self,step_id):
+        return list(self.step_graphs.get(step_id,()))
+
+def _resource_blobs(res):
+    """
+    Return the ids of the blobs referenced by a resource reference
+    """
+    return [res.blob_id] + [src["blob_id"] for src in res.sourcefiles]
+
+def _add_users(index,ids,user):
+    """
+    Record in the reverse index that user refers to the items with ids
+    """
+    for item in ids:
+        index.setdefault(item,set()).add(user)
+
+class CachedComponent(object):
+    """
+    Read only view of a component that computes its dereferenced data only
+    once. All other attributes are taken from the wrapped component.
+    """
+    def __init__(self,component):
+        self.component = component
+        self.derefs = {}
+    def __getattr__(self,name):
+        return getattr(self.component,name)
+    def dereference(self,store):
+        """
+        Return the data of the wrapped component dereferenced against store.
+        The result is computed once per store and shared between all callers,
+        so it must not be modified.
+        """
+        if not store in self.derefs:
+            self.derefs[store] = self.component.dereference(store)
+        return self.derefs[store]
+
+class CachingStore(Store):
+    """
+    Store that wraps another store and caches the dereferenced data of the
+    objects and steps in it, as well as marked up descriptions of steps. This
+    is useful when many things are exported against the same store, as
+    common steps and objects are only dereferenced and marked up once.
+
+    Markup is cached per class of the Markup object, so different instances
+    of a Markup class must give the same result for the same store.
+
+    The wrapped store must not be modified while the CachingStore is in use.
+    """
+    def __init__(self,store):
+        self.store = store
+        self.objects = {}
+        self.steps = {}
+        self.markups = {}
+    def has_blob(self,blob_id):
+        return self.store.has_blob(blob_id)
+    def get_blob_url(self,blob_id):
+        return self.store.get_blob_url(blob_id)
+    def iter_blob(self):
+        return self.store.iter_blob()
+    def has_obj(self,obj_id):
+        return self.store.has_obj(obj_id)
+    def get_obj(self,obj_id):
+        instrumentation.count("cache.get_obj")
+        if not obj_id in self.objects:
+            self.objects[obj_id] = CachedComponent(self.store.get_obj(obj_id))
+        return self.objects[obj_id]
+    def iter_obj(self):
+        return self.store.iter_obj()
+    def has_step(self,step_id):
+        return self.store.has_step(step_id)
+    def get_step(self,step_id):
+        instrumentation.count("cache.get_step")
+        if not step_id in self.steps:
+            self.steps[step_id] = CachedComponent(self.store.get_step(step_id))
+        return self.steps[step_id]
+    def iter_step(self):
+        return self.store.iter_step()
+    def has_graph(self,graph_id):
+        return self.store.has_graph(graph_id)
+    def get_graph(self,graph_id):
+        return self.store.get_graph(graph_id)
+    def iter_graph(self):
+        return self.store.iter_graph()
+    def steps_using_obj(self,obj_id):
+        return self.store.steps_using_obj(obj_id)
+    def objs_using_blob(self,blob_id):
+        return self.store.objs_using_blob(blob_id)
+    def steps_using_blob(self,blob_id):
+        return self.store.steps_using_blob(blob_id)
+    def graphs_using_step(self,step_id):
+        return self.store.graphs_using_step(step_id)
+    def markup_step(self,step_id,markup):
+        key = (step_id,type(markup))
+        if not key in self.markups:
+            self.markups[key] = Store.markup_step(self,step_id,markup)
+        return self.markups[key]
@@ -0,0 +1,179 @@
+# Manual labour - a library for step-by-step instructions
+# Copyright (C) 2014 Johannes Reinhardt <jreinhardt@ist-dein-freund.de>
+#
+#  This library is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public
+#  License as published by the Free Software Foundation; either
+#  version 2.1 of the License, or any later version.
+#
+#  This library is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#  Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public
+#  License along with this library; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#  USA
+
+"""
+This module provides the timing of the steps of a schedule as columns of
+numbers, for analyses and plotting.
+
+If numpy is installed (it can be installed with the timing extra), the
+columns are numpy arrays and the analyses are vectorized. Otherwise the
+columns are arrays from the standard library :mod:`array` module.
+"""
+
+from array import array
+from bisect import bisect_right
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+_UNITS = dict(seconds=1,minutes=60,hours=3600,days=86400)
+
+def timedelta_seconds(data):
+    """
+    Return the number of seconds of the timedelta data, without creating a
+    :class:`~datetime.timedelta`.
+
+    :rtype: :class:`int`
+    """
+    return sum(_UNITS[unit]*value for unit,value in data.iteritems())
+
+class ScheduleTimes(object):
+    """
+    Columns with the start, the stop, the end of the waiting time in seconds
+    and the index of the steps in a timed schedule, in the order of the
+    schedule. steps is the list of schedule step data, as passed to a
+    :class:`~manuallabour.core.schedule.Schedule`. Usually it is obtained
+    with :meth:`~manuallabour.core.schedule.Schedule.timing`.
+
+    A step is active between its start and its stop.
+
+    :raises: :class:`ValueError` if the schedule is not timed
+    """
+    def __init__(self,steps):
+        start = []
+        stop = []
+        waiting = []
+        step_idx = []
+        for step in steps:
+            if not "start" in step:
+                raise ValueError("Schedule is not timed")
+            start.append(timedelta_seconds(step["start"]))
+            stop.append(timedelta_seconds(step["stop"]))
+            if step.get("waiting"):
+                waiting.append(timedelta_seconds(step["waiting"]))
+            else:
+                waiting.append(stop[-1])
+            step_idx.append(step["step_idx"])
+
+        if numpy is None:
+            self.start = array('d',start)
+            self.stop = array('d',stop)
+            self.waiting = array('d',waiting)
+            self.step_idx = array('l',step_idx)
+            self._sorted = (sorted(start),sorted(stop))
+        else:
+            self.start = numpy.array(start,dtype=float)
+            self.stop = numpy.array(stop,dtype=float)
+            self.waiting = numpy.array(waiting,dtype=float)
+            self.step_idx = numpy.array(step_idx,dtype=int)
+            self._sorted = (numpy.sort(self.start),numpy.sort(self.stop))
+
+    def __len__(self):
+        return len(self.start)
+
+    def makespan(self):
+        """
+        Return the end of the last step or waiting time in seconds
+        """
+        if not self:
+            return 0.
+        if numpy is None:
+            return max(self.waiting)
+        return float(self.waiting.max())
+
+    def idle(self):
+        """
+        Return the time in seconds within the makespan in which no step is
+        active, e.g. because of waiting times.
+        """
+        if not self:
+            return 0.
+        if numpy is None:
+            intervals = sorted(zip(self.start,self.stop))
+            idle = intervals[0][0]
+            end = intervals[0][1]
+            for start,stop in intervals[1:]:
+                idle += max(0.,start - end)
+                end = max(end,stop)
+        else:
+            order = numpy.argsort(self.start,kind='mergesort')
+            start = self.start[order]
+            #pylint: disable=E1101
+            ends = numpy.maximum.accumulate(self.stop[order])
+            idle = start[0] + numpy.clip(start[1:] - ends[:-1],0,None).sum()
+            end = ends[-1]
+        return float(idle + self.makespan() - end)
+
+    def concurrency(self,times):
+        """
+        Return the number of active steps at each of the times in seconds.
+        """
+        starts, stops = self._sorted
+        if numpy is None:
+            return array('l',[
+                bisect_right(starts,time) - bisect_right(stops,time)
+                for time in times
+            ])
+        times = numpy.asarray(times,dtype=float)
+        return starts.searchsorted(times,'right') - \
+            stops.searchsorted(times,'right')
+
+    def overlaps(self):
+        """
+        Return for each step the number of steps that are active when it
+        starts, including itself.
+        """
+        return self.concurrency(self.start)
+
+    def _work(self,times):
+        """
+        Return the sum of the active time of all steps up to each of times
+        """
+        starts, stops = self._sorted
+        if numpy is None:
+            res = array('d',[0.]*len(times))
+            for col,sign in [(starts,1.),(stops,-1.)]:
+                sums = [0.]
+                for value in col:
+                    sums.append(sums[-1] + value)
+                for i,time in enumerate(times):
+                    count = bisect_right(col,time)
+                    res[i] += sign*(count*time - sums[count])
+            return res
+        times = numpy.asarray(times,dtype=float)
+        res = numpy.zeros(len(times))
+        for col,sign in [(starts,1.),(stops,-1.)]:
+            sums = numpy.concatenate([[0.],numpy.cumsum(col)])
+            counts = col.searchsorted(times,'right')
+            res += sign*(counts*times - sums[counts])
+        return res
+
+    def binned(self,width):
+        """
+        Divide the makespan into bins of width seconds and return the sum of
+        the active time of all steps in each bin. The last bin may extend
+        beyond the makespan.
+        """
+        n_bins = int(-(-self.makespan()//width))
+        edges = [i*width for i in range(n_bins + 1)]
+        work = self._work(edges)
+        if numpy is None:
+            return array('d',[work[i+1] - work[i] for i in range(n_bins)])
+        return numpy.diff(work)
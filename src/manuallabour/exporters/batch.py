@@ -0,0 +1,108 @@
+# Manual labour - a library for step-by-step instructions
+# Copyright (C) 2014 Johannes Reinhardt <jreinhardt@ist-dein-freund.de>
+#
+#  This library is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public
+#  License as published by the Free Software Foundation; either
+#  version 2.1 of the License, or any later version.
+#
+#  This library is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#  Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public
+#  License along with this library; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#  USA
+
+"""
+This module provides functionality to export many schedules or graphs that
+share a store in one go.
+"""
+from multiprocessing import Pool
+from time import time
+import os
+import sys
+
+from manuallabour.core.stores import CachingStore
+import manuallabour.core.instrumentation as instrumentation
+
+#Jobs for the worker processes of export_batch. This is only set in the
+#workers by _init_batch_worker. The jobs are passed as an argument to the
+#initializer, which forked workers inherit, so that they share the store and
+#the dereferenced data with the parent process instead of receiving pickled
+#copies.
+_BATCH_JOB = None
+
+def _init_batch_worker(job):
+    """
+    Set the jobs for this worker process
+    """
+    #pylint: disable=W0603
+    global _BATCH_JOB
+    _BATCH_JOB = job
+
+def _run_job(idx):
+    """
+    Run the export job with index idx of the current _BATCH_JOB
+    """
+    jobs,store = _BATCH_JOB
+    return run_job(jobs[idx],store)
+
+def run_job(job,store):
+    """
+    Run a single export job against store.
+
+    :param tuple job: exporter, schedule or graph, path and a dict with
+                      additional data for the export
+    :return: timing information for the job
+    :rtype: :class:`dict`
+    """
+    exporter,item,path,kwargs = job
+    start = time()
+    exporter.export(item,store,path,**kwargs)
+    return dict(
+        path=path,
+        exporter=type(exporter).__name__,
+        seconds=time() - start,
+        pid=os.getpid()
+    )
+
+def export_batch(jobs,store,processes=None):
+    """
+    Export many schedules or graphs against the same store using a pool of
+    worker processes, by default one per CPU.
+
+    Steps and objects that are used by several jobs are dereferenced only
+    once in the parent process, before the workers are forked. For exporters
+    with a markup_class, the marked up steps are prepared in the same way.
+    Workers share the store and this data copy-on-write. The BOM is still
+    collected per job, as the tool counts depend on the order of the steps,
+    but the data of the objects in it is taken from the shared cache.
+
+    :param list jobs: list of tuples of exporter, schedule or graph, path and
+                      a dict with additional data for the export
+    :param Store store: store to export against. Must not be modified during
+                        the export
+    :return: timing information for each job, in the order of jobs
+    :rtype: :class:`list` of :class:`dict`
+    """
+    cache = CachingStore(store)
+    with instrumentation.span("export.prepare"):
+        for exporter,item,_,_ in jobs:
+            markup_class = getattr(exporter,'markup_class',None)
+            for ref in item.steps:
+                cache.get_step(ref.step_id).dereference(cache)
+                if not markup_class is None:
+                    cache.markup_step(ref.step_id,markup_class(cache))
+
+    if processes == 1 or len(jobs) < 2 or sys.platform == 'win32':
+        return [run_job(job,cache) for job in jobs]
+
+    pool = Pool(processes,_init_batch_worker,((jobs,cache),))
+    try:
+        return pool.map(_run_job,range(len(jobs)))
+    finally:
+        pool.close()
+        pool.join()
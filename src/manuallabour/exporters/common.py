@@ -21,6 +21,7 @@ Common Interfaces for exporters and related classes
 """
 import re
 from manuallabour.core.common import load_schema
+import manuallabour.core.instrumentation as instrumentation
 from pkg_resources import resource_filename
 
 import jsonschema
@@ -111,14 +112,16 @@ class ScheduleExporterBase(object):
         Export the schedule into the format provided by the exporter and store
         the result in path. Additional data for the export is given in kwargs
         """
-        self._validator.validate(kwargs)
+        with instrumentation.span("export.validate"):
+            self._validator.validate(kwargs)
 
     def render(self,_schedule,_store,**kwargs):
         """
         Export the schedule into the format provided by the exporter and
         return the result. Additional data for the export is given in kwargs
         """
-        self._validator.validate(kwargs)
+        with instrumentation.span("export.validate"):
+            self._validator.validate(kwargs)
 
 class GraphExporterBase(object):
     """
@@ -131,11 +134,13 @@ class GraphExporterBase(object):
         Export the graph into the format provided by the exporter and store
         the result in path. Additional data for the export is given in kwargs
         """
-        self._validator.validate(kwargs)
+        with instrumentation.span("export.validate"):
+            self._validator.validate(kwargs)
 
     def render(self,_graph,_store,**kwargs):
         """
         Export the graph into the format provided by the exporter and return
         the result. Additional data for the export is given in kwargs
         """
-        self._validator.validate(kwargs)
+        with instrumentation.span("export.validate"):
+            self._validator.validate(kwargs)
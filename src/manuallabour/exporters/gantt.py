@@ -20,62 +20,147 @@
 This module defines exporters for export of schedules to gantt charts
 """
 
-import matplotlib.pyplot as pl
 from StringIO import StringIO
+from xml.sax.saxutils import escape
+from math import log10, floor
+# pylint: disable=W0622
+from codecs import open
 
 from manuallabour.exporters.common import ScheduleExporterBase
 
+SVG_HEADER = u'''<?xml version="1.0" encoding="UTF-8" standalone="no"?>
+<svg xmlns="http://www.w3.org/2000/svg" version="1.1" width="%d" height="%d">
+<g font-family="sans-serif" font-size="12" text-anchor="end">
+'''
+
+def tick_spacing(length,ticks=8):
+    """
+    Return a round spacing for axis ticks, such that there are at most ticks
+    ticks on an axis of the given length.
+    """
+    if length <= 0:
+        return 1
+    base = 10**floor(log10(length/float(ticks)))
+    for factor in [1,2,5]:
+        if length/(factor*base) <= ticks:
+            return factor*base
+    return 10*base
+
+def schedule_end(schedule):
+    """
+    Return the time in seconds at which the last step of the schedule,
+    including waiting times, is finished.
+    """
+    end = 0
+    for ref in schedule.steps:
+        if ref.stop is None:
+            raise ValueError("Schedule has no timing information")
+        end = max(end,(ref.waiting or ref.stop).total_seconds())
+    return end
+
 class GanttExporter(ScheduleExporterBase):
     """
     Exporter to export schedules to gantt charts in svg format.
+
+    The SVG is written directly as text, so no plotting library is
+    required and exporters can be used concurrently from several
+    threads. :meth:`write` streams it to a file like object, :meth:`export`
+    only touches the output file once the chart was rendered completely.
     """
+    row_height = 20
+    """Height of a row in the chart in pixels"""
+    label_width = 200
+    """Width of the column with the step titles in pixels"""
+    chart_width = 600
+    """Width of the chart area in pixels"""
+
     def export(self,schedule,store,path,**kwargs):
         ScheduleExporterBase.export(self,schedule,store,path,**kwargs)
 
-        for i,step in enumerate(schedule.steps):
-            pl.plot([
-                step.start.total_seconds(),
-                step.stop.total_seconds(),
-            ],[i,i],"b-")
-            pl.plot([
-                step.stop.total_seconds(),
-                step.waiting.total_seconds(),
-            ],[i,i],"r:")
-        pl.yticks(
-            [i for i,_ in enumerate(schedule.steps)],
-            [step.dereference(store)["title"] for step in schedule.steps]
-        )
-        pl.ylim((-1,len(schedule.steps)))
-
-        pl.xlabel('t [s]')
-
-        pl.savefig(path,format='svg',bbox_inches='tight',pad_inches=0.5)
+        #only touch the file once rendering succeeded
+        out = StringIO()
+        self.write(schedule,store,out)
+        with open(path,'w','utf8') as fid:
+            fid.write(out.getvalue())
 
     def render(self,schedule,store,**kwargs):
         ScheduleExporterBase.render(self,schedule,store,**kwargs)
 
-        for i,step in enumerate(schedule.steps):
-            pl.plot([
-                step.start.total_seconds(),
-                step.stop.total_seconds(),
-            ],[i,i],"b-")
-            pl.plot([
-                step.stop.total_seconds(),
-                step.waiting.total_seconds(),
-            ],[i,i],"r:")
-        pl.yticks(
-            [i for i,_ in enumerate(schedule.steps)],
-            [step.dereference(store)["title"] for step in schedule.steps]
-        )
-        pl.ylim((-1,len(schedule.steps)+1))
+        out = StringIO()
+        self.write(schedule,store,out)
+        res = out.getvalue()
+        out.close()
 
-        pl.xlabel('t [s]')
+        return res
 
-        out = StringIO()
+    def write(self,schedule,store,fid):
+        """
+        Write the gantt chart for the schedule as SVG to the file like object
+        fid. Every step is written as soon as it is visited, only the end of
+        the schedule is determined beforehand to fix the time scale.
+        """
+        height = self.row_height
+        n_steps = len(schedule.steps)
+        end = schedule_end(schedule)
+        scale = self.chart_width/float(end or 1)
 
-        pl.savefig(out,format='svg',bbox_inches='tight',pad_inches=0.5)
+        fid.write(SVG_HEADER % (
+            self.label_width + self.chart_width + height,
+            (n_steps + 4)*height
+        ))
 
-        res =  out.getvalue()
-        out.close()
+        #row layout, timedeltas in schedules are always whole seconds
+        title = u'<text x="%d" y="%%d">%%s</text>\n' % (self.label_width - 5)
+        rect = u'<rect x="%%.2f" y="%%d" width="%%.2f" height="%d" ' \
+            u'fill="blue"/>\n' % int(0.6*height)
+        wait = u'<rect x="%%.2f" y="%%d" width="%%.2f" height="%d" ' \
+            u'fill="red" fill-opacity="0.5"/>\n' % int(0.2*height)
 
-        return res
+        for i,ref in enumerate(schedule.steps):
+            #a start of zero is given as an empty timedelta
+            start = ref.start
+            start = start.total_seconds() if start else 0
+            stop = ref.stop.total_seconds()
+            y_pos = (i + 1)*height
+
+            fid.write(title % (
+                y_pos + int(0.7*height),
+                escape(store.get_step(ref.step_id).title)
+            ))
+            fid.write(rect % (
+                self.label_width + start*scale,
+                y_pos + int(0.2*height),
+                (stop - start)*scale
+            ))
+            if ref.waiting is not None:
+                fid.write(wait % (
+                    self.label_width + stop*scale,
+                    y_pos + int(0.4*height),
+                    (ref.waiting.total_seconds() - stop)*scale
+                ))
+
+        self._write_axis(fid,(n_steps + 1)*height,end,scale)
+        fid.write(u'</g>\n</svg>\n')
+
+    def _write_axis(self,fid,axis,end,scale):
+        fid.write(
+            u'</g>\n<g font-family="sans-serif" font-size="12" '
+            u'text-anchor="middle" stroke="gray">\n'
+        )
+        fid.write(u'<line x1="%d" y1="%d" x2="%d" y2="%d"/>\n' % (
+            self.label_width, axis, self.label_width + self.chart_width, axis
+        ))
+        spacing = tick_spacing(end)
+        tick = 0
+        while tick <= end:
+            x_pos = self.label_width + tick*scale
+            fid.write(u'<line x1="%g" y1="%d" x2="%g" y2="%d"/>\n' % (
+                x_pos, axis, x_pos, axis + 5
+            ))
+            fid.write(u'<text x="%g" y="%d" stroke="none">%g</text>\n' % (
+                x_pos, axis + self.row_height, tick
+            ))
+            tick += spacing
+        fid.write(u'<text x="%g" y="%d" stroke="none">t [s]</text>\n' % (
+            self.label_width + 0.5*self.chart_width, axis + 2*self.row_height
+        ))
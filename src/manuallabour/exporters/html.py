@@ -20,14 +20,81 @@
 This module defines exporters for export of schedules to HTML and other
 classes related to this task.
 """
-from manuallabour.exporters.common import ScheduleExporterBase, MarkupBase
-from jinja2 import Environment, FileSystemLoader
-from os.path import join,  exists
-from shutil import rmtree,copytree
-from os import remove
+import hashlib
+import json
+import sys
+from os import remove, listdir, makedirs
+from os.path import join,  exists, isdir, abspath
+from shutil import rmtree,copytree,copyfile
+from multiprocessing import Pool, current_process
 # pylint: disable=W0622
 from codecs import open
 
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
+
+from manuallabour.exporters.common import ScheduleExporterBase, MarkupBase
+import manuallabour.core.instrumentation as instrumentation
+
+#Process wide registry of jinja environments, keyed by layout path and cache
+#directory
+_ENVIRONMENTS = {}
+
+def get_environment(layout_path,cache_dir=None):
+    """
+    Return the jinja2 Environment for the layout in layout_path. The
+    environment is shared by all exporters in this process, so templates are
+    only loaded once. Compiled templates are additionally kept in a bytecode
+    cache in cache_dir, so that fresh processes can skip compilation. By
+    default a cache directory in the temporary directory of the user is used.
+    """
+    layout_path = abspath(layout_path)
+    if not cache_dir is None:
+        cache_dir = abspath(cache_dir)
+    key = (layout_path,cache_dir)
+    if not key in _ENVIRONMENTS:
+        if not cache_dir is None and not exists(cache_dir):
+            makedirs(cache_dir)
+        _ENVIRONMENTS[key] = Environment(
+            loader=FileSystemLoader(layout_path),
+            bytecode_cache=FileSystemBytecodeCache(cache_dir)
+        )
+    return _ENVIRONMENTS[key]
+
+def precompile_layout(layout_path,cache_dir=None):
+    """
+    Compile all templates of the layout in layout_path and fill the bytecode
+    cache with them. This is intended to be run when a layout is installed
+    and before worker processes are started.
+
+    :return: list of names of the compiled templates
+    """
+    env = get_environment(layout_path,cache_dir)
+    names = env.list_templates(extensions=['html'])
+    for name in names:
+        env.get_template(name)
+    return names
+
+#Job for the worker processes of the MultiPageHTMLExporter. This is only set
+#in the workers by _init_page_worker. The job is passed as an argument to
+#the initializer, which forked workers inherit instead of receiving pickled
+#copies of the schedule and the store.
+_PAGE_JOB = None
+
+def _init_page_worker(job):
+    """
+    Set the job for this worker process
+    """
+    #pylint: disable=W0603
+    global _PAGE_JOB
+    _PAGE_JOB = job
+
+def _render_page(page):
+    """
+    Render a page of the current _PAGE_JOB in a worker process
+    """
+    exporter,schedule,store,known,kwargs = _PAGE_JOB
+    return exporter.render_page(schedule,store,page,known,**kwargs)
+
 class HTMLMarkup(MarkupBase):
     """
     Markup for HTML export
@@ -54,12 +121,16 @@ class HTMLMarkup(MarkupBase):
 
 class SinglePageHTMLExporter(ScheduleExporterBase):
     """
-    Exporter to export schedules into a single HTML page.
+    Exporter to export schedules into a single HTML page. Compiled templates
+    are cached in cache_dir, see :func:`get_environment`.
     """
-    def __init__(self,layout_path):
+    markup_class = HTMLMarkup
+    """Class of the Markup used for the steps"""
+
+    def __init__(self,layout_path,cache_dir=None):
         ScheduleExporterBase.__init__(self)
         self.layout_path = layout_path
-        self.env = Environment(loader=FileSystemLoader(layout_path))
+        self.env = get_environment(layout_path,cache_dir)
 
     def export(self,schedule,store,path,**kwargs):
         ScheduleExporterBase.export(self,schedule,store,path,**kwargs)
@@ -78,25 +149,245 @@ class SinglePageHTMLExporter(ScheduleExporterBase):
         ScheduleExporterBase.render(self,schedule,store,**kwargs)
 
         #prepare stuff for rendering
-        markup = HTMLMarkup(store)
+        markup = self.markup_class(store)
+
+        with instrumentation.span("export.bom"):
+            bom = schedule.collect_bom(store)
+            sourcefiles = schedule.collect_sourcefiles(store)
+            parts = [ref.dereference(store) for ref in bom["parts"].values()]
+            tools = [ref.dereference(store) for ref in bom["tools"].values()]
+
+        with instrumentation.span("export.markup"):
+            steps = []
+            for step in schedule.steps:
+                steps.append(step.markup(store,markup))
+
+        with instrumentation.span("export.jinja"):
+            template = self.env.get_template('template.html')
+
+            #pylint: disable=E1103
+            return template.render(
+                doc = kwargs,
+                schedule = schedule,
+                sourcefiles = sourcefiles,
+                parts = parts,
+                tools = tools,
+                steps = steps
+                )
+
+class MultiPageHTMLExporter(ScheduleExporterBase):
+    """
+    Exporter to export schedules into a set of HTML pages. An index page
+    holds the BOM and an overview, the steps are distributed in chunks of
+    steps_per_page over the remaining pages.
+
+    Pages are rendered in a pool of worker processes, by default one per
+    CPU. When exporting into an existing output directory, pages
+    whose content did not change are neither rendered nor written again.
+    Compiled templates are cached in cache_dir, see :func:`get_environment`.
+    """
+    index = 'index.html'
+    """Filename of the index page"""
+    manifest = 'pages.json'
+    """Filename of the manifest with the content hashes of the pages"""
+    templates = ['index.html','page.html']
+    """Templates of the layout, that are not copied to the output"""
+
+    markup_class = HTMLMarkup
+    """Class of the Markup used for the steps"""
+
+    def __init__(self,layout_path,steps_per_page=1,processes=None,
+                 cache_dir=None):
+        ScheduleExporterBase.__init__(self)
+        if steps_per_page < 1:
+            raise ValueError("steps_per_page must be positive")
+        self.layout_path = layout_path
+        self.steps_per_page = steps_per_page
+        self.processes = processes
+        self.env = get_environment(layout_path,cache_dir)
 
+    def export(self,schedule,store,path,**kwargs):
+        ScheduleExporterBase.export(self,schedule,store,path,**kwargs)
+        if not exists(path):
+            makedirs(path)
+
+        #copy over stuff
+        for name in listdir(self.layout_path):
+            if name in self.templates:
+                continue
+            src = join(self.layout_path,name)
+            dst = join(path,name)
+            if isdir(src):
+                if exists(dst):
+                    rmtree(dst)
+                copytree(src,dst)
+            else:
+                copyfile(src,dst)
+
+        #hashes of pages that are present from a previous export
+        known = {}
+        if exists(join(path,self.manifest)):
+            with open(join(path,self.manifest),'r','utf8') as fid:
+                known = json.loads(fid.read())
+            for filename in known.keys():
+                if not exists(join(path,filename)):
+                    known.pop(filename)
+
+        manifest = {}
+        for filename,digest,html in self._render_pages(
+                schedule,store,known,kwargs):
+            manifest[filename] = digest
+            if html is None:
+                continue
+            with open(join(path,filename),'w','utf8') as fid:
+                fid.write(html)
+
+        #remove pages of a previous export that are no longer present
+        for filename in known:
+            if not filename in manifest:
+                remove(join(path,filename))
+
+        with open(join(path,self.manifest),'w','utf8') as fid:
+            fid.write(json.dumps(manifest,indent=2,sort_keys=True))
+
+    def render(self,schedule,store,**kwargs):
+        """
+        Export the schedule into HTML pages and return a dict mapping the
+        filenames to the content of the pages.
+        """
+        ScheduleExporterBase.render(self,schedule,store,**kwargs)
+
+        res = {}
+        for filename,_digest,html in self._render_pages(
+                schedule,store,{},kwargs):
+            res[filename] = html
+        return res
+
+    def paginate(self,schedule):
+        """
+        Distribute the steps of the schedule over pages.
+
+        :return: a list of lists with the indices of the steps on each page
+        """
+        idxs = range(len(schedule.steps))
+        chunk = self.steps_per_page
+        return [idxs[i:i+chunk] for i in range(0,len(idxs),chunk)]
+
+    def page_filename(self,page):
+        """
+        Return the filename of the page with index page, where None refers
+        to the index page.
+        """
+        if page is None:
+            return self.index
+        return 'page_%d.html' % (page + 1)
+
+    def render_page(self,schedule,store,page,known,**kwargs):
+        """
+        Render a single page, where page is the index of the page or None for
+        the index page. If the content hash of the page is found in the dict
+        known, the page is not rendered again.
+
+        :return: tuple of filename, content hash and HTML or None
+        """
+        pages = self.paginate(schedule)
+        if page is None:
+            template = 'index.html'
+            with instrumentation.span("export.bom"):
+                context = self._index_context(schedule,store,pages)
+        else:
+            template = 'page.html'
+            with instrumentation.span("export.markup"):
+                context = self._page_context(schedule,store,pages,page)
+        context["doc"] = kwargs
+
+        filename = self.page_filename(page)
+        check = hashlib.sha512(
+            json.dumps(context,sort_keys=True,default=str)
+        )
+        #changes of the layout also invalidate the pages
+        check.update(self.env.loader.get_source(self.env,template)[0]\
+            .encode('utf8'))
+        digest = check.hexdigest()
+        if known.get(filename) == digest:
+            return filename, digest, None
+
+        with instrumentation.span("export.jinja"):
+            #pylint: disable=E1103
+            html = self.env.get_template(template).render(**context)
+        return filename, digest, html
+
+    def _index_context(self,schedule,store,pages):
         bom = schedule.collect_bom(store)
         sourcefiles = schedule.collect_sourcefiles(store)
         parts = [ref.dereference(store) for ref in bom["parts"].values()]
         tools = [ref.dereference(store) for ref in bom["tools"].values()]
 
-        steps = []
-        for step in schedule.steps:
-            steps.append(step.markup(store,markup))
-
-        template = self.env.get_template('template.html')
+        overview = []
+        for page,idxs in enumerate(pages):
+            steps = []
+            for idx in idxs:
+                ref = schedule.steps[idx]
+                steps.append(dict(
+                    step_nr=ref.step_nr,
+                    title=store.get_step(ref.step_id).title
+                ))
+            overview.append(dict(
+                filename=self.page_filename(page),
+                steps=steps
+            ))
 
-        #pylint: disable=E1103
-        return template.render(
-            doc = kwargs,
-            schedule = schedule,
+        return dict(
             sourcefiles = sourcefiles,
             parts = parts,
             tools = tools,
-            steps = steps
-            )
+            pages = overview
+        )
+
+    def _page_context(self,schedule,store,pages,page):
+        markup = self.markup_class(store)
+        steps = []
+        for idx in pages[page]:
+            steps.append(schedule.steps[idx].markup(store,markup))
+
+        prev_page = None
+        if page > 0:
+            prev_page = self.page_filename(page - 1)
+        next_page = None
+        if page + 1 < len(pages):
+            next_page = self.page_filename(page + 1)
+
+        return dict(
+            steps = steps,
+            page_nr = page + 1,
+            index = self.index,
+            prev = prev_page,
+            next = next_page
+        )
+
+    def _render_pages(self,schedule,store,known,kwargs):
+        pages = [None] + range(len(self.paginate(schedule)))
+
+        #forked workers inherit the job, elsewhere render in this process.
+        #daemonic processes, like pool workers, can not have children
+        if self.processes == 1 or len(pages) == 1 or \
+                current_process().daemon or sys.platform == 'win32':
+            return [
+                self.render_page(schedule,store,page,known,**kwargs)
+                for page in pages
+            ]
+
+        #compile templates before forking, so that workers inherit them
+        for template in self.templates:
+            self.env.get_template(template)
+
+        pool = Pool(
+            self.processes,
+            _init_page_worker,
+            ((self,schedule,store,known,kwargs),)
+        )
+        try:
+            return pool.map(_render_page,pages)
+        finally:
+            pool.close()
+            pool.join()
@@ -21,13 +21,45 @@ This module defines exporters for export of schedules and Graphs to SVG.
 """
 
 import manuallabour.exporters.common as common
-import pygraphviz as pgv
-import os
-import tempfile
+import manuallabour.core.instrumentation as instrumentation
+from subprocess import Popen, PIPE
 
-def graphviz_add_obj_edges(graph,s_id,objs,**kwargs):
+def dot_quote(value):
     """
-    add objects in the list objs to graph.
+    Return value as a quoted DOT string
+    """
+    value = unicode(value).replace('\\','\\\\').replace('"','\\"')
+    return u'"%s"' % value
+
+def dot_attrs(attrs):
+    """
+    Return the DOT attribute list for the dict attrs
+    """
+    if not attrs:
+        return u''
+    return u' [%s]' % u','.join(
+        u'%s=%s' % (key,dot_quote(val)) for key,val in sorted(attrs.items())
+    )
+
+def dot_node(lines,n_id,**attrs):
+    """
+    Append a DOT node statement to the list lines
+    """
+    lines.append(u'%s%s;' % (dot_quote(n_id),dot_attrs(attrs)))
+
+def dot_edge(lines,src,dst,**attrs):
+    """
+    Append a DOT edge statement to the list lines
+    """
+    lines.append(u'%s -> %s%s;' % (
+        dot_quote(src),
+        dot_quote(dst),
+        dot_attrs(attrs)
+    ))
+
+def dot_obj_edges(lines,s_id,objs,**kwargs):
+    """
+    add edges for the objects in the list objs to lines.
 
     kwargs:
     attr: dict of edge attributes
@@ -42,93 +74,143 @@ def graphviz_add_obj_edges(graph,s_id,objs,**kwargs):
             attrs.update(kwargs["opt"])
         attrs["label"] = obj["quantity"]
         if obj["created"]:
-            graph.add_edge(s_id,o_id,**attrs)
+            dot_edge(lines,s_id,o_id,**attrs)
         else:
-            graph.add_edge(o_id,s_id,**attrs)
+            dot_edge(lines,o_id,s_id,**attrs)
         if kwargs["res"]:
             for img in obj["images"]:
-                graph.add_edge('r_' + img["blob_id"],o_id)
+                dot_edge(lines,'r_' + img["blob_id"],o_id)
 
+def dot_objects_and_resources(lines,store,steps,with_objects,with_resources):
+    """
+    add nodes and edges for objects and resources to lines, where steps is a
+    list of tuples of node id and dereferenced step.
+    """
+    if with_objects:
+        for o_id, obj in store.iter_obj():
+            dot_node(lines,'o_' + o_id,label=obj.name,shape='rectangle')
+
+    if with_resources:
+        for blob_id in store.iter_blob():
+            dot_node(lines,'r_' + blob_id,label=blob_id[:6],shape='diamond')
+
+    if with_objects:
+        for s_id,step_dict in steps:
+            args = dict(
+                attr={'color' : 'blue'},
+                opt={'style' : 'dashed'},
+                res=with_resources
+            )
+            dot_obj_edges(lines,s_id,step_dict["parts"],**args)
+
+            args["attr"] = {'color' : 'red'}
+            dot_obj_edges(lines,s_id,step_dict["tools"],**args)
+
+            args["attr"] = {'color' : 'brown'}
+            dot_obj_edges(lines,s_id,step_dict["results"],**args)
+
+    if with_resources:
+        for s_id,step_dict in steps:
+            for res in step_dict["files"].values():
+                dot_edge(lines,'r_' + res["blob_id"],s_id,color='orange')
+            for res in step_dict["images"].values():
+                dot_edge(lines,'r_' + res["blob_id"],s_id,color='green')
+
+def run_dot(dot,output_format='svg'):
+    """
+    Lay out the graph given as DOT text with the dot program and return the
+    result in the given output format.
+    """
+    with instrumentation.span("export.dot"):
+        return _run_dot(dot,output_format)
+
+def _run_dot(dot,output_format):
+    try:
+        proc = Popen(
+            ['dot','-T' + output_format],
+            stdin=PIPE,
+            stdout=PIPE,
+            stderr=PIPE
+        )
+    except OSError as exc:
+        raise RuntimeError(
+            "The dot program from graphviz is required for this export, "
+            "but could not be run: %s" % exc
+        )
+    out,err = proc.communicate(dot.encode('utf8'))
+    if proc.returncode != 0:
+        raise RuntimeError("dot failed: %s" % err)
+    return out
 
 class GraphSVGExporter(common.GraphExporterBase):
     """
-    Exporter to export graphs to svg files.
+    Exporter to export graphs to svg files. The layout is done by the dot
+    program from graphviz. If reduced is True, only the dependencies of the
+    transitive reduction of the graph are drawn. If targets are given, only
+    the steps required for them are drawn.
     """
-    def __init__(self,with_objects=False,with_resources=False):
+    def __init__(self,with_objects=False,with_resources=False,reduced=False,
+                 targets=None):
         common.GraphExporterBase.__init__(self)
         self.with_objects = with_objects
         self.with_resources = with_resources
+        self.reduced = reduced
+        self.targets = targets
 
     def export(self,graph,store,path,**kwargs):
         common.GraphExporterBase.export(self,graph,store,path,**kwargs)
 
-        result = pgv.AGraph(directed=True,strict=False)
+        #only touch the file once dot succeeded
+        result = run_dot(self.render_dot(graph,store))
+        with open(path,'wb') as fid:
+            fid.write(result)
+
+    def render(self,graph,store,**kwargs):
+        common.GraphExporterBase.render(self,graph,store,**kwargs)
+
+        return run_dot(self.render_dot(graph,store))
 
-        steps = {}
-        for ref in graph.steps:
-            steps[ref.step_id] = ref.dereference(store)
+    def render_dot(self,graph,store):
+        """
+        Return the graph in the DOT language, as it is passed to graphviz.
 
-        #Nodes
-        for alias,step_dict in steps.iteritems():
-            s_id = "s_" + alias
-            result.add_node(s_id,label=step_dict["title"])
+        :rtype: :class:`unicode`
+        """
+        lines = [u'digraph {']
 
-        if self.with_objects:
-            for o_id, obj in store.iter_obj():
-                o_id = 'o_' + o_id
-                result.add_node(o_id,label=obj.name,shape='rectangle')
+        graph = graph.subgraph(self.targets)
+        steps = []
+        with instrumentation.span("export.dereference"):
+            for ref in graph.steps:
+                steps.append(('s_' + ref.step_id,ref.dereference(store)))
 
-        if self.with_resources:
-            for blob_id in store.iter_blob():
-                r_id = 'r_' + blob_id
-                result.add_node(r_id,label=blob_id[:6],shape='diamond')
+        #Nodes
+        for s_id,step_dict in steps:
+            dot_node(lines,s_id,label=step_dict["title"])
 
         #Edges
+        if self.reduced:
+            graph = graph.transitive_reduction(graph.graph_id)
         for alias,children in graph.children.iteritems():
             for child in children:
-                result.add_edge('s_' + alias,'s_' + child)
-
-        if self.with_objects:
-            for alias,step_dict in steps.iteritems():
-                s_id = 's_' + alias
+                dot_edge(lines,'s_' + alias,'s_' + child)
 
-                args = dict(
-                    attr={'color' : 'blue'},
-                    opt={'style' : 'dashed'},
-                    res=self.with_resources
-                )
-                graphviz_add_obj_edges(result,s_id,step_dict["parts"],**args)
+        dot_objects_and_resources(
+            lines,
+            store,
+            steps,
+            self.with_objects,
+            self.with_resources
+        )
 
-                args["attr"] = {'color' : 'red'}
-                graphviz_add_obj_edges(result,s_id,step_dict["tools"],**args)
-
-                args["attr"] = {'color' : 'brown'}
-                graphviz_add_obj_edges(result,s_id,step_dict["results"],**args)
-
-        if self.with_resources:
-            for alias,step_dict in steps.iteritems():
-                s_id = 's_' + alias
-
-                for res in step_dict["files"].values():
-                    result.add_edge('r_' + res["blob_id"],s_id,color='orange')
-                for res in step_dict["images"].values():
-                    result.add_edge('r_' + res["blob_id"],s_id,color='green')
-
-        result.draw(path,prog='dot')
-
-    def render(self,graph,store,**kwargs):
-        common.GraphExporterBase.render(self,graph,store,**kwargs)
-
-        _filehandle,filename = tempfile.mkstemp(suffix=".svg")
-        self.export(graph,store,filename,**kwargs)
-        result = open(filename).read()
-        os.remove(filename)
-        return result
+        lines.append(u'}\n')
+        return u'\n'.join(lines)
 
 
 class ScheduleSVGExporter(common.ScheduleExporterBase):
     """
-    Exporter to export schedules to svg files.
+    Exporter to export schedules to svg files. The layout is done by the dot
+    program from graphviz.
     """
     def __init__(self,with_objects=False,with_resources=False):
         common.ScheduleExporterBase.__init__(self)
@@ -138,59 +220,42 @@ class ScheduleSVGExporter(common.ScheduleExporterBase):
     def export(self,schedule,store,path,**kwargs):
         common.ScheduleExporterBase.export(self,schedule,store,path,**kwargs)
 
-        result = pgv.AGraph(directed=True,strict=False)
+        #only touch the file once dot succeeded
+        result = run_dot(self.render_dot(schedule,store))
+        with open(path,'wb') as fid:
+            fid.write(result)
 
-        #Nodes
-        for ref in schedule.steps:
-            s_id = 's_' + str(ref.step_nr)
-            step_dict = ref.dereference(store)
-            result.add_node(s_id,label=step_dict["title"])
-            if ref.step_nr > 1:
-                result.add_edge('s_' + str(ref.step_nr - 1),s_id)
-
-        if self.with_objects:
-            for o_id, obj in store.iter_obj():
-                o_id = 'o_' + o_id
-                result.add_node(o_id,label=obj.name,shape='rectangle')
-
-        if self.with_resources:
-            for blob_id in store.iter_blob():
-                result.add_node(blob_id,label=blob_id[:6],shape='diamond')
-
-        #edges
-        for ref in schedule.steps:
-            s_id = 's_' + str(ref.step_nr)
-            if ref.step_nr > 1:
-                result.add_edge('s_' + str(ref.step_nr - 1),s_id)
-
-        if self.with_objects:
-            for ref in schedule.steps:
-                s_id = 's_' + str(ref.step_nr)
-                step_dict = ref.dereference(store)
+    def render(self,schedule,store,**kwargs):
+        common.ScheduleExporterBase.render(self,schedule,store,**kwargs)
 
-                args = dict(
-                    attr={'color' : 'blue'},
-                    opt={'style' : 'dashed'},
-                    res=self.with_resources
-                )
-                graphviz_add_obj_edges(result,s_id,step_dict["parts"],**args)
+        return run_dot(self.render_dot(schedule,store))
 
-                args["attr"] = {'color' : 'red'}
-                graphviz_add_obj_edges(result,s_id,step_dict["tools"],**args)
+    def render_dot(self,schedule,store):
+        """
+        Return the schedule in the DOT language, as it is passed to graphviz.
 
-                args["attr"] = {'color' : 'brown'}
-                graphviz_add_obj_edges(result,s_id,step_dict["results"],**args)
+        :rtype: :class:`unicode`
+        """
+        lines = [u'digraph {']
 
-        if self.with_resources:
+        steps = []
+        with instrumentation.span("export.dereference"):
             for ref in schedule.steps:
-                s_id = 's_' + str(ref.step_nr)
-                step = store.get_step(ref.step_id)
-
-                for fil in step.files.values():
-                    result.add_edge('r_' + fil.blob_id,s_id,color='orange')
-                for img in step.images.values():
-                    result.add_edge('r_' + img.blob_id,s_id,color='green')
-
-        result.draw(path,prog='dot')
-
-
+                steps.append(('s_' + str(ref.step_nr),ref.dereference(store)))
+
+        #Nodes and edges between subsequent steps
+        for s_id,step_dict in steps:
+            dot_node(lines,s_id,label=step_dict["title"])
+            if step_dict["step_nr"] > 1:
+                dot_edge(lines,'s_' + str(step_dict["step_nr"] - 1),s_id)
+
+        dot_objects_and_resources(
+            lines,
+            store,
+            steps,
+            self.with_objects,
+            self.with_resources
+        )
+
+        lines.append(u'}\n')
+        return u'\n'.join(lines)
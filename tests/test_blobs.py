@@ -0,0 +1,70 @@
+# Manual labour - a library for step-by-step instructions
+# Copyright (C) 2014 Johannes Reinhardt <jreinhardt@ist-dein-freund.de>
+#
+#  This library is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public
+#  License as published by the Free Software Foundation; either
+#  version 2.1 of the License, or any later version.
+#
+#  This library is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#  Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public
+#  License along with this library; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#  USA
+
+import unittest
+import json
+from os import makedirs
+from os.path import join, exists, abspath
+
+from manuallabour.core.common import calculate_blob_checksum
+from manuallabour.core.instrumentation import SummarySink, enable, disable
+from manuallabour.core.blobs import *
+
+class TestBlobs(unittest.TestCase):
+    def setUp(self):
+        self.path = 'tests/output/blobs'
+        if not exists(self.path):
+            makedirs(self.path)
+        self.files = []
+        for i,size in enumerate([0,100,3*(1 << 20) + 7]):
+            filename = join(self.path,'blob%d' % i)
+            with open(filename,'wb') as fid:
+                fid.write(('%d' % i)*size)
+            self.files.append(filename)
+
+    def tearDown(self):
+        disable()
+
+    def test_hash_file(self):
+        for filename in self.files:
+            with open(filename,'rb') as fid:
+                expected = calculate_blob_checksum(fid)
+            self.assertEqual(hash_file(filename),expected)
+            self.assertEqual(hash_file(filename,chunk_size=1000),expected)
+
+    def test_hasher(self):
+        sink = SummarySink()
+        enable(sink)
+
+        hasher = BlobHasher()
+        ids = hasher.blob_ids(self.files)
+        self.assertEqual(ids,[hash_file(f) for f in self.files])
+        self.assertEqual(hasher.blob_ids(self.files),ids)
+        self.assertEqual(sink.summary()["counts"]["blob.hash"],6)
+
+        #the cache can be stored
+        cache = json.loads(json.dumps(hasher.cache))
+        hasher = BlobHasher(cache,threads=1)
+        self.assertEqual(hasher.blob_id(self.files[1]),ids[1])
+        self.assertEqual(sink.summary()["counts"]["blob.hash"],6)
+
+        #changed files are hashed again
+        with open(self.files[1],'wb') as fid:
+            fid.write('changed')
+        self.assertNotEqual(hasher.blob_id(self.files[1]),ids[1])
+        self.assertEqual(hasher.cache[abspath(self.files[1])][0],7)
@@ -23,6 +23,7 @@ from os.path import join
 from jsonschema import ValidationError,Draft4Validator
 
 from manuallabour.core.common import *
+from manuallabour.core.instrumentation import SummarySink, enable, disable
 
 SCHEMA_DIR = 'tests/schema'
 
@@ -234,6 +235,59 @@ class TestObjects(unittest.TestCase):
         self.assertNotEqual(check3,check5)
         self.assertNotEqual(check4,check5)
 
+    def test_checksum_versions(self):
+        kwargs = dict(obj_id='foo',name="Bar")
+        check1 = Object.calculate_checksum(**kwargs)
+
+        check2 = Object.calculate_checksum_v2(**kwargs)
+        self.assertNotEqual(check1,check2)
+        self.assertEqual(check2,Object.calculate_checksum_v2(
+            obj_id='Foo',
+            name="Bar",
+            description=""
+        ))
+
+        #values can not be shifted into each other
+        step1 = dict(title="a",description="b",assertions=["ab","c"])
+        step2 = dict(title="a",description="b",assertions=["a","bc"])
+        self.assertEqual(
+            Step.calculate_checksum(**step1),
+            Step.calculate_checksum(**step2)
+        )
+        self.assertNotEqual(
+            Step.calculate_checksum_v2(**step1),
+            Step.calculate_checksum_v2(**step2)
+        )
+
+        self.assertRaises(
+            ValidationError,
+            lambda: Object.calculate_checksum_v2(name=3)
+        )
+
+        #a field named version is data, not the version of the calculation
+        self.assertRaises(
+            ValidationError,
+            lambda: Object.calculate_checksum(version=3,**kwargs)
+        )
+
+        items = [dict(name="Bar"),dict(name="Baz")]
+        self.assertEqual(Object.calculate_checksums(items,2),[
+            Object.calculate_checksum_v2(**items[0]),
+            Object.calculate_checksum_v2(**items[1])
+        ])
+        self.assertEqual(Object.calculate_checksums(items)[0],
+            Object.calculate_checksum(**items[0]))
+        self.assertEqual(Object.calculate_checksums(items,1)[1],
+            Object.calculate_checksum(**items[1]))
+        self.assertEqual(
+            Object.calculate_checksums(items,2,validate=False)[1],
+            Object.calculate_checksum_v2(**items[1])
+        )
+        self.assertRaises(
+            ValueError,
+            lambda: Object.calculate_checksums(items,3)
+        )
+
     def test_dereference(self):
         o = Object(obj_id='foo',name="Bar",images=[
             dict(blob_id='asdf',extension=".png",alt="an image")
@@ -385,3 +439,85 @@ class TestStep(unittest.TestCase):
         self.assertEqual(len(res["blob_ids"]),3)
         self.assertEqual(len(res["step_ids"]),1)
         self.assertEqual(len(res["obj_ids"]),1)
+
+    def test_intern_ids(self):
+        #build equal ids at runtime, so they are different objects
+        obj_id = ''.join(['n','u','t'])
+        blob_id = ''.join(['k','d','s'])
+        step = Step(
+            step_id='b',
+            title='With objects',
+            description='Step with objects',
+            parts = {'sd' : dict(obj_id=obj_id)},
+            files = {'l_kds' : dict(blob_id=blob_id,filename='test.file')}
+        )
+        other = Step(
+            step_id='c',
+            title='With objects',
+            description='Step with objects',
+            tools = {'sd' : dict(obj_id=''.join(['n','u','t']))},
+            images = {'l_kds' : dict(
+                blob_id=''.join(['k','d','s']),
+                alt='Foo',
+                extension='.png'
+            )}
+        )
+        self.assertTrue(step.parts['sd'].obj_id is other.tools['sd'].obj_id)
+        self.assertTrue(
+            step.files['l_kds'].blob_id is other.images['l_kds'].blob_id
+        )
+        self.assertTrue(step.parts['sd'].obj_id is intern_id('nut'))
+
+        #the data of the caller is not modified
+        requires = [''.join(['n','u','t'])]
+        data = dict(steps=[dict(step_id='a',requires=requires)])
+        res = intern_ids(data)
+        self.assertTrue(res["steps"][0]["requires"][0] is intern_id('nut'))
+        self.assertFalse(requires[0] is intern_id('nut'))
+        self.assertTrue(data["steps"][0]["requires"] is requires)
+
+        #the table can be cleared, ids stay valid
+        clear_interned_ids()
+        self.assertFalse(
+            intern_id(''.join(['n','u','t'])) is step.parts['sd'].obj_id
+        )
+        self.assertEqual(step.parts['sd'].obj_id,'nut')
+
+    def test_lazy(self):
+        sink = SummarySink()
+        enable(sink)
+        try:
+            step = Step(
+                parts = {'sd' : dict(obj_id='sd')},
+                tools = {'t' : dict(obj_id='t')},
+                duration = dict(minutes=3),
+                **self.params
+            )
+            self.assertEqual(sink.summary()["counts"].get("materialize"),None)
+            validations = sink.summary()["counts"]["validate"]
+
+            self.assertEqual(step.parts['sd'].obj_id,'sd')
+            self.assertTrue(step.parts is step.parts)
+            self.assertEqual(step.duration,timedelta(minutes=3))
+            self.assertEqual(step.waiting,None)
+            self.assertEqual(step.files,{})
+            counts = sink.summary()["counts"]
+            self.assertEqual(counts["materialize"],4)
+            #references are not validated again
+            self.assertEqual(counts["validate"],validations)
+
+            step.materialize()
+            self.assertEqual(sink.summary()["counts"]["materialize"],7)
+            self.assertEqual(step.tools['t'].obj_id,'t')
+        finally:
+            disable()
+
+        #constraints on references are still checked at construction
+        self.assertRaises(AssertionError,lambda: Step(
+            results = {'r' : dict(obj_id='r')},
+            **self.params
+        ))
+        self.assertRaises(AssertionError,lambda: Step(
+            parts = {'r' : dict(obj_id='r',created=True,optional=True)},
+            **self.params
+        ))
@@ -0,0 +1,133 @@
+# Manual labour - a library for step-by-step instructions
+# Copyright (C) 2014 Johannes Reinhardt <jreinhardt@ist-dein-freund.de>
+#
+#  This library is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public
+#  License as published by the Free Software Foundation; either
+#  version 2.1 of the License, or any later version.
+#
+#  This library is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#  Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public
+#  License along with this library; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#  USA
+
+import unittest
+import random
+
+from manuallabour.core.stores import LocalMemoryStore
+from manuallabour.core.schedule import Schedule
+from manuallabour.core.diff import *
+
+from test_schedule import schedule_example
+
+def make_schedule(step_ids,times=None):
+    steps = []
+    for idx,step_id in enumerate(step_ids):
+        step = dict(step_id=step_id,step_idx=idx)
+        if times is not None:
+            step["start"] = dict(minutes=times[idx])
+            step["stop"] = dict(minutes=times[idx] + 1)
+        steps.append(step)
+    return Schedule(sched_id='s',steps=steps)
+
+def lcs_length(seq1,seq2):
+    table = [[0]*(len(seq2) + 1) for _ in range(len(seq1) + 1)]
+    for i,item1 in enumerate(seq1):
+        for j,item2 in enumerate(seq2):
+            if item1 == item2:
+                table[i+1][j+1] = table[i][j] + 1
+            else:
+                table[i+1][j+1] = max(table[i][j+1],table[i+1][j])
+    return table[-1][-1]
+
+class TestDiff(unittest.TestCase):
+    def test_sequence(self):
+        old = make_schedule(['a','b','c','d','e'])
+        new = make_schedule(['a','c','b','e','f'])
+        res = diff_schedules(old,new)
+        self.assertEqual(res["kept"],['a','b','e'])
+        self.assertEqual(res["moved"],['c'])
+        self.assertEqual(res["added"],['f'])
+        self.assertEqual(res["removed"],['d'])
+        self.assertEqual(res["retimed"],[])
+        self.assertEqual(res["renumbered"],['b','e'])
+        self.assertFalse("bom" in res)
+
+        res = diff_schedules(old,old)
+        self.assertEqual(res["kept"],['a','b','c','d','e'])
+        self.assertEqual(res["moved"] + res["added"] + res["removed"],[])
+        self.assertEqual(res["renumbered"],[])
+
+        #inserting a step changes the numbers of all later steps
+        res = diff_schedules(old,make_schedule(['a','x','b','c','d','e']))
+        self.assertEqual(res["added"],['x'])
+        self.assertEqual(res["renumbered"],['b','c','d','e'])
+
+    def test_longest(self):
+        rng = random.Random(1)
+        for _ in range(50):
+            old = rng.sample(range(12),rng.randint(0,12))
+            new = rng.sample(range(12),rng.randint(0,12))
+            res = diff_schedules(
+                make_schedule(['s%d' % i for i in old]),
+                make_schedule(['s%d' % i for i in new])
+            )
+            self.assertEqual(len(res["kept"]),lcs_length(old,new))
+            kept = [int(s[1:]) for s in res["kept"]]
+            self.assertEqual(kept,[i for i in old if i in kept])
+
+    def test_repeated(self):
+        res = diff_schedules(
+            make_schedule(['a','b','a']),
+            make_schedule(['a','a','c'])
+        )
+        self.assertEqual(res["kept"],['a','a'])
+        self.assertEqual(res["added"],['c'])
+        self.assertEqual(res["removed"],['b'])
+
+    def test_retimed(self):
+        res = diff_schedules(
+            make_schedule(['a','b','c'],[0,1,2]),
+            make_schedule(['a','b','c'],[0,2,3])
+        )
+        self.assertEqual(res["retimed"],['b','c'])
+        self.assertEqual(res["renumbered"],[])
+
+        res = diff_schedules(
+            make_schedule(['a','b','c'],[0,1,2]),
+            make_schedule(['b','c'],[1,2])
+        )
+        self.assertEqual(res["renumbered"],['b','c'])
+
+    def test_bom(self):
+        store = LocalMemoryStore()
+        schedule_example(store)
+        old = make_schedule(['a','b','c'])
+        new = make_schedule(['a','b'])
+
+        res = diff_schedules(old,new,store)
+        self.assertEqual(res["removed"],['c'])
+
+        old_bom = old.collect_bom(store)
+        new_bom = new.collect_bom(store)
+        for kind in ["parts","tools"]:
+            for obj_id in set(old_bom[kind]) | set(new_bom[kind]):
+                before = old_bom[kind].get(obj_id)
+                after = new_bom[kind].get(obj_id)
+                delta = res["bom"][kind].get(obj_id,dict(
+                    quantity=0,
+                    optional=0
+                ))
+                for key in ["quantity","optional"]:
+                    self.assertEqual(
+                        getattr(before,key,0) + delta[key],
+                        getattr(after,key,0)
+                    )
+        self.assertTrue(len(res["bom"]["parts"]) + len(res["bom"]["tools"]) > 0)
+        self.assertEqual(diff_schedules(old,old,store)["bom"],
+            dict(parts={},tools={}))
@@ -19,13 +19,23 @@
 import unittest
 from datetime import timedelta
 import pkg_resources
+from threading import Thread
+from xml.dom.minidom import parseString
+from os.path import join, exists
+from distutils.spawn import find_executable
+from os import listdir
+from shutil import rmtree
 
 import manuallabour.core.common as common
 from manuallabour.core.graph import Graph
 from manuallabour.core.schedule import Schedule
 from manuallabour.core.stores import LocalMemoryStore
 
-from manuallabour.exporters.html import SinglePageHTMLExporter
+import manuallabour.exporters.html as html
+from manuallabour.exporters.html import SinglePageHTMLExporter,\
+    MultiPageHTMLExporter, get_environment, precompile_layout
+from manuallabour.exporters.batch import export_batch
+from manuallabour.exporters.gantt import GanttExporter
 from manuallabour.exporters.svg import GraphSVGExporter, ScheduleSVGExporter
 
 from test_schedule import schedule_example
@@ -81,6 +91,153 @@ class TestExporter(unittest.TestCase):
             **self.data
         )
 
+    def test_html_multi(self):
+        layout_path = pkg_resources.resource_filename(
+            'manuallabour.layouts.html_multi.basic',
+            'template')
+        e = MultiPageHTMLExporter(layout_path)
+
+        pages = e.render(self.schedule,self.store,**self.data)
+        self.assertEqual(
+            sorted(pages.keys()),
+            ['index.html','page_1.html','page_2.html','page_3.html']
+        )
+        self.assertTrue('Second' in pages['page_2.html'])
+        self.assertFalse('Second' in pages['page_1.html'])
+
+        e = MultiPageHTMLExporter(layout_path,steps_per_page=2,processes=1)
+        pages = e.render(self.schedule_timed,self.store,**self.data)
+        self.assertEqual(len(pages),3)
+
+        path = 'tests/output/html_multi'
+        e.export(self.schedule,self.store,path,**self.data)
+        self.assertTrue(exists(join(path,'page_2.html')))
+
+        #pages of earlier exports are removed
+        MultiPageHTMLExporter(layout_path,processes=1)\
+            .export(self.schedule,self.store,path,**self.data)
+        self.assertTrue(exists(join(path,'page_3.html')))
+        e.export(self.schedule,self.store,path,**self.data)
+        self.assertFalse(exists(join(path,'page_3.html')))
+
+        #unchanged pages are not rendered again
+        known = {'page_1.html' : e.render_page(
+            self.schedule,self.store,0,{},**self.data)[1]}
+        _,_,html = e.render_page(
+            self.schedule,self.store,0,known,**self.data)
+        self.assertTrue(html is None)
+
+    def test_environment(self):
+        layout_path = pkg_resources.resource_filename(
+            'manuallabour.layouts.html_multi.basic',
+            'template')
+        cache_dir = 'tests/output/jinja_cache'
+        if exists(cache_dir):
+            rmtree(cache_dir)
+        #an environment with the default cache must not be reused
+        get_environment(layout_path)
+        names = precompile_layout(layout_path,cache_dir)
+        self.assertEqual(sorted(names),['index.html','page.html'])
+        self.assertEqual(len(listdir(cache_dir)),2)
+        self.assertTrue(
+            get_environment(layout_path,cache_dir) is not
+            get_environment(layout_path)
+        )
+        self.assertTrue(
+            get_environment(layout_path) is
+            MultiPageHTMLExporter(layout_path).env
+        )
+
+    def test_precompiled_export(self):
+        for exporter,package in [
+                (SinglePageHTMLExporter,'manuallabour.layouts.html_single.basic'),
+                (MultiPageHTMLExporter,'manuallabour.layouts.html_multi.basic')]:
+            layout_path = pkg_resources.resource_filename(package,'template')
+            cache_dir = 'tests/output/jinja_precompiled'
+            if exists(cache_dir):
+                rmtree(cache_dir)
+            precompile_layout(layout_path,cache_dir)
+
+            #like a fresh process, that has no environments yet
+            html._ENVIRONMENTS.clear()
+            e = exporter(layout_path,cache_dir=cache_dir)
+            self.assertTrue(e.env is get_environment(layout_path,cache_dir))
+
+            #templates are loaded from the cache instead of being compiled
+            def compile_template(*args,**kwargs):
+                raise AssertionError("Template was compiled")
+            e.env.compile = compile_template
+            if exporter is MultiPageHTMLExporter:
+                e.render_page(self.schedule,self.store,0,{},**self.data)
+                e.render_page(self.schedule,self.store,None,{},**self.data)
+            else:
+                e.render(self.schedule,self.store,**self.data)
+            html._ENVIRONMENTS.clear()
+
+    def test_batch(self):
+        single = SinglePageHTMLExporter(pkg_resources.resource_filename(
+            'manuallabour.layouts.html_single.basic',
+            'template'))
+        multi = MultiPageHTMLExporter(pkg_resources.resource_filename(
+            'manuallabour.layouts.html_multi.basic',
+            'template'))
+        jobs = [
+            (single,self.schedule,'tests/output/batch_single',self.data),
+            (single,self.schedule_timed,'tests/output/batch_timed',self.data),
+            (multi,self.schedule,'tests/output/batch_multi',self.data),
+        ]
+        for processes in [1,2]:
+            timings = export_batch(jobs,self.store,processes=processes)
+            self.assertEqual(len(timings),3)
+            self.assertEqual(timings[1]["path"],'tests/output/batch_timed')
+            self.assertEqual(timings[2]["exporter"],'MultiPageHTMLExporter')
+            self.assertTrue(timings[0]["seconds"] >= 0)
+        self.assertTrue(exists('tests/output/batch_multi/page_3.html'))
+
+    def test_gantt(self):
+        e = GanttExporter()
+        e.export(
+            self.schedule_timed,
+            self.store,
+            'tests/output/gantt.svg',
+            **self.data
+        )
+
+        svg = parseString(e.render(self.schedule_timed,self.store,**self.data))
+        self.assertEqual(len(svg.getElementsByTagName('rect')),3)
+
+        self.assertRaises(
+            ValueError,
+            lambda: e.render(self.schedule,self.store,**self.data)
+        )
+
+        #a failed export leaves an existing file untouched
+        self.assertRaises(
+            ValueError,
+            lambda: e.export(
+                self.schedule,
+                self.store,
+                'tests/output/gantt.svg',
+                **self.data
+            )
+        )
+        with open('tests/output/gantt.svg') as fid:
+            self.assertEqual(len(parseString(fid.read())\
+                .getElementsByTagName('rect')),3)
+
+        results = []
+        def render():
+            results.append(
+                e.render(self.schedule_timed,self.store,**self.data)
+            )
+        threads = [Thread(target=render) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(results)),1)
+
+    @unittest.skipIf(find_executable('dot') is None,"graphviz not installed")
     def test_graph_svg(self):
         GraphSVGExporter().export(
             self.graph,
@@ -110,6 +267,51 @@ class TestExporter(unittest.TestCase):
             **self.data
         )
 
+    def test_graph_dot(self):
+        dot = GraphSVGExporter().render_dot(self.graph,self.store)
+        self.assertTrue(dot.startswith('digraph {'))
+        self.assertTrue(u'"s_a" [label="First"];' in dot)
+        self.assertTrue(u'"s_a" -> "s_b";' in dot)
+        self.assertFalse(u'"o_pa"' in dot)
+
+        dot = GraphSVGExporter(with_objects=True,with_resources=True)\
+            .render_dot(self.graph,self.store)
+        self.assertTrue(u'"o_pa" [label="Part A",shape="rectangle"];' in dot)
+        self.assertTrue(u'"r_imb2" -> "o_pa";' in dot)
+        self.assertTrue(u'"r_fb" -> "s_b" [color="orange"];' in dot)
+
+    def test_reduced_dot(self):
+        graph = Graph(graph_id="foobar",steps=[
+            dict(step_id='a'),
+            dict(step_id='b',requires=['a']),
+            dict(step_id='c',requires=['a','b'])
+        ])
+        dot = GraphSVGExporter().render_dot(graph,self.store)
+        self.assertTrue(u'"s_a" -> "s_c";' in dot)
+        dot = GraphSVGExporter(reduced=True).render_dot(graph,self.store)
+        self.assertFalse(u'"s_a" -> "s_c";' in dot)
+        self.assertTrue(u'"s_b" -> "s_c";' in dot)
+
+        dot = GraphSVGExporter(targets=['b']).render_dot(graph,self.store)
+        self.assertTrue(u'"s_a" -> "s_b";' in dot)
+        self.assertFalse(u'"s_c"' in dot)
+
+    def test_missing_dot(self):
+        if find_executable('dot') is not None:
+            return
+        self.assertRaises(
+            RuntimeError,
+            lambda: GraphSVGExporter().render(self.graph,self.store,**self.data)
+        )
+
+    def test_schedule_dot(self):
+        dot = ScheduleSVGExporter(with_resources=True)\
+            .render_dot(self.schedule,self.store)
+        self.assertEqual(dot.count(u'"s_1" -> "s_2";'),1)
+        self.assertTrue(u'"s_3" [label="Third"];' in dot)
+        self.assertTrue(u'"r_imb" [label="imb",shape="diamond"];' in dot)
+
+    @unittest.skipIf(find_executable('dot') is None,"graphviz not installed")
     def test_schedule_svg(self):
         ScheduleSVGExporter().export(
             self.schedule,
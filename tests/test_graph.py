@@ -25,6 +25,8 @@ import manuallabour.core.common as common
 from manuallabour.core.stores import LocalMemoryStore
 from manuallabour.core.graph import *
 
+from manuallabour.core.schedule import schedule_topological, schedule_greedy
+
 from test_schedule import schedule_example
 
 
@@ -40,12 +42,68 @@ class TestGraph(unittest.TestCase):
         self.assertEqual(g.children['xyz'],['yzx'])
         self.assertEqual(g.parents['yzx'],['xyz'])
 
+    def test_intern_ids(self):
+        g = Graph(graph_id="foobar",steps=[
+            dict(step_id=''.join(['x','y','z'])),
+            dict(step_id='yzx',requires=[''.join(['x','y','z'])])
+        ])
+        self.assertTrue(g.parents['yzx'][0] is g.steps[0].step_id)
+
     def test_ancestors(self):
         g = Graph(graph_id="foobar",steps=self.steps)
 
         self.assertEqual(g.all_ancestors('xyz'),set([]))
         self.assertEqual(g.all_ancestors('yzx'),set(['xyz']))
 
+    def test_subgraph(self):
+        g = Graph(graph_id="foobar",steps=[
+            dict(step_id='a'),
+            dict(step_id='b',requires=['a']),
+            dict(step_id='c',requires=['a']),
+            dict(step_id='d',requires=['b','c']),
+            dict(step_id='e',requires=['b'])
+        ])
+        self.assertTrue(g.subgraph(None) is g)
+
+        sub = g.subgraph(['d'])
+        self.assertTrue(sub is g.subgraph(set(['d'])))
+        self.assertEqual([ref.step_id for ref in sub.steps],['a','b','c','d'])
+        self.assertTrue(sub.steps[1] is g.steps[1])
+        self.assertEqual(sub.children['b'],['d'])
+        self.assertEqual(sub.parents['d'],['b','c'])
+        self.assertEqual(len(sub.as_dict()["steps"]),4)
+        self.assertEqual(sub.graph_id,Graph.calculate_checksum(
+            steps=[dict(step_id='a'),dict(step_id='b',requires=['a']),
+                   dict(step_id='c',requires=['a']),
+                   dict(step_id='d',requires=['b','c'])]
+        ))
+        self.assertEqual(sub.as_dict()["graph_id"],sub.graph_id)
+        self.assertNotEqual(g.subgraph(['e']).graph_id,sub.graph_id)
+        named = g.subgraph(['d'],'sub')
+        self.assertEqual(named.graph_id,'sub')
+        self.assertEqual(named.as_dict()["steps"],sub.as_dict()["steps"])
+
+        #subgraphs can be stored along with the graph
+        store = LocalMemoryStore()
+        store.add_graph(g)
+        store.add_graph(sub)
+        self.assertTrue(store.get_graph(sub.graph_id) is sub)
+        self.assertEqual(sub.topological_sort()[-1],'d')
+
+        self.assertEqual(g.closure(['e','c']),frozenset(['a','b','c','e']))
+        self.assertEqual(sorted(g.all_ancestors('d')),['a','b','c'])
+        self.assertRaises(KeyError,lambda: g.subgraph(['x']))
+
+    def test_ancestors_ladder(self):
+        #the number of paths doubles with each rung
+        steps = [dict(step_id='l0'),dict(step_id='r0')]
+        for i in range(1,100):
+            requires = ['l%d' % (i-1),'r%d' % (i-1)]
+            steps.append(dict(step_id='l%d' % i,requires=requires))
+            steps.append(dict(step_id='r%d' % i,requires=requires))
+        g = Graph(graph_id="ladder",steps=steps)
+        self.assertEqual(len(g.all_ancestors('l99')),198)
+
     def test_collect_ids(self):
         store = LocalMemoryStore()
 
@@ -65,3 +123,131 @@ class TestGraph(unittest.TestCase):
         self.assertEqual(res["step_ids"],set(["a","b","c","d"]))
         self.assertEqual(res["obj_ids"],set(["ta","pa","ra"]))
         self.assertEqual(res["blob_ids"],set(["imb","fb","imb2","rwth"]))
+
+def timed_example(store):
+    """
+    Diamond shaped graph with a waiting time on the short branch
+    """
+    for step_id,minutes,waiting in [
+            ('a',10,0),('b',30,0),('c',5,10),('d',10,0)]:
+        store.add_step(common.Step(
+            step_id=step_id,
+            title=step_id,
+            description='',
+            duration=dict(minutes=minutes),
+            waiting=dict(minutes=waiting)
+        ))
+    return Graph(graph_id="diamond",steps=[
+        dict(step_id='a'),
+        dict(step_id='b',requires=['a']),
+        dict(step_id='c',requires=['a']),
+        dict(step_id='d',requires=['b','c'])
+    ])
+
+class TestCriticalPath(unittest.TestCase):
+    def test_topological(self):
+        g = Graph(graph_id="foobar",steps=[
+            dict(step_id='c',requires=['b']),
+            dict(step_id='a'),
+            dict(step_id='b',requires=['a']),
+            dict(step_id='d',requires=['a'])
+        ])
+        self.assertEqual(g.topological_sort(),['a','b','d','c'])
+
+        g = Graph(graph_id="foobar",steps=[
+            dict(step_id='a',requires=['b']),
+            dict(step_id='b',requires=['a'])
+        ])
+        self.assertRaises(ValueError,lambda: g.topological_sort())
+
+    def test_critical_path(self):
+        store = LocalMemoryStore()
+        g = timed_example(store)
+
+        res = g.critical_path(store)
+        self.assertEqual(res["makespan"],50*60)
+        self.assertEqual(res["path"],['a','b','d'])
+        self.assertEqual(res["earliest"]['d'],40*60)
+        self.assertEqual(res["latest"]['c'],25*60)
+        self.assertEqual(res["slack"]['c'],15*60)
+        self.assertEqual(res["slack"]['b'],0)
+        self.assertEqual(res["tail"]['a'],50*60)
+
+    def test_untimed(self):
+        store = LocalMemoryStore()
+        schedule_example(store)
+        g = Graph(graph_id="foobar",steps=[
+            dict(step_id='a'),
+            dict(step_id='d',requires=['a'])
+        ])
+        self.assertRaises(ValueError,lambda: g.critical_path(store))
+
+class TestCheck(unittest.TestCase):
+    def test_valid(self):
+        store = LocalMemoryStore()
+        schedule_example(store)
+        g = Graph(graph_id="foobar",steps=[
+            dict(step_id='a'),
+            dict(step_id='b',requires=['a']),
+            dict(step_id='c',requires=['b'])
+        ])
+        res = g.check(store)
+        for key,val in res.iteritems():
+            self.assertEqual(val,[],key)
+
+    def test_problems(self):
+        store = LocalMemoryStore()
+        schedule_example(store)
+        g = Graph(graph_id="foobar",steps=[
+            dict(step_id='a',requires=['c']),
+            dict(step_id='b',requires=['a']),
+            dict(step_id='c',requires=['b']),
+            dict(step_id='d',requires=['x']),
+            dict(step_id='e'),
+            dict(step_id='f'),
+            dict(step_id='f'),
+        ])
+        res = g.check(store)
+        self.assertEqual(len(res["cycles"]),1)
+        cycle = res["cycles"][0]
+        self.assertEqual(cycle[0],cycle[-1])
+        self.assertEqual(set(cycle),set(['a','b','c']))
+        self.assertEqual(res["dangling"],[('d','x')])
+        self.assertEqual(res["duplicates"],['f'])
+        self.assertEqual(res["orphans"],['e','f','f'])
+        self.assertEqual(res["missing_steps"],['e','f'])
+
+        res = g.check(targets=['d'])
+        self.assertEqual(res["cycles"],[])
+        self.assertEqual(res["unreachable"],['a','b','c','e','f','f'])
+
+    def test_schedulers(self):
+        store = LocalMemoryStore()
+        schedule_example(store)
+        g = Graph(graph_id="foobar",steps=[
+            dict(step_id='a',requires=['b']),
+            dict(step_id='b',requires=['a'])
+        ])
+        self.assertRaises(ValueError,lambda: schedule_topological(g,store))
+        g = Graph(graph_id="foobar",steps=[dict(step_id='a',requires=['x'])])
+        self.assertRaises(ValueError,lambda: schedule_greedy(g,store))
+
+class TestReduction(unittest.TestCase):
+    def test_reduction(self):
+        g = Graph(graph_id="foobar",steps=[
+            dict(step_id='a'),
+            dict(step_id='b',requires=['a']),
+            dict(step_id='c',requires=['a','b']),
+            dict(step_id='d',requires=['c','a','b','b']),
+            dict(step_id='e',requires=['a'])
+        ])
+        r = g.transitive_reduction()
+        self.assertEqual(r.parents['a'],[])
+        self.assertEqual(r.parents['b'],['a'])
+        self.assertEqual(r.parents['c'],['b'])
+        self.assertEqual(r.parents['d'],['c'])
+        self.assertEqual(r.parents['e'],['a'])
+        self.assertEqual(r.all_ancestors('d'),g.all_ancestors('d'))
+        self.assertEqual(r.graph_id,Graph.calculate_checksum(**r.as_dict()))
+
+        self.assertEqual(g.transitive_reduction('foo').graph_id,'foo')
@@ -0,0 +1,104 @@
+# Manual labour - a library for step-by-step instructions
+# Copyright (C) 2014 Johannes Reinhardt <jreinhardt@ist-dein-freund.de>
+#
+#  This library is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public
+#  License as published by the Free Software Foundation; either
+#  version 2.1 of the License, or any later version.
+#
+#  This library is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#  Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public
+#  License along with this library; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#  USA
+
+import unittest
+import json
+import pkg_resources
+from StringIO import StringIO
+
+import manuallabour.core.common as common
+import manuallabour.core.instrumentation as instrumentation
+from manuallabour.core.instrumentation import *
+from manuallabour.core.schedule import Schedule
+from manuallabour.core.stores import LocalMemoryStore
+from manuallabour.exporters.html import SinglePageHTMLExporter
+
+from test_schedule import schedule_example
+
+class TestInstrumentation(unittest.TestCase):
+    def tearDown(self):
+        disable()
+
+    def test_disabled(self):
+        self.assertTrue(get_sink() is None)
+        self.assertTrue(span("a") is span("b"))
+        with span("a"):
+            count("b")
+
+    def test_summary(self):
+        sink = SummarySink()
+        self.assertTrue(enable(sink) is None)
+        self.assertTrue(get_sink() is sink)
+
+        with span("phase"):
+            count("calls")
+        with span("phase"):
+            count("calls",2)
+
+        res = sink.summary()
+        self.assertEqual(res["spans"]["phase"]["calls"],2)
+        self.assertTrue(res["spans"]["phase"]["seconds"] >= 0)
+        self.assertEqual(res["counts"]["calls"],3)
+
+        self.assertTrue(disable() is sink)
+        count("calls")
+        self.assertEqual(sink.summary()["counts"]["calls"],3)
+
+    def test_json(self):
+        fid = StringIO()
+        enable(JSONSink(fid))
+        with span("phase"):
+            count("calls")
+        records = [json.loads(l) for l in fid.getvalue().splitlines()]
+        self.assertEqual(records[0],dict(type="count",name="calls",amount=1))
+        self.assertEqual(records[1]["type"],"span")
+        self.assertEqual(records[1]["name"],"phase")
+
+    def test_callback(self):
+        events = []
+        enable(CallbackSink(lambda *args: events.append(args)))
+        count("calls",4)
+        self.assertEqual(events,[("count","calls",4)])
+
+    def test_export(self):
+        store = LocalMemoryStore()
+        schedule_example(store)
+        schedule = Schedule(sched_id="foobar",steps=[
+            dict(step_id='a',step_idx=0),
+            dict(step_id='b',step_idx=1)
+        ])
+        layout_path = pkg_resources.resource_filename(
+            'manuallabour.layouts.html_single.basic',
+            'template')
+        exporter = SinglePageHTMLExporter(layout_path)
+
+        sink = SummarySink()
+        enable(sink)
+        common.Object(obj_id='x',name='Nut')
+        exporter.render(schedule,store,title="Title",author="John Doe")
+        res = sink.summary()
+
+        for phase in ["validate","bom","markup","jinja"]:
+            self.assertTrue("export." + phase in res["spans"])
+        self.assertEqual(
+            res["spans"]["validate"]["calls"],
+            res["counts"]["validate"]
+        )
+        self.assertTrue(res["counts"]["deepcopy"] > 0)
+        self.assertTrue(res["counts"]["store.get_step"] > 0)
+        self.assertTrue(res["counts"]["store.get_obj"] > 0)
@@ -225,6 +225,32 @@ class TestSchedulers(unittest.TestCase):
 
             Schedule(sched_id="boofar",steps=self.result_untimed)
 
+    def test_targets(self):
+        g = Graph(graph_id="foobar",steps=self.steps_timed)
+        for scheduler in [schedule_topological,schedule_greedy]:
+            res = scheduler(g,self.store,targets=['b'])
+            self.assertEqual([step["step_id"] for step in res],['a','b'])
+        res = schedule_parallel(g,self.store,targets=['a'])
+        self.assertEqual([step["step_id"] for step in res],['a'])
+        for scheduler in [schedule_topological,schedule_greedy]:
+            self.assertRaises(KeyError,
+                lambda: scheduler(g,self.store,targets=['x'])
+            )
+
+    def test_targets_unrelated_cycle(self):
+        g = Graph(graph_id="foobar",steps=[
+            dict(step_id='a'),
+            dict(step_id='b',requires=['a','c']),
+            dict(step_id='c',requires=['b'])
+        ])
+        for scheduler in [schedule_topological,schedule_greedy]:
+            res = scheduler(g,self.store,targets=['a'])
+            self.assertEqual([step["step_id"] for step in res],['a'])
+            self.assertRaises(ValueError,lambda: scheduler(g,self.store))
+            self.assertRaises(ValueError,
+                lambda: scheduler(g,self.store,targets=['c'])
+            )
+
     def test_greedy_timed(self):
         g = Graph(graph_id="foobar",steps=self.steps_timed)
         self.result_timed = schedule_greedy(g,self.store)
@@ -240,3 +266,200 @@ class TestSchedulers(unittest.TestCase):
     def test_topo_untimed(self):
         g = Graph(graph_id="foobar",steps=self.steps_untimed)
         self.result_untimed = schedule_topological(g,self.store)
+
+    def test_parallel(self):
+        g = Graph(graph_id="foobar",steps=[
+            dict(step_id='a'),
+            dict(step_id='b',requires=['a']),
+            dict(step_id='c',requires=['a'])
+        ])
+        result = schedule_parallel(g,self.store,workers=2)
+        Schedule(sched_id="boofar",steps=result)
+
+        ids = [step["step_id"] for step in result]
+        self.assertEqual(ids[0],'a')
+        self.assertEqual(set(ids[1:]),set(['b','c']))
+        self.assertEqual(result[1]["start"],dict(seconds=900))
+        self.assertEqual(result[2]["start"],dict(seconds=900))
+        self.assertNotEqual(result[1]["worker"],result[2]["worker"])
+
+        result = schedule_parallel(g,self.store,workers=1)
+        self.assertEqual(result[2]["stop"],dict(seconds=2700))
+        self.assertEqual(set(s["worker"] for s in result),set([0]))
+
+        result = schedule_parallel(g,self.store,targets=['b'])
+        self.assertEqual([s["step_id"] for s in result],['a','b'])
+
+        g = Graph(graph_id="foobar",steps=self.steps_untimed)
+        self.assertRaises(ValueError,lambda: schedule_parallel(g,self.store))
+
+    def test_tools(self):
+        store = LocalMemoryStore()
+        store.add_obj(common.Object(obj_id='ta',name='Tool A'))
+        for step_id in ['x','y','z']:
+            store.add_step(common.Step(
+                step_id=step_id,
+                title=step_id,
+                description='',
+                duration=dict(minutes=15),
+                tools={'a' : dict(obj_id='ta')}
+            ))
+        g = Graph(graph_id="foobar",steps=[
+            dict(step_id='x'),
+            dict(step_id='y'),
+            dict(step_id='z')
+        ])
+        result, report = schedule_tools(g,store,workers=3)
+        Schedule(sched_id="boofar",steps=result)
+        for s1,s2 in pairwise(result):
+            self.assertTrue(timedelta(**s1["stop"]) <= timedelta(**s2["start"]))
+        self.assertEqual(report['ta']["available"],1)
+        self.assertEqual(report['ta']["used"],1)
+        self.assertEqual(report['ta']["delays"],2)
+        self.assertEqual(report['ta']["seconds"],2700)
+
+        result, report = schedule_tools(g,store,dict(ta=2),workers=3)
+        self.assertEqual(result[-1]["stop"],dict(seconds=1800))
+        self.assertEqual(report['ta']["used"],2)
+
+        self.assertRaises(
+            ValueError,
+            lambda: schedule_tools(g,store,dict(ta=0))
+        )
+
+    def test_min_wip(self):
+        store = LocalMemoryStore()
+        for obj_id in ['r1','r2','r3','r4','A','B','F']:
+            store.add_obj(common.Object(obj_id=obj_id,name=obj_id))
+
+        def add_step(step_id,parts,result):
+            store.add_step(common.Step(
+                step_id=step_id,
+                title=step_id,
+                description='',
+                parts=dict((p,dict(obj_id=p)) for p in parts),
+                results={'r' : dict(obj_id=result,created=True)}
+            ))
+        add_step('l1',[],'r1')
+        add_step('l2',[],'r2')
+        add_step('l3',[],'r3')
+        add_step('l4',[],'r4')
+        add_step('s1',['r1','r2'],'A')
+        add_step('s2',['r3','r4'],'B')
+        add_step('f',['A','B'],'F')
+
+        g = Graph(graph_id="foobar",steps=[
+            dict(step_id='l1'),
+            dict(step_id='l3'),
+            dict(step_id='l2'),
+            dict(step_id='l4'),
+            dict(step_id='s1',requires=['l1','l2']),
+            dict(step_id='s2',requires=['l3','l4']),
+            dict(step_id='f',requires=['s1','s2'])
+        ])
+        result, profile = schedule_min_wip(g,store)
+        Schedule(sched_id="boofar",steps=result)
+        ids = [step["step_id"] for step in result]
+        self.assertEqual(ids,['l1','l2','s1','l3','l4','s2','f'])
+        self.assertEqual(profile,[1,2,1,2,3,2,0])
+
+        #timed steps are carried out one after another
+        g = Graph(graph_id="foobar",steps=self.steps_timed)
+        self.result_timed, _ = schedule_min_wip(g,self.store)
+
+    def test_optimal(self):
+        store = LocalMemoryStore()
+        for step_id,minutes,waiting in [
+                ('a',10,60),('b',20,0),('c',10,0),('d',5,0),('e',20,30)]:
+            store.add_step(common.Step(
+                step_id=step_id,
+                title=step_id,
+                description='',
+                duration=dict(minutes=minutes),
+                waiting=dict(minutes=waiting)
+            ))
+        g = Graph(graph_id="foobar",steps=[
+            dict(step_id='a'),
+            dict(step_id='b'),
+            dict(step_id='c',requires=['b']),
+            dict(step_id='d',requires=['b']),
+            dict(step_id='e',requires=['d'])
+        ])
+        #the heuristic needs 90 minutes
+        result = schedule_parallel(g,store,workers=1)
+        self.assertEqual(max(s["waiting"]["seconds"] for s in result),5400)
+
+        result, info = schedule_optimal(g,store)
+        Schedule(sched_id="boofar",steps=result)
+        self.assertTrue(info["optimal"])
+        self.assertEqual(info["makespan"],85*60)
+        for s1,s2 in pairwise(result):
+            self.assertTrue(timedelta(**s1["stop"]) <= timedelta(**s2["start"]))
+
+        result, info = schedule_optimal(g,store,max_nodes=0)
+        self.assertFalse(info["optimal"])
+        self.assertEqual(info["makespan"],90*60)
+        self.assertEqual(len(result),5)
+
+    def test_reschedule(self):
+        old_graph = Graph(graph_id="foobar",steps=self.steps_timed)
+        old = Schedule(
+            sched_id="foobar",
+            steps=schedule_greedy(old_graph,self.store)
+        )
+
+        #b is removed, so c now directly requires a
+        new_graph = Graph(graph_id="foobar",steps=[
+            dict(step_id='a'),
+            dict(step_id='c',requires=['a'])
+        ])
+        result, diff = reschedule(old,old_graph,new_graph,self.store)
+        Schedule(sched_id="boofar",steps=result)
+        self.assertEqual([s["step_id"] for s in result],['a','c'])
+        self.assertEqual(result[1]["step_idx"],1)
+        self.assertEqual(result[1]["start"],dict(seconds=900))
+        self.assertEqual(diff["kept"],1)
+        self.assertEqual(diff["removed"],['b'])
+        self.assertEqual(diff["added"],[])
+        self.assertEqual(diff["rescheduled"],['c'])
+
+        #nothing changed
+        result, diff = reschedule(old,old_graph,old_graph,self.store)
+        self.assertEqual(diff["kept"],3)
+        self.assertEqual(result[2]["stop"],dict(seconds=2700))
+
+    def test_reschedule_workers(self):
+        old_graph = Graph(graph_id="foobar",steps=[
+            dict(step_id='a'),
+            dict(step_id='b',requires=['a']),
+            dict(step_id='c',requires=['a'])
+        ])
+        old = Schedule(sched_id="foobar",steps=[
+            dict(step_id='a',step_idx=0,worker=0,
+                 start=dict(),stop=dict(minutes=15)),
+            dict(step_id='b',step_idx=1,worker=1,
+                 start=dict(minutes=15),stop=dict(minutes=30)),
+            dict(step_id='c',step_idx=2,worker=0,
+                 start=dict(minutes=15),stop=dict(minutes=30))
+        ])
+
+        #c now also requires b
+        new_graph = Graph(graph_id="foobar",steps=[
+            dict(step_id='a'),
+            dict(step_id='b',requires=['a']),
+            dict(step_id='c',requires=['a','b'])
+        ])
+        graphs = []
+        def scheduler(graph,store):
+            graphs.append(graph)
+            return schedule_parallel(graph,store)
+        result, diff = reschedule(old,old_graph,new_graph,self.store,
+                                  scheduler)
+        Schedule(sched_id="boofar",steps=result)
+        self.assertEqual(diff["kept"],2)
+        self.assertEqual([s["worker"] for s in result],[0,1,0])
+        self.assertEqual(result[2]["start"],dict(seconds=1800))
+
+        #the re-planned steps form a graph of their own
+        self.assertEqual([ref.step_id for ref in graphs[0].steps],['c'])
+        self.assertNotEqual(graphs[0].graph_id,new_graph.graph_id)
@@ -0,0 +1,102 @@
+# Manual labour - a library for step-by-step instructions
+# Copyright (C) 2014 Johannes Reinhardt <jreinhardt@ist-dein-freund.de>
+#
+#  This library is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public
+#  License as published by the Free Software Foundation; either
+#  version 2.1 of the License, or any later version.
+#
+#  This library is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#  Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public
+#  License along with this library; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#  USA
+
+import unittest
+from StringIO import StringIO
+
+import manuallabour.core.common as common
+from manuallabour.core.stores import LocalMemoryStore
+from manuallabour.core.serialize import dump_store, load_store
+from manuallabour.core.search import *
+
+def search_example(store):
+    store.add_obj(common.Object(obj_id='nut',name='Hex Nut'))
+    store.add_obj(common.Object(
+        obj_id='wrench',
+        name='Wrench',
+        description='Wrench for hex nuts'
+    ))
+    store.add_step(common.Step(
+        step_id='a',
+        title='Tighten the nut',
+        description='Tighten {{part(nut)}} with the wrench',
+        attention='Do not overtighten',
+        parts={'nut' : dict(obj_id='nut')}
+    ))
+    store.add_step(common.Step(
+        step_id='b',
+        title='Paint the housing',
+        description='Paint it red',
+        assertions=['The paint is dry']
+    ))
+
+class TestSearch(unittest.TestCase):
+    def setUp(self):
+        self.store = LocalMemoryStore(search_index=SearchIndex())
+        search_example(self.store)
+        self.index = self.store.search_index
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize(u'Tighten {{part(nut)}}, gently!'),
+            [u'tighten',u'gently'])
+
+    def test_terms(self):
+        self.assertEqual(self.index.terms('t'),['the','tighten'])
+        self.assertEqual(self.index.terms('Hex'),['hex'])
+        self.assertEqual(self.index.terms('x'),[])
+
+    def test_search(self):
+        res = self.index.search('wrench')
+        self.assertEqual([(k,d) for k,d,_ in res],[('obj','wrench'),('step','a')])
+        self.assertTrue(res[0][2] > res[1][2])
+
+        self.assertEqual(self.index.search('wrench',kind='step')[0][1],'a')
+        self.assertEqual(self.index.search('wrench',limit=1)[0][1],'wrench')
+
+        #all words must match
+        self.assertEqual(self.index.search('the nut')[0][:2],('step','a'))
+        self.assertEqual(self.index.search('paint nut'),[])
+        self.assertEqual(self.index.search('unknown'),[])
+        self.assertEqual(self.index.search(''),[])
+
+        #assertions and attention are indexed
+        self.assertEqual(self.index.search('dry')[0][1],'b')
+        self.assertEqual(self.index.search('overtighten')[0][1],'a')
+
+        #prefix search
+        self.assertEqual(self.index.search('pain'),[])
+        self.assertEqual(self.index.search('pain',prefix=True)[0][1],'b')
+        self.assertEqual(
+            sorted(d for _,d,_ in self.index.search('nut',prefix=True)),
+            ['a','nut','wrench']
+        )
+
+    def test_persistence(self):
+        fid = StringIO()
+        dump_store(self.store,fid)
+        res = load_store(StringIO(fid.getvalue()))
+        self.assertEqual(res.search_index.search('nut',prefix=True),
+            self.index.search('nut',prefix=True))
+        self.assertRaises(KeyError,
+            lambda: res.search_index.add_step(self.store.get_step('a'))
+        )
+
+        #given stores keep their index
+        store = LocalMemoryStore(search_index=SearchIndex())
+        load_store(StringIO(fid.getvalue()),store)
+        self.assertEqual(store.search_index.search('dry')[0][1],'b')
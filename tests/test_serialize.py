@@ -0,0 +1,154 @@
+# Manual labour - a library for step-by-step instructions
+# Copyright (C) 2014 Johannes Reinhardt <jreinhardt@ist-dein-freund.de>
+#
+#  This library is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public
+#  License as published by the Free Software Foundation; either
+#  version 2.1 of the License, or any later version.
+#
+#  This library is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#  Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public
+#  License along with this library; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#  USA
+
+import unittest
+import json
+from StringIO import StringIO
+
+from jsonschema import ValidationError
+
+import manuallabour.core.common as common
+from manuallabour.core.stores import LocalMemoryStore
+from manuallabour.core.graph import Graph
+from manuallabour.core.schedule import Schedule
+from manuallabour.core.instrumentation import SummarySink, enable, disable
+from manuallabour.core.serialize import *
+
+from test_schedule import schedule_example
+
+class TestSerialize(unittest.TestCase):
+    def tearDown(self):
+        disable()
+
+    def test_values(self):
+        value = dict(
+            a=[1,-2,2**40,0.5,None,True,False],
+            b=u'B\xe4r',
+            c=[u'a',u'a',u'a'],
+            d={}
+        )
+        self.assertEqual(loads(dumps(value)),value)
+
+        #repeated strings are only stored once
+        small = dumps([u'abcdef'])
+        large = dumps([u'abcdef']*10)
+        self.assertTrue(len(large) - len(small) < 9*len(u'abcdef'))
+
+        self.assertRaises(ValueError,lambda: dumps(set()))
+
+    def test_corrupted(self):
+        data = dumps(dict(a=[1,2,3]))
+        self.assertRaises(ValueError,lambda: loads(data[:-1] + 'x'))
+        self.assertRaises(ValueError,lambda: loads(data[:10] + 'x' + data[11:]))
+        self.assertRaises(ValueError,lambda: loads('garbage'))
+
+    def test_components(self):
+        components = [
+            common.Object(obj_id='ta',name='Tool A'),
+            common.Step(
+                step_id='a',
+                title="First",
+                description="Whack",
+                duration=dict(minutes=15),
+                tools={'a' : dict(obj_id='ta')}
+            ),
+            Graph(graph_id='g',steps=[
+                dict(step_id='a'),
+                dict(step_id='b',requires=['a'])
+            ]),
+            Schedule(sched_id='s',steps=[
+                dict(step_id='a',step_idx=0),
+                dict(step_id='b',step_idx=1)
+            ])
+        ]
+        for component in components:
+            for trusted in [False,True]:
+                res = load_component(dump_component(component),trusted)
+                self.assertEqual(type(res),type(component))
+                self.assertEqual(res.as_dict(),component.as_dict())
+
+    def test_store(self):
+        store = LocalMemoryStore()
+        schedule_example(store)
+        graph = Graph(graph_id='g',steps=[dict(step_id='a')])
+        store.add_graph(graph)
+
+        fid = StringIO()
+        dump_store(store,fid)
+        data = fid.getvalue()
+
+        res = load_store(StringIO(data))
+        self.assertEqual(res.paths,store.paths)
+        for step_id,step in store.iter_step():
+            self.assertEqual(res.get_step(step_id).as_dict(),step.as_dict())
+        for obj_id,obj in store.iter_obj():
+            self.assertEqual(res.get_obj(obj_id).as_dict(),obj.as_dict())
+        self.assertEqual(res.get_graph('g').as_dict(),graph.as_dict())
+        self.assertEqual(res.graphs_using_step('a'),['g'])
+        self.assertEqual(res.steps_using_obj('ta'),store.steps_using_obj('ta'))
+
+        #smaller than the JSON representation
+        steps = [step.as_dict() for _,step in store.iter_step()]
+        self.assertTrue(len(dumps(steps)) < len(json.dumps(steps)))
+
+    def test_trusted(self):
+        store = LocalMemoryStore()
+        schedule_example(store)
+        fid = StringIO()
+        dump_store(store,fid)
+
+        sink = SummarySink()
+        enable(sink)
+        load_store(StringIO(fid.getvalue()))
+        self.assertTrue(sink.summary()["counts"]["validate"] > 0)
+
+        sink = SummarySink()
+        enable(sink)
+        load_store(StringIO(fid.getvalue()),trusted=True)
+        self.assertFalse("validate" in sink.summary()["counts"])
+
+        #validation is active again afterwards
+        self.assertRaises(ValidationError,
+            lambda: common.Object(obj_id='a',name=3)
+        )
+
+    def test_untrusted_marker(self):
+        #data from dumps is validated even if it is trusted
+        data = dumps(['Step',dict(
+            step_id='x',
+            title=5,
+            description=3,
+            duration=dict(seconds='abc')
+        )])
+        for trusted in [False,True]:
+            self.assertRaises(ValidationError,
+                lambda: load_component(data,trusted)
+            )
+
+        fid = StringIO(dumps(dict(
+            blobs={},
+            objects=[['Object',dict(obj_id='a',name=3)]],
+            steps=[]
+        )))
+        self.assertRaises(ValidationError,
+            lambda: load_store(fid,trusted=True)
+        )
+
+        #both kinds of documents can be read with loads
+        obj = common.Object(obj_id='a',name='Nut')
+        self.assertEqual(loads(dump_component(obj)),['Object',obj.as_dict()])
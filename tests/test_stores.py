@@ -20,7 +20,15 @@ import unittest
 from urllib import urlopen
 
 import manuallabour.core.common as common
+from manuallabour.core.graph import Graph
 from manuallabour.core.stores import *
+from manuallabour.exporters.common import MarkupBase
+
+class MockMarkup(MarkupBase):
+    calls = 0
+    def part(self,obj,text):
+        MockMarkup.calls += 1
+        return obj["name"]
 
 class TestStores(unittest.TestCase):
     def test_localmemory(self):
@@ -66,3 +74,97 @@ class TestStores(unittest.TestCase):
                 (common.Object(obj_id='a',name="Smaller Nut"))
             )
         )
+
+    def test_graphs(self):
+        store = LocalMemoryStore()
+        graph = Graph(graph_id='g',steps=[dict(step_id='a')])
+
+        self.assertFalse(store.has_graph('g'))
+        store.add_graph(graph)
+        self.assertTrue(store.has_graph('g'))
+        self.assertEqual(store.get_graph('g'),graph)
+        self.assertEqual(list(store.iter_graph()),[('g',graph)])
+        self.assertRaises(KeyError,lambda: store.add_graph(graph))
+
+    def test_reverse_index(self):
+        store = LocalMemoryStore()
+        store.add_obj(common.Object(
+            obj_id='a',
+            name="Nut",
+            images=[dict(
+                blob_id='img',
+                extension='.png',
+                alt='Nut',
+                sourcefiles=[dict(blob_id='src',filename='nut.fcstd')]
+            )]
+        ))
+        store.add_obj(common.Object(obj_id='b',name="Wrench"))
+        store.add_step(common.Step(
+            step_id='s',
+            title='Tighten',
+            description='Tighten {{part(nut)}}',
+            parts={'nut' : dict(obj_id='a')},
+            tools={'wrench' : dict(obj_id='b')},
+            files={'f' : dict(blob_id='src',filename='nut.fcstd')}
+        ))
+        store.add_step(common.Step(
+            step_id='t',
+            title='Loosen',
+            description='Loosen {{part(nut)}}',
+            parts={'nut' : dict(obj_id='a')},
+            images={'i' : dict(blob_id='img',extension='.png',alt='Nut')}
+        ))
+        store.add_graph(Graph(graph_id='g',steps=[
+            dict(step_id='s'),
+            dict(step_id='t',requires=['s'])
+        ]))
+        store.add_graph(Graph(graph_id='h',steps=[dict(step_id='t')]))
+
+        self.assertEqual(sorted(store.steps_using_obj('a')),['s','t'])
+        self.assertEqual(store.steps_using_obj('b'),['s'])
+        self.assertEqual(store.steps_using_obj('c'),[])
+        self.assertEqual(store.objs_using_blob('img'),['a'])
+        self.assertEqual(store.objs_using_blob('src'),['a'])
+        self.assertEqual(store.steps_using_blob('img'),['t'])
+        self.assertEqual(store.steps_using_blob('src'),['s'])
+        self.assertEqual(store.graphs_using_step('s'),['g'])
+        self.assertEqual(sorted(store.graphs_using_step('t')),['g','h'])
+
+        cache = CachingStore(store)
+        self.assertEqual(sorted(cache.graphs_using_step('t')),['g','h'])
+        self.assertEqual(cache.get_graph('h').graph_id,'h')
+
+    def test_caching(self):
+        store = LocalMemoryStore()
+        store.add_obj(common.Object(obj_id='a',name="Nut"))
+        store.add_step(common.Step(
+            step_id='s',
+            title='Tighten',
+            description='Tighten {{part(nut)}}',
+            parts={'nut' : dict(obj_id='a')}
+        ))
+        cache = CachingStore(store)
+
+        self.assertTrue(cache.has_obj('a'))
+        self.assertFalse(cache.has_step('t'))
+        self.assertEqual(cache.get_obj('a').name,'Nut')
+
+        step = cache.get_step('s')
+        self.assertTrue(step is cache.get_step('s'))
+        step_dict = step.dereference(cache)
+        self.assertTrue(step_dict is step.dereference(cache))
+        self.assertEqual(step_dict["parts"]["nut"]["name"],"Nut")
+        self.assertEqual(len(list(cache.iter_step())),1)
+
+        #dereferencing against another store is not mixed up
+        other = LocalMemoryStore()
+        other.add_obj(common.Object(obj_id='a',name="Bolt"))
+        other_dict = step.dereference(other)
+        self.assertEqual(other_dict["parts"]["nut"]["name"],"Bolt")
+        self.assertEqual(step_dict["parts"]["nut"]["name"],"Nut")
+
+        markup = MockMarkup()
+        res = cache.markup_step('s',markup)
+        self.assertEqual(res["description"],'Tighten Nut')
+        self.assertTrue(res is cache.markup_step('s',MockMarkup()))
+        self.assertEqual(markup.calls,1)
@@ -0,0 +1,73 @@
+# Manual labour - a library for step-by-step instructions
+# Copyright (C) 2014 Johannes Reinhardt <jreinhardt@ist-dein-freund.de>
+#
+#  This library is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public
+#  License as published by the Free Software Foundation; either
+#  version 2.1 of the License, or any later version.
+#
+#  This library is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#  Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public
+#  License along with this library; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301
+#  USA
+
+import unittest
+
+import manuallabour.core.timing as timing
+from manuallabour.core.schedule import Schedule
+
+class TestTiming(unittest.TestCase):
+    def setUp(self):
+        self.schedule = Schedule(sched_id='s',steps=[
+            dict(step_id='a',step_idx=0,
+                start=dict(),stop=dict(seconds=10),waiting=dict(seconds=15)),
+            dict(step_id='b',step_idx=1,
+                start=dict(seconds=5),stop=dict(seconds=12)),
+            dict(step_id='c',step_idx=2,
+                start=dict(seconds=20),stop=dict(minutes=1,seconds=-30))
+        ])
+        self.numpy = timing.numpy
+
+    def tearDown(self):
+        timing.numpy = self.numpy
+
+    def check(self,times):
+        self.assertEqual(len(times),3)
+        self.assertEqual(list(times.start),[0,5,20])
+        self.assertEqual(list(times.stop),[10,12,30])
+        self.assertEqual(list(times.waiting),[15,12,30])
+        self.assertEqual(list(times.step_idx),[0,1,2])
+        self.assertEqual(times.makespan(),30)
+        self.assertEqual(times.idle(),8)
+        self.assertEqual(list(times.concurrency([0,5,11,12,25,30])),
+            [1,2,1,0,1,0])
+        self.assertEqual(list(times.overlaps()),[1,2,1])
+        self.assertEqual(list(times.binned(10)),[15,2,10])
+        self.assertEqual(list(times.binned(25)),[22,5])
+
+    def test_timing(self):
+        times = self.schedule.timing()
+        self.assertTrue(times is self.schedule.timing())
+        self.check(times)
+
+    @unittest.skipIf(timing.numpy is None,"numpy not installed")
+    def test_numpy(self):
+        self.assertTrue(isinstance(self.schedule.timing().start,
+            timing.numpy.ndarray))
+
+    def test_fallback(self):
+        timing.numpy = None
+        times = timing.ScheduleTimes(self.schedule.as_dict()["steps"])
+        self.assertFalse(hasattr(times.start,"shape"))
+        self.check(times)
+
+    def test_untimed(self):
+        schedule = Schedule(sched_id='s',steps=[dict(step_id='a',step_idx=0)])
+        self.assertRaises(ValueError,schedule.timing)
+        self.assertEqual(timing.ScheduleTimes([]).makespan(),0)
+        self.assertEqual(timing.ScheduleTimes([]).idle(),0)